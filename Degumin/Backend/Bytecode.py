@@ -0,0 +1,786 @@
+"""
+Lowers the definitions of a module in Core to bytecode.
+
+A `Program` is a list of `Function`s, each with its code in an
+`array("i")` of pairs: an opcode and its operand. The code runs on the
+stack machine of `Degumin.Backend.Machine`, a function keeps its
+arguments, `let` definitions and pattern variables in numbered local
+slots and reads the variables of the functions around it from the
+values its closure captured when it was built (flat closures), so a
+variable is found without walking an environment.
+
+Types aren't kept: a `forall`, a universe or the name of a data type is
+an erased value. A constructor applied to all its arguments builds the
+value directly, and a `case` is compiled from its decision tree (see
+`Degumin.Core.CaseTree`): a switch on constructors jumps through a
+table indexed by the constructor, a switch on literals through a
+dictionary. A call in tail position replaces the frame of the caller.
+
+A definition of the module is computed the first time it is used, by a
+function without arguments that stores its value.
+
+`Program.to_bytes` gives the content of the files written to the output
+of a compilation, `Program.from_bytes` reads it back.
+"""
+from __future__ import annotations
+
+import sys
+from array import array
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+from Degumin.Common.Error import DeguminError
+from Degumin.Core.CaseTree import (
+    CaseCompiler,
+    CaseTree,
+    ConstructorSwitch,
+    Fail,
+    Leaf,
+    LiteralSwitch,
+    Occurrence,
+    Signature,
+    Tree,
+)
+from Degumin.Core.Core import (
+    Abstraction,
+    Alternative,
+    Annotation,
+    Application,
+    Case,
+    Constructor,
+    Forall,
+    FreeVariable,
+    Identifier,
+    IntValue,
+    Let,
+    MatchConstructor,
+    Term,
+    Universe,
+    Variable,
+    VariableDefinition,
+)
+from Degumin.Core.Evaluation import Environment, binder_name
+
+# Opcodes
+LOCAL = 0  # push the local slot
+CAPTURED = 1  # push the captured value
+CALL = 2  # apply the function under the operand arguments to them
+TAIL_CALL = 3  # like CALL, replacing the frame
+RETURN = 4
+STORE = 5  # pop into the local slot
+FIELD = 6  # replace a constructor value by its argument
+SWITCH = 7  # pop a constructor value and jump through a table
+LITERAL_SWITCH = 8  # pop a literal and jump through a table
+DATA = 9  # build a value of the constructor from its arguments
+GLOBAL = 10  # push the value of a definition, computing it once
+CONSTANT = 11
+CLOSURE = 12  # build a closure of the function
+ERASED = 13  # push a type
+JUMP = 14
+FAIL = 15  # no alternative matches
+SET_GLOBAL = 16  # store the top of the stack as the definition
+RECAPTURE = 17  # capture again the values of the closure in the slot
+
+opcode_names = [
+    "LOCAL",
+    "CAPTURED",
+    "CALL",
+    "TAIL_CALL",
+    "RETURN",
+    "STORE",
+    "FIELD",
+    "SWITCH",
+    "LITERAL_SWITCH",
+    "DATA",
+    "GLOBAL",
+    "CONSTANT",
+    "CLOSURE",
+    "ERASED",
+    "JUMP",
+    "FAIL",
+    "SET_GLOBAL",
+    "RECAPTURE",
+]
+
+
+@dataclass
+class Function:
+    name: Identifier
+    arity: int
+    # Number of local slots, the arguments are the first ones
+    size: int
+    # Where a closure of it takes every captured value: a local slot `n`
+    # of the function building it is `2 * n`, a captured value `n` of it
+    # is `2 * n + 1`.
+    captures: list[int]
+    code: array
+
+
+@dataclass
+class JumpTable:
+    # The targets of a switch on constructors, by constructor number
+    # from `base`, or of a switch on literals by literal
+    base: int
+    targets: list[int]
+    literals: dict[int, int]
+    # -1 fails
+    default: int
+
+
+@dataclass
+class Definition:
+    name: Identifier
+    # Computes its value, without arguments
+    function: int
+
+
+@dataclass
+class Program:
+    # The constructors with their arity, numbered in the order of their
+    # data types and of their declaration
+    constructors: list[tuple[Identifier, int]] = field(default_factory=list)
+    functions: list[Function] = field(default_factory=list)
+    definitions: list[Definition] = field(default_factory=list)
+    constants: list[int] = field(default_factory=list)
+    tables: list[JumpTable] = field(default_factory=list)
+
+    def definition(self, name: Identifier) -> Optional[int]:
+        for i, definition in enumerate(self.definitions):
+            if definition.name == name:
+                return i
+        return None
+
+    def to_bytes(self) -> bytes:
+        writer = Writer()
+        writer.write(magic)
+        writer.integers([len(self.constructors)])
+        for name, arity in self.constructors:
+            writer.string(name)
+            writer.integers([arity])
+        writer.integers([len(self.functions)])
+        for function in self.functions:
+            writer.string(function.name)
+            writer.integers([function.arity, function.size])
+            writer.integers(function.captures, True)
+            writer.integers(function.code, True)
+        writer.integers([len(self.definitions)])
+        for definition in self.definitions:
+            writer.string(definition.name)
+            writer.integers([definition.function])
+        # Literals have no size limit
+        writer.integers([len(self.constants)])
+        for constant in self.constants:
+            writer.string(str(constant))
+        writer.integers([len(self.tables)])
+        for table in self.tables:
+            writer.integers([table.base, table.default])
+            writer.integers(table.targets, True)
+            writer.integers([len(table.literals)])
+            for literal, target in table.literals.items():
+                writer.string(str(literal))
+                writer.integers([target])
+        return writer.getvalue()
+
+    @staticmethod
+    def from_bytes(data: bytes) -> Program:
+        reader = Reader(data)
+        if reader.read(len(magic)) != magic:
+            raise ValueError("not a Degumin bytecode file")
+        program = Program()
+        for _ in range(reader.integer()):
+            name = reader.string()
+            program.constructors.append((name, reader.integer()))
+        for _ in range(reader.integer()):
+            name = reader.string()
+            arity, size = reader.integers(2)
+            captures = list(reader.integers())
+            program.functions.append(
+                Function(name, arity, size, captures, reader.integers())
+            )
+        for _ in range(reader.integer()):
+            name = reader.string()
+            program.definitions.append(Definition(name, reader.integer()))
+        for _ in range(reader.integer()):
+            program.constants.append(int(reader.string()))
+        for _ in range(reader.integer()):
+            base, default = reader.integers(2)
+            targets = list(reader.integers())
+            literals = {}
+            for _ in range(reader.integer()):
+                literal = int(reader.string())
+                literals[literal] = reader.integer()
+            program.tables.append(JumpTable(base, targets, literals, default))
+        return program
+
+
+magic = b"DGMB\x01"
+
+
+class Writer:
+    """
+    Integers are written as 32 bits little endian ones.
+    """
+
+    def __init__(self) -> None:
+        self.parts: list[bytes] = []
+
+    def write(self, data: bytes) -> None:
+        self.parts.append(data)
+
+    def integers(self, values: Iterable[int], sized: bool = False) -> None:
+        values = array("i", values)
+        if sized:
+            self.integers([len(values)])
+        if sys.byteorder == "big":
+            values.byteswap()
+        self.parts.append(values.tobytes())
+
+    def string(self, value: str) -> None:
+        data = value.encode("utf-8")
+        self.integers([len(data)])
+        self.parts.append(data)
+
+    def getvalue(self) -> bytes:
+        return b"".join(self.parts)
+
+
+class Reader:
+    def __init__(self, data: bytes):
+        self.data = memoryview(data)
+        self.position = 0
+
+    def read(self, size: int) -> bytes:
+        if self.position + size > len(self.data):
+            raise ValueError("truncated Degumin bytecode file")
+        result = self.data[self.position : self.position + size].tobytes()
+        self.position += size
+        return result
+
+    def integers(self, count: Optional[int] = None) -> array:
+        if count is None:
+            count = self.integer()
+        result = array("i")
+        result.frombytes(self.read(count * result.itemsize))
+        if sys.byteorder == "big":
+            result.byteswap()
+        return result
+
+    def integer(self) -> int:
+        return self.integers(1)[0]
+
+    def string(self) -> Identifier:
+        return Identifier(self.read(self.integer()).decode("utf-8"))
+
+
+class BackendError(DeguminError):
+    pass
+
+
+@dataclass
+class UnsupportedTerm(BackendError):
+    # Holes, metavariables and recursive definitions that aren't functions
+    term: Any
+
+
+@dataclass
+class UnboundName(BackendError):
+    name: Identifier
+
+
+@dataclass
+class UnboundIndex(BackendError):
+    number: int
+
+
+@dataclass
+class PatternArity(BackendError):
+    # A constructor pattern with another number of arguments
+    name: Identifier
+    arity: int
+    found: int
+
+
+class LoweringStopped(Exception):
+    def __init__(self, error: BackendError):
+        super().__init__(error)
+        self.error = error
+
+
+def check_patterns(
+    alternatives: list[Alternative], signature: Signature
+) -> None:
+    """
+    Raises `LoweringStopped` for a constructor pattern of a constructor
+    that isn't declared, or with the wrong number of arguments.
+    """
+    patterns = [alternative.case for alternative in alternatives]
+    while patterns:
+        pattern = patterns.pop()
+        if not isinstance(pattern, MatchConstructor):
+            continue
+        entry = signature.constructors.get(pattern.name)
+        if entry is None:
+            raise LoweringStopped(UnboundName(pattern.name))
+        if entry[1] != len(pattern.matches):
+            raise LoweringStopped(
+                PatternArity(pattern.name, entry[1], len(pattern.matches))
+            )
+        patterns.extend(pattern.matches)
+
+
+class FunctionBuilder:
+    def __init__(
+        self, name: Identifier, arity: int, parent: Optional[FunctionBuilder]
+    ):
+        self.name = name
+        self.arity = arity
+        self.parent = parent
+        self.size = arity
+        self.code = array("i")
+        self.captures: list[int] = []
+        # The captured values by function owning them and local slot
+        self.captured: dict[tuple[int, int], int] = {}
+
+    def emit(self, opcode: int, operand: int = 0) -> int:
+        """
+        Returns the position of the operand, to patch it.
+        """
+        self.code.append(opcode)
+        self.code.append(operand)
+        return len(self.code) - 1
+
+    def here(self) -> int:
+        return len(self.code)
+
+    def new_slot(self) -> int:
+        self.size += 1
+        return self.size - 1
+
+    def capture(self, owner: FunctionBuilder, slot: int) -> int:
+        """
+        The captured value of the local `slot` of `owner`, a function
+        around this one.
+        """
+        key = (id(owner), slot)
+        index = self.captured.get(key)
+        if index is None:
+            parent = self.parent
+            assert parent is not None
+            if parent is owner:
+                source = 2 * slot
+            else:
+                source = 2 * parent.capture(owner, slot) + 1
+            index = len(self.captures)
+            self.captures.append(source)
+            self.captured[key] = index
+        return index
+
+
+# A variable in scope: the function with its slot, and the slot
+Location = tuple[FunctionBuilder, int]
+
+
+class Lowering:
+    def __init__(self, statements: Iterable[object]):
+        statements = list(statements)
+        self.signature = Signature.from_statements(statements)
+        self.program = Program()
+        # By constructor, its number
+        self.constructors: dict[Identifier, int] = {}
+        for names in self.signature.types.values():
+            for name in names:
+                self.constructors[name] = len(self.program.constructors)
+                arity = self.signature.constructors[name][1]
+                self.program.constructors.append((name, arity))
+        self.types = frozenset(self.signature.types)
+        self.case_compiler = CaseCompiler(self.constructors, self.signature)
+        self.definitions: dict[Identifier, VariableDefinition] = {}
+        for statement in statements:
+            if isinstance(statement, VariableDefinition):
+                self.definitions[statement.name] = statement
+        # By definition, its number in `program.definitions`
+        self.globals: dict[Identifier, int] = {}
+        for name in self.definitions:
+            self.globals[name] = len(self.program.definitions)
+            self.program.definitions.append(Definition(name, -1))
+        self.constants: dict[int, int] = {}
+        # By constructor with arguments, its function
+        self.constructor_functions: dict[Identifier, int] = {}
+        self.lowerers = {
+            Variable: self.lower_variable,
+            FreeVariable: self.lower_free_variable,
+            Constructor: self.lower_free_variable,
+            Application: self.lower_application,
+            Abstraction: self.lower_abstraction,
+            Let: self.lower_let,
+            Case: self.lower_case,
+            Annotation: lambda term, scope, builder, tail: self.lower(
+                term.expression, scope, builder, tail
+            ),
+            IntValue: self.lower_literal,
+            Forall: self.lower_erased,
+            Universe: self.lower_erased,
+        }
+
+    def lower_program(self) -> Program:
+        """
+        May raise `LoweringStopped`.
+        """
+        for name, statement in self.definitions.items():
+            builder = FunctionBuilder(name, 0, None)
+            self.lower(statement.definition, Environment(), builder, False)
+            builder.emit(SET_GLOBAL, self.globals[name])
+            builder.emit(RETURN)
+            number = self.globals[name]
+            self.program.definitions[number].function = self.add(builder)
+        return self.program
+
+    def add(self, builder: FunctionBuilder) -> int:
+        self.program.functions.append(
+            Function(
+                builder.name,
+                builder.arity,
+                builder.size,
+                builder.captures,
+                builder.code,
+            )
+        )
+        return len(self.program.functions) - 1
+
+    def lower(
+        self,
+        term: Term,
+        scope: Environment,
+        builder: FunctionBuilder,
+        tail: bool,
+    ) -> None:
+        """
+        Emits the code pushing the value of `term`, and returning it when
+        `tail`.
+        """
+        lowerer = self.lowerers.get(type(term))
+        if lowerer is None:
+            raise LoweringStopped(UnsupportedTerm(term))
+        lowerer(term, scope, builder, tail)
+
+    def finish(self, builder: FunctionBuilder, tail: bool) -> None:
+        if tail:
+            builder.emit(RETURN)
+
+    def load(
+        self, location: Location, builder: FunctionBuilder, tail: bool
+    ) -> None:
+        owner, slot = location
+        if owner is builder:
+            builder.emit(LOCAL, slot)
+        else:
+            builder.emit(CAPTURED, builder.capture(owner, slot))
+        self.finish(builder, tail)
+
+    def lower_variable(
+        self,
+        term: Variable,
+        scope: Environment,
+        builder: FunctionBuilder,
+        tail: bool,
+    ) -> None:
+        size = len(scope.values)
+        if not 0 <= term.number < size:
+            raise LoweringStopped(UnboundIndex(term.number))
+        self.load(scope.values[size - 1 - term.number], builder, tail)
+
+    def lower_free_variable(
+        self,
+        term: FreeVariable | Constructor,
+        scope: Environment,
+        builder: FunctionBuilder,
+        tail: bool,
+    ) -> None:
+        name = term.name
+        position = scope.names.get(name)
+        if position is not None:
+            self.load(scope.values[position], builder, tail)
+            return
+        number = self.constructors.get(name)
+        if number is not None:
+            if self.program.constructors[number][1] == 0:
+                builder.emit(DATA, number)
+            else:
+                builder.emit(CLOSURE, self.constructor_function(name))
+        elif name in self.globals:
+            builder.emit(GLOBAL, self.globals[name])
+        elif name in self.types:
+            builder.emit(ERASED)
+        else:
+            raise LoweringStopped(UnboundName(name))
+        self.finish(builder, tail)
+
+    def constructor_function(self, name: Identifier) -> int:
+        """
+        The function applying the constructor `name` to its arguments.
+        """
+        number = self.constructor_functions.get(name)
+        if number is None:
+            arity = self.signature.constructors[name][1]
+            builder = FunctionBuilder(name, arity, None)
+            for slot in range(arity):
+                builder.emit(LOCAL, slot)
+            builder.emit(DATA, self.constructors[name])
+            builder.emit(RETURN)
+            number = self.add(builder)
+            self.constructor_functions[name] = number
+        return number
+
+    def lower_application(
+        self,
+        term: Application,
+        scope: Environment,
+        builder: FunctionBuilder,
+        tail: bool,
+    ) -> None:
+        arguments: list[Term] = []
+        head: Term = term
+        while isinstance(head, Application):
+            arguments.append(head.right)
+            head = head.left
+        arguments.reverse()
+        constructor = self.applied_constructor(head, scope)
+        if constructor is not None:
+            arity = self.program.constructors[constructor][1]
+            if arity == len(arguments):
+                for argument in arguments:
+                    self.lower(argument, scope, builder, False)
+                builder.emit(DATA, constructor)
+                self.finish(builder, tail)
+                return
+        self.lower(head, scope, builder, False)
+        for argument in arguments:
+            self.lower(argument, scope, builder, False)
+        if tail:
+            builder.emit(TAIL_CALL, len(arguments))
+            # Reached when the call doesn't replace the frame, see
+            # `Machine.execute`
+            builder.emit(RETURN)
+        else:
+            builder.emit(CALL, len(arguments))
+
+    def applied_constructor(
+        self, head: Term, scope: Environment
+    ) -> Optional[int]:
+        if isinstance(head, (FreeVariable, Constructor)):
+            if head.name not in scope.names:
+                return self.constructors.get(head.name)
+        return None
+
+    def lower_abstraction(
+        self,
+        term: Abstraction,
+        scope: Environment,
+        builder: FunctionBuilder,
+        tail: bool,
+    ) -> None:
+        if not term.original_arguments:
+            self.lower(term.term, scope, builder, tail)
+            return
+        name = Identifier(f"{builder.name}.lambda")
+        inner = FunctionBuilder(name, len(term.original_arguments), builder)
+        for slot, argument in enumerate(term.original_arguments):
+            scope = scope.bind(binder_name(argument), (inner, slot))
+        self.lower(term.term, scope, inner, True)
+        builder.emit(CLOSURE, self.add(inner))
+        self.finish(builder, tail)
+
+    def lower_let(
+        self,
+        term: Let,
+        scope: Environment,
+        builder: FunctionBuilder,
+        tail: bool,
+    ) -> None:
+        if not term.isRecursive:
+            for name, definition in term.definitions.items():
+                self.lower(definition, scope, builder, False)
+                slot = builder.new_slot()
+                builder.emit(STORE, slot)
+                scope = scope.bind(name, (builder, slot))
+            self.lower(term.term, scope, builder, tail)
+            return
+        # The closures are built before their slots are set, and capture
+        # them again once they are all set.
+        slots = []
+        for name in term.definitions:
+            slots.append(builder.new_slot())
+            scope = scope.bind(name, (builder, slots[-1]))
+        for slot, definition in zip(slots, term.definitions.values()):
+            if not isinstance(definition, Abstraction):
+                raise LoweringStopped(UnsupportedTerm(definition))
+            self.lower(definition, scope, builder, False)
+            builder.emit(STORE, slot)
+        for slot in slots:
+            builder.emit(RECAPTURE, slot)
+        self.lower(term.term, scope, builder, tail)
+
+    def lower_case(
+        self,
+        term: Case,
+        scope: Environment,
+        builder: FunctionBuilder,
+        tail: bool,
+    ) -> None:
+        self.lower(term.expression, scope, builder, False)
+        scrutinee = builder.new_slot()
+        builder.emit(STORE, scrutinee)
+        check_patterns(term.alternatives, self.signature)
+        case_tree = self.case_compiler.compile(term.alternatives)
+        # The jumps to every alternative, it is emitted once after the
+        # tree even if more than one leaf selects it.
+        leaves: dict[int, list[int]] = {}
+        self.lower_tree(case_tree.tree, {(): scrutinee}, builder, leaves)
+        ends = []
+        for alternative, jumps in leaves.items():
+            start = builder.here()
+            for jump in jumps:
+                builder.code[jump] = start
+            inner = self.bind_pattern(
+                case_tree, alternative, scope, builder, scrutinee
+            )
+            self.lower(
+                term.alternatives[alternative].value, inner, builder, tail
+            )
+            if not tail:
+                ends.append(builder.emit(JUMP))
+        for jump in ends:
+            builder.code[jump] = builder.here()
+
+    def lower_tree(
+        self,
+        tree: Tree,
+        slots: dict[Occurrence, int],
+        builder: FunctionBuilder,
+        leaves: dict[int, list[int]],
+    ) -> None:
+        """
+        `slots` has the local slots of the parts of the scrutinee stored
+        on the way to `tree`.
+        """
+        if isinstance(tree, Leaf):
+            leaves.setdefault(tree.alternative, []).append(builder.emit(JUMP))
+            return
+        if isinstance(tree, Fail):
+            builder.emit(FAIL)
+            return
+        slot = slots.get(tree.occurrence)
+        if slot is None:
+            self.load_part(tree.occurrence, slots, builder)
+            slot = builder.new_slot()
+            builder.emit(STORE, slot)
+            slots = {**slots, tree.occurrence: slot}
+        builder.emit(LOCAL, slot)
+        table = JumpTable(0, [], {}, -1)
+        if isinstance(tree, ConstructorSwitch):
+            builder.emit(SWITCH, len(self.program.tables))
+            # Every constructor of the type, the signature has them all
+            names = self.signature.types[
+                self.signature.constructors[next(iter(tree.branches))][0]
+            ]
+            table.base = self.constructors[names[0]]
+            table.targets = [-1] * len(names)
+        else:
+            assert isinstance(tree, LiteralSwitch)
+            builder.emit(LITERAL_SWITCH, len(self.program.tables))
+        self.program.tables.append(table)
+        for key, subtree in tree.branches.items():
+            target = builder.here()
+            if isinstance(tree, ConstructorSwitch):
+                table.targets[self.constructors[key] - table.base] = target
+            else:
+                table.literals[key] = target
+            self.lower_tree(subtree, slots, builder, leaves)
+        # A failing default fails in the switch, which has the value
+        if tree.default is not None and not isinstance(tree.default, Fail):
+            table.default = builder.here()
+            self.lower_tree(tree.default, slots, builder, leaves)
+        if isinstance(tree, ConstructorSwitch):
+            table.targets = [
+                table.default if t == -1 else t for t in table.targets
+            ]
+
+    def load_part(
+        self,
+        occurrence: Occurrence,
+        slots: dict[Occurrence, int],
+        builder: FunctionBuilder,
+    ) -> None:
+        """
+        Emits the code pushing the part of the scrutinee at `occurrence`,
+        from its closest parent in `slots`.
+        """
+        parent = occurrence
+        while parent not in slots:
+            parent = parent[:-1]
+        builder.emit(LOCAL, slots[parent])
+        for position in occurrence[len(parent) :]:
+            builder.emit(FIELD, position)
+
+    def bind_pattern(
+        self,
+        case_tree: CaseTree,
+        alternative: int,
+        scope: Environment,
+        builder: FunctionBuilder,
+        scrutinee: int,
+    ) -> Environment:
+        slots = {(): scrutinee}
+        for name, occurrence in case_tree.binders[alternative]:
+            self.load_part(occurrence, slots, builder)
+            slot = builder.new_slot()
+            builder.emit(STORE, slot)
+            scope = scope.bind(name, (builder, slot))
+        return scope
+
+    def lower_literal(
+        self,
+        term: IntValue,
+        scope: Environment,
+        builder: FunctionBuilder,
+        tail: bool,
+    ) -> None:
+        value = term.value
+        number = self.constants.get(value)
+        if number is None:
+            number = len(self.program.constants)
+            self.program.constants.append(value)
+            self.constants[value] = number
+        builder.emit(CONSTANT, number)
+        self.finish(builder, tail)
+
+    def lower_erased(
+        self,
+        term: Forall | Universe,
+        scope: Environment,
+        builder: FunctionBuilder,
+        tail: bool,
+    ) -> None:
+        builder.emit(ERASED)
+        self.finish(builder, tail)
+
+
+def compile_program(statements: Iterable[object]) -> Program | BackendError:
+    """
+    The program of the definitions and data types among `statements`,
+    the other statements are ignored.
+    """
+    try:
+        return Lowering(statements).lower_program()
+    except LoweringStopped as e:
+        return e.error
+
+
+def write_program(program: Program, path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(program.to_bytes())
+
+
+def read_program(path: Path) -> Program:
+    return Program.from_bytes(path.read_bytes())
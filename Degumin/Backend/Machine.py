@@ -0,0 +1,367 @@
+"""
+Runs the bytecode of `Degumin.Backend.Bytecode`.
+
+The values are plain Python objects told apart by their type: a literal
+is an `int`, a constructor value a tuple of the number of its
+constructor and its arguments, a function a `Closure` or a `Partial`
+application and a type is erased to None. The machine loop runs every
+call in the same Python frame, a call pushes the frame of the caller on
+a list and a return pops it, so the depth of the recursion of a program
+isn't limited by the one of Python.
+
+A function is called with as many arguments as it takes in one step. A
+call with fewer builds a `Partial`, a call with more calls the function
+and then applies its result to the others.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any
+
+from Degumin.Backend.Bytecode import (
+    CALL,
+    CAPTURED,
+    CLOSURE,
+    CONSTANT,
+    DATA,
+    ERASED,
+    FAIL,
+    FIELD,
+    GLOBAL,
+    JUMP,
+    LITERAL_SWITCH,
+    LOCAL,
+    RECAPTURE,
+    RETURN,
+    SET_GLOBAL,
+    STORE,
+    SWITCH,
+    TAIL_CALL,
+    Program,
+)
+from Degumin.Common.Error import DeguminError
+from Degumin.Core.Core import (
+    Application,
+    FreeVariable,
+    Hole,
+    Identifier,
+    IntValue,
+    Term,
+)
+
+
+class Closure:
+    __slots__ = ("function", "captured")
+
+    def __init__(self, function: int, captured: list[Any]):
+        self.function = function
+        self.captured = captured
+
+    def __repr__(self) -> str:
+        return f"Closure({self.function}, {self.captured!r})"
+
+
+class Partial:
+    __slots__ = ("function", "arguments")
+
+    def __init__(self, function: Closure, arguments: list[Any]):
+        self.function = function
+        self.arguments = arguments
+
+    def __repr__(self) -> str:
+        return f"Partial({self.function!r}, {self.arguments!r})"
+
+
+class MachineError(DeguminError):
+    pass
+
+
+@dataclass
+class NotAFunction(MachineError):
+    value: Any
+
+
+@dataclass
+class NoMatchingAlternative(MachineError):
+    value: Any
+
+
+@dataclass
+class CyclicDefinition(MachineError):
+    name: Identifier
+
+
+@dataclass
+class UndefinedName(MachineError):
+    name: Identifier
+
+
+class MachineStopped(Exception):
+    def __init__(self, error: MachineError):
+        super().__init__(error)
+        self.error = error
+
+
+# A definition not computed yet, and one being computed
+unevaluated = object()
+evaluating = object()
+
+
+class Machine:
+    def __init__(self, program: Program):
+        self.program = program
+        # Lists are indexed faster than arrays
+        self.codes = [list(f.code) for f in program.functions]
+        self.arities = [f.arity for f in program.functions]
+        self.sizes = [f.size for f in program.functions]
+        self.captures = [f.captures for f in program.functions]
+        self.constructor_arities = [a for _, a in program.constructors]
+        self.nullary = [(i,) for i in range(len(program.constructors))]
+        self.tables = [
+            (t.base, t.targets, t.literals, t.default) for t in program.tables
+        ]
+        self.globals: list[Any] = [unevaluated] * len(program.definitions)
+        self.calls = 0
+
+    def run(self, name: Identifier) -> Any | MachineError:
+        """
+        The value of the definition `name`.
+        """
+        try:
+            return self.evaluate(name)
+        except MachineStopped as e:
+            return e.error
+
+    def evaluate(self, name: Identifier) -> Any:
+        """
+        May raise `MachineStopped`.
+        """
+        number = self.program.definition(name)
+        if number is None:
+            raise MachineStopped(UndefinedName(name))
+        return self.execute([GLOBAL, number, RETURN, 0], [], [])
+
+    def apply(self, function: Any, arguments: list[Any]) -> Any:
+        """
+        May raise `MachineStopped`.
+        """
+        if not arguments:
+            return function
+        code = [LOCAL, 0]
+        for i in range(len(arguments)):
+            code += [LOCAL, i + 1]
+        code += [CALL, len(arguments), RETURN, 0]
+        return self.execute(code, [function, *arguments], [])
+
+    def resolve(self, function: Any, arguments: list[Any]) -> Any:
+        """
+        The closure to call with its arguments and the ones to apply its
+        result to, or the value of a partial application.
+        """
+        while type(function) is Partial:
+            arguments = function.arguments + arguments
+            function = function.function
+        if type(function) is not Closure:
+            raise MachineStopped(NotAFunction(function))
+        arity = self.arities[function.function]
+        if len(arguments) < arity:
+            return Partial(function, arguments)
+        return function, arguments[:arity], arguments[arity:]
+
+    def execute(
+        self, code: list[int], local: list[Any], captured: list[Any]
+    ) -> Any:
+        codes = self.codes
+        arities = self.arities
+        sizes = self.sizes
+        captures = self.captures
+        constants = self.program.constants
+        constructor_arities = self.constructor_arities
+        nullary = self.nullary
+        tables = self.tables
+        _globals = self.globals
+        # The frames of the callers: code, position, local slots,
+        # captured values, stack and the arguments to apply the result to
+        frames: list[tuple] = []
+        stack: list[Any] = []
+        pc = 0
+        calls = 0
+        try:
+            while True:
+                opcode = code[pc]
+                operand = code[pc + 1]
+                pc += 2
+                if opcode == LOCAL:
+                    stack.append(local[operand])
+                elif opcode == CAPTURED:
+                    stack.append(captured[operand])
+                elif opcode == STORE:
+                    local[operand] = stack.pop()
+                elif opcode == FIELD:
+                    stack[-1] = stack[-1][operand + 1]
+                elif opcode == SWITCH:
+                    value = stack.pop()
+                    base, targets, _, default = tables[operand]
+                    if type(value) is tuple:
+                        pc = targets[value[0] - base]
+                    else:
+                        pc = default
+                    if pc < 0:
+                        raise MachineStopped(NoMatchingAlternative(value))
+                elif opcode == DATA:
+                    count = constructor_arities[operand]
+                    if count:
+                        value = (operand, *stack[-count:])
+                        del stack[-count:]
+                        stack.append(value)
+                    else:
+                        stack.append(nullary[operand])
+                elif opcode == GLOBAL:
+                    value = _globals[operand]
+                    if value is unevaluated:
+                        # Its function returns the value on the stack
+                        _globals[operand] = evaluating
+                        frames.append((code, pc, local, captured, stack, None))
+                        number = self.program.definitions[operand].function
+                        stack = []
+                        code = codes[number]
+                        pc = 0
+                        local = [None] * sizes[number]
+                        captured = []
+                    elif value is evaluating:
+                        name = self.program.definitions[operand].name
+                        raise MachineStopped(CyclicDefinition(name))
+                    else:
+                        stack.append(value)
+                elif opcode == CONSTANT:
+                    stack.append(constants[operand])
+                else:
+                    if opcode == RETURN:
+                        value = stack.pop()
+                        if not frames:
+                            return value
+                        code, pc, local, captured, stack, rest = frames.pop()
+                        if rest is None:
+                            stack.append(value)
+                            continue
+                        # Applies the result to the arguments left
+                        stack.append(value)
+                        stack.extend(rest)
+                        opcode = CALL
+                        operand = len(rest)
+                    if opcode == CALL or opcode == TAIL_CALL:
+                        calls += 1
+                        arguments = stack[-operand:]
+                        del stack[-operand:]
+                        function = stack.pop()
+                        if (
+                            type(function) is Closure
+                            and arities[function.function] == operand
+                        ):
+                            number = function.function
+                            if opcode == CALL:
+                                frames.append(
+                                    (code, pc, local, captured, stack, None)
+                                )
+                            stack = []
+                            code = codes[number]
+                            pc = 0
+                            size = sizes[number]
+                            if size > operand:
+                                arguments.extend([None] * (size - operand))
+                            local = arguments
+                            captured = function.captured
+                            continue
+                        resolved = self.resolve(function, arguments)
+                        if type(resolved) is Partial:
+                            # A tail call is followed by a RETURN
+                            stack.append(resolved)
+                            continue
+                        function, arguments, rest = resolved
+                        number = function.function
+                        frames.append(
+                            (code, pc, local, captured, stack, rest or None)
+                        )
+                        stack = []
+                        code = codes[number]
+                        pc = 0
+                        size = sizes[number]
+                        arguments.extend([None] * (size - len(arguments)))
+                        local = arguments
+                        captured = function.captured
+                    elif opcode == LITERAL_SWITCH:
+                        value = stack.pop()
+                        _, _, literals, default = tables[operand]
+                        pc = literals.get(value, default)
+                        if pc < 0:
+                            raise MachineStopped(NoMatchingAlternative(value))
+                    elif opcode == CLOSURE:
+                        stack.append(
+                            Closure(
+                                operand,
+                                [
+                                    captured[source >> 1]
+                                    if source & 1
+                                    else local[source >> 1]
+                                    for source in captures[operand]
+                                ],
+                            )
+                        )
+                    elif opcode == ERASED:
+                        stack.append(None)
+                    elif opcode == JUMP:
+                        pc = operand
+                    elif opcode == SET_GLOBAL:
+                        _globals[operand] = stack[-1]
+                    elif opcode == RECAPTURE:
+                        closure = local[operand]
+                        closure.captured[:] = [
+                            captured[source >> 1]
+                            if source & 1
+                            else local[source >> 1]
+                            for source in captures[closure.function]
+                        ]
+                    elif opcode == FAIL:
+                        raise MachineStopped(NoMatchingAlternative(None))
+                    else:
+                        raise ValueError(f"unknown opcode {opcode}")
+        except MachineStopped:
+            # The definitions left being computed are computed again later
+            for number, value in enumerate(_globals):
+                if value is evaluating:
+                    _globals[number] = unevaluated
+            raise
+        finally:
+            self.calls += calls
+
+    def read_back(self, value: Any) -> Term[None]:
+        """
+        `value` as a term, like `Evaluator.quote` reads back a value. A
+        function or a type is read back as a hole.
+        """
+        constructors = self.program.constructors
+        # Like `Evaluator.quote`, with an explicit stack: the terms of the
+        # values done, and a value with whether its arguments are done.
+        results: list[Term[None]] = []
+        stack: list[tuple[Any, bool]] = [(value, False)]
+        while stack:
+            value, done = stack.pop()
+            if type(value) is tuple:
+                count = len(value) - 1
+                if count and not done:
+                    stack.append((value, True))
+                    stack.extend((v, False) for v in reversed(value[1:]))
+                    continue
+                term: Term[None] = FreeVariable(constructors[value[0]][0], None)
+                if count:
+                    arguments = results[-count:]
+                    del results[-count:]
+                    for argument in arguments:
+                        term = Application(term, argument, None)
+                results.append(term)
+            elif type(value) is int:
+                results.append(IntValue(value, None))
+            else:
+                name = "function" if value is not None else "type"
+                results.append(Hole(Identifier(name), None))
+        return results[0]
@@ -0,0 +1,928 @@
+"""
+Generates a Python module from the definitions of a module in Core.
+
+Every definition with arguments becomes a `def` taking them, the other
+definitions are computed when the module is imported, after every
+function is defined and after the definitions they use. A lambda
+becomes a nested `def`, a closure of Python. A `case` becomes `match`
+statements on the tags of the constructors, from its decision tree (see
+`Degumin.Core.CaseTree`).
+
+Types are erased. A `forall`, a universe or the name of a data type is
+`None`, and an argument of a definition whose declared type is a type
+(`forall (a : Type) ...`) isn't a parameter of its `def`: a call to the
+definition with all its arguments doesn't compute it. Used as a value
+the definition is a function taking every argument.
+
+Values are Python values: a literal is an `int`, a constructor value a
+tuple of the tag of its constructor, its position in its data type, and
+its arguments. A data type like the natural numbers, a constructor
+without arguments and one with an argument of the type, is an `int`
+with the first one as 0 and the second one adding 1, so it is computed
+with the arithmetic of Python ints.
+
+A call to a definition or a `let` function with all its arguments calls
+it directly, other calls go through `_apply`, which handles partial
+applications. A call of a definition to itself in tail position is a
+loop, unless the definition builds closures that could see its
+arguments change. So is a call under successors of natural numbers,
+`S (add k n)`, the loop counts them and the definition adds the count
+to the value it returns.
+
+`write_module` writes the module with the hash of its source, and
+doesn't generate it again while the source and the generator don't
+change. `load_module` imports it.
+"""
+from __future__ import annotations
+
+import builtins
+import hashlib
+import importlib.util
+import keyword
+from dataclasses import dataclass
+from pathlib import Path
+from types import ModuleType
+from typing import Any, Iterable, Optional
+
+from Degumin.Backend.Bytecode import (
+    BackendError,
+    LoweringStopped,
+    UnboundIndex,
+    UnboundName,
+    UnsupportedTerm,
+    check_patterns,
+)
+from Degumin.Core.CaseTree import (
+    CaseCompiler,
+    CaseTree,
+    ConstructorSwitch,
+    Fail,
+    Leaf,
+    LiteralSwitch,
+    Occurrence,
+    Signature,
+    Tree,
+)
+from Degumin.Core.Core import (
+    Abstraction,
+    Annotation,
+    Application,
+    Case,
+    Constructor,
+    DataType,
+    Forall,
+    FreeVariable,
+    Identifier,
+    IntValue,
+    Let,
+    Term,
+    Universe,
+    Variable,
+    VariableDeclaration,
+    VariableDefinition,
+)
+from Degumin.Core.Evaluation import Environment, binder_name
+from Degumin.Core.Traversal import iter_terms
+
+# Part of the hash of the generated modules, a new version of the
+# generator generates them again.
+generator_version = b"1"
+
+prelude = """\
+from functools import partial as _partial
+
+
+class _NoMatchingAlternative(Exception):
+    pass
+
+
+def _apply(function, *arguments):
+    while True:
+        if type(function) is _partial:
+            arity = function.func.__code__.co_argcount - len(function.args)
+        else:
+            arity = function.__code__.co_argcount
+        if len(arguments) == arity:
+            return function(*arguments)
+        if len(arguments) < arity:
+            return _partial(function, *arguments)
+        function = function(*arguments[:arity])
+        arguments = arguments[arity:]
+"""
+
+# The names of the prelude, the generated ones start with an underscore
+# too and Degumin names can't.
+reserved_names = frozenset(["_partial", "_NoMatchingAlternative", "_apply"])
+
+indentation = "    "
+
+
+@dataclass
+class CyclicDefinitions(BackendError):
+    # Definitions without arguments needing each other to be computed
+    names: list[Identifier]
+
+
+@dataclass(slots=True)
+class Local:
+    # The Python expression of the variable
+    expression: str
+    # The number of arguments of a `let` function
+    arity: Optional[int] = None
+
+
+@dataclass
+class GlobalFunction:
+    name: str
+    # Its arguments, the erased ones included
+    arity: int
+    erased: list[bool]
+    # Its Python expression as a value
+    value: str
+
+
+def python_name(name: str) -> str:
+    name = name.replace("'", "_prime")
+    if keyword.iskeyword(name) or hasattr(builtins, name):
+        return name + "_"
+    return name
+
+
+class Names:
+    def __init__(self, used: Iterable[str]):
+        self.used = set(used)
+
+    def fresh(self, name: str) -> str:
+        result = name
+        number = 2
+        while result in self.used:
+            result = f"{name}_{number}"
+            number += 1
+        self.used.add(result)
+        return result
+
+
+class DefinitionContext:
+    def __init__(self, names: Names):
+        self.names = names
+        # The definitions it uses
+        self.references: set[Identifier] = set()
+        # The definition whose calls to itself in tail position loop, and
+        # the Python names of its parameters
+        self.loop: Optional[tuple[Identifier, list[str]]] = None
+        self.looped = False
+        # Whether a call looping is under successors, and the name of
+        # their count the returns add
+        self.counted = False
+        self.offset: Optional[str] = None
+
+
+def line(out: list[str], indent: int, text: str) -> None:
+    out.append(indentation * indent + text)
+
+
+def is_type(term: Term) -> bool:
+    while isinstance(term, Forall):
+        term = term.term
+    return isinstance(term, Universe)
+
+
+def argument_types(declaration: Term) -> list[Term]:
+    result = []
+    while isinstance(declaration, Forall):
+        result.extend(argument[1] for argument in declaration.arguments)
+        declaration = declaration.term
+    return result
+
+
+def spine(term: Application) -> tuple[Term, list[Term]]:
+    arguments: list[Term] = []
+    head: Term = term
+    while isinstance(head, Application):
+        arguments.append(head.right)
+        head = head.left
+    arguments.reverse()
+    return head, arguments
+
+
+class PythonGenerator:
+    def __init__(self, statements: Iterable[object]):
+        statements = list(statements)
+        self.signature = Signature.from_statements(statements)
+        self.case_compiler = CaseCompiler(
+            self.signature.constructors, self.signature
+        )
+        # By constructor, its tag
+        self.tags: dict[Identifier, int] = {}
+        for names in self.signature.types.values():
+            for tag, name in enumerate(names):
+                self.tags[name] = tag
+        # The data types represented by ints, with their constructors
+        self.naturals: dict[Identifier, tuple[Identifier, Identifier]] = {}
+        for statement in statements:
+            if isinstance(statement, DataType):
+                natural = self.natural_constructors(statement)
+                if natural is not None:
+                    self.naturals[statement.name] = natural
+        declarations: dict[Identifier, Term] = {}
+        self.definitions: dict[Identifier, VariableDefinition] = {}
+        for statement in statements:
+            if isinstance(statement, VariableDeclaration):
+                declarations[statement.name] = statement.declaration
+            elif isinstance(statement, VariableDefinition):
+                self.definitions[statement.name] = statement
+        self.global_names = Names(reserved_names)
+        # By global name, its Python name
+        self.names: dict[Identifier, str] = {}
+        for name in [*self.tags, *self.definitions]:
+            self.names[name] = self.global_names.fresh(python_name(name))
+        self.functions: dict[Identifier, GlobalFunction] = {}
+        for name, statement in self.definitions.items():
+            definition = statement.definition
+            if (
+                not isinstance(definition, Abstraction)
+                or not definition.original_arguments
+            ):
+                continue
+            arity = len(definition.original_arguments)
+            types = argument_types(declarations.get(name, Universe(0, None)))
+            erased = [
+                i < len(types) and is_type(types[i]) for i in range(arity)
+            ]
+            value = self.names[name]
+            if any(erased):
+                value = self.global_names.fresh(f"_value_{value}")
+            self.functions[name] = GlobalFunction(
+                self.names[name], arity, erased, value
+            )
+        self.types = frozenset(self.signature.types)
+
+    def natural_constructors(
+        self, data: DataType
+    ) -> Optional[tuple[Identifier, Identifier]]:
+        if len(data.constructors) != 2:
+            return None
+        zero, successor = data.constructors
+        if isinstance(zero.arguments, Forall):
+            zero, successor = successor, zero
+        types = argument_types(successor.arguments)
+        if (
+            isinstance(zero.arguments, Forall)
+            or len(types) != 1
+            or not isinstance(types[0], FreeVariable)
+            or types[0].name != data.name
+        ):
+            return None
+        return zero.name, successor.name
+
+    def generate(self, name: str, source_hash: str) -> str:
+        """
+        The text of the module, may raise `LoweringStopped`.
+        """
+        out = [
+            f"# Generated by Degumin from {name}, don't edit it.",
+            f"# source hash: {source_hash}",
+            prelude.rstrip("\n"),
+        ]
+        for data, names in self.signature.types.items():
+            out.extend(["", ""])
+            line(out, 0, f"# {data}")
+            for constructor in names:
+                self.constructor(constructor, out)
+        # The code of the definitions without arguments, with the
+        # definitions they use
+        initializers: dict[Identifier, tuple[list[str], set[Identifier]]] = {}
+        references: dict[Identifier, set[Identifier]] = {}
+        for name, statement in self.definitions.items():
+            context = DefinitionContext(Names(self.global_names.used))
+            code: list[str] = ["", ""]
+            if name in self.functions:
+                self.global_function(name, statement, context, code)
+                out.extend(code)
+            else:
+                initializer = self.global_names.fresh(
+                    f"_define_{self.names[name]}"
+                )
+                line(code, 0, f"def {initializer}():")
+                self.statement(
+                    statement.definition, Environment(), context, code, 1, None
+                )
+                out.extend(code)
+                assignment = [f"{self.names[name]} = {initializer}()"]
+                initializers[name] = (assignment, context.references)
+            references[name] = context.references
+        out.extend(["", ""])
+        for name in self.initialization_order(initializers, references):
+            out.extend(initializers[name][0])
+        return "\n".join(out) + "\n"
+
+    def constructor(self, name: Identifier, out: list[str]) -> None:
+        arity = self.signature.constructors[name][1]
+        python = self.names[name]
+        parameters = [f"x{i}" for i in range(arity)]
+        if not arity:
+            line(out, 0, f"{python} = {self.construct(name, [])}")
+            return
+        line(out, 0, f"def {python}({', '.join(parameters)}):")
+        line(out, 1, f"return {self.construct(name, parameters)}")
+
+    def construct(self, name: Identifier, values: list[str]) -> str:
+        data = self.signature.constructors[name][0]
+        if data in self.naturals:
+            if not values:
+                return "0"
+            if values[0].isdigit():
+                return str(int(values[0]) + 1)
+            return f"({values[0]} + 1)"
+        return f"({', '.join([str(self.tags[name]), *values])},)".replace(
+            ",,)", ",)"
+        )
+
+    def initialization_order(
+        self,
+        initializers: dict[Identifier, Any],
+        references: dict[Identifier, set[Identifier]],
+    ) -> list[Identifier]:
+        """
+        The definitions without arguments, each after the ones it uses
+        directly or through functions.
+        """
+        order: list[Identifier] = []
+        done: set[Identifier] = set()
+        for start in initializers:
+            if start in done:
+                continue
+            # Depth first, a definition is done after its references
+            path: list[Identifier] = []
+            stack: list[tuple[Identifier, bool]] = [(start, False)]
+            visiting: set[Identifier] = set()
+            while stack:
+                name, leaving = stack.pop()
+                if leaving:
+                    visiting.discard(name)
+                    path.pop()
+                    done.add(name)
+                    if name in initializers:
+                        order.append(name)
+                    continue
+                if name in done:
+                    continue
+                if name in visiting:
+                    if name in initializers:
+                        cycle = path[path.index(name) :]
+                        raise LoweringStopped(CyclicDefinitions(cycle))
+                    continue
+                visiting.add(name)
+                path.append(name)
+                stack.append((name, True))
+                for reference in sorted(references.get(name, ())):
+                    if reference not in done:
+                        stack.append((reference, False))
+        return order
+
+    def global_function(
+        self,
+        name: Identifier,
+        statement: VariableDefinition,
+        context: DefinitionContext,
+        out: list[str],
+    ) -> None:
+        function = self.functions[name]
+        definition = statement.definition
+        assert isinstance(definition, Abstraction)
+        loops = not any(
+            isinstance(term, Abstraction) and term.original_arguments
+            for term in iter_terms(definition.term)
+        )
+        parameters, body = self.function_body(name, definition, context, loops)
+        if context.counted:
+            # Generated again with the returns adding the successors
+            # counted by the calls looping
+            references = context.references
+            context = DefinitionContext(Names(self.global_names.used))
+            context.offset = context.names.fresh("offset")
+            parameters, body = self.function_body(
+                name, definition, context, True
+            )
+            references |= context.references
+        line(out, 0, f"def {function.name}({', '.join(parameters)}):")
+        if context.offset is not None:
+            line(out, 1, f"{context.offset} = 0")
+        if context.looped:
+            line(out, 1, "while True:")
+            out.extend(body)
+        else:
+            out.extend(text[len(indentation) :] for text in body)
+        if function.value != function.name:
+            names = [f"x{i}" for i in range(function.arity)]
+            kept = [n for n, e in zip(names, function.erased) if not e]
+            out.extend(["", ""])
+            line(out, 0, f"def {function.value}({', '.join(names)}):")
+            line(out, 1, f"return {function.name}({', '.join(kept)})")
+
+    def function_body(
+        self,
+        name: Identifier,
+        definition: Abstraction,
+        context: DefinitionContext,
+        loops: bool,
+    ) -> tuple[list[str], list[str]]:
+        """
+        The parameters of the definition `name` and its body, indented to
+        be in a loop. Its calls to itself in tail position loop if
+        `loops`.
+        """
+        erased = self.functions[name].erased
+        scope = Environment()
+        parameters = []
+        for i, argument in enumerate(definition.original_arguments):
+            binder = binder_name(argument)
+            if i < len(erased) and erased[i]:
+                scope = scope.bind(binder, Local("None"))
+                continue
+            parameter = context.names.fresh(python_name(binder or "_x"))
+            parameters.append(parameter)
+            scope = scope.bind(binder, Local(parameter))
+        if loops:
+            context.loop = (name, parameters)
+        body: list[str] = []
+        self.statement(definition.term, scope, context, body, 2, None)
+        return parameters, body
+
+    def statement(
+        self,
+        term: Term,
+        scope: Environment,
+        context: DefinitionContext,
+        out: list[str],
+        indent: int,
+        target: Optional[str],
+    ) -> None:
+        """
+        Emits the code returning the value of `term`, or assigning it to
+        `target`.
+        """
+        if isinstance(term, Annotation):
+            self.statement(term.expression, scope, context, out, indent, target)
+            return
+        if isinstance(term, Let):
+            scope = self.let(term, scope, context, out, indent)
+            self.statement(term.term, scope, context, out, indent, target)
+            return
+        if isinstance(term, Case):
+            self.case(term, scope, context, out, indent, target)
+            return
+        if (
+            target is None
+            and isinstance(term, Application)
+            and self.loop_call(term, scope, context, out, indent)
+        ):
+            return
+        if (
+            target is not None
+            and isinstance(term, Abstraction)
+            and term.original_arguments
+        ):
+            self.function(target, term, scope, context, out, indent)
+            return
+        value = self.expression(term, scope, context, out, indent)
+        if target is None and context.offset is not None:
+            line(out, indent, f"return {context.offset} + {value}")
+        elif target is None:
+            line(out, indent, f"return {value}")
+        else:
+            line(out, indent, f"{target} = {value}")
+
+    def loop_call(
+        self,
+        term: Application,
+        scope: Environment,
+        context: DefinitionContext,
+        out: list[str],
+        indent: int,
+    ) -> bool:
+        if context.loop is None:
+            return False
+        name, parameters = context.loop
+        # A natural number is an int, the successors of the call are
+        # counted
+        successors = 0
+        while isinstance(term.right, Application) and self.is_successor(
+            term.left, scope
+        ):
+            successors += 1
+            term = term.right
+        head, arguments = spine(term)
+        if (
+            not isinstance(head, FreeVariable)
+            or head.name != name
+            or name in scope.names
+            or len(arguments) != self.functions[name].arity
+        ):
+            return False
+        values = [
+            self.expression(argument, scope, context, out, indent)
+            for argument, erased in zip(arguments, self.functions[name].erased)
+            if not erased
+        ]
+        if successors:
+            context.counted = True
+            if context.offset is not None:
+                line(out, indent, f"{context.offset} += {successors}")
+        if parameters:
+            line(out, indent, f"{', '.join(parameters)} = {', '.join(values)}")
+        line(out, indent, "continue")
+        context.looped = True
+        return True
+
+    def is_successor(self, term: Term, scope: Environment) -> bool:
+        if (
+            not isinstance(term, (FreeVariable, Constructor))
+            or term.name in scope.names
+            or term.name not in self.tags
+        ):
+            return False
+        data = self.signature.constructors[term.name][0]
+        return data in self.naturals and self.naturals[data][1] == term.name
+
+    def expression(
+        self,
+        term: Term,
+        scope: Environment,
+        context: DefinitionContext,
+        out: list[str],
+        indent: int,
+    ) -> str:
+        """
+        A Python expression of the value of `term`, the statements it
+        needs are emitted to `out` first.
+        """
+        if isinstance(term, (FreeVariable, Constructor)):
+            return self.name(term.name, scope, context)
+        if isinstance(term, Variable):
+            size = len(scope.values)
+            if not 0 <= term.number < size:
+                raise LoweringStopped(UnboundIndex(term.number))
+            return scope.values[size - 1 - term.number].expression
+        if isinstance(term, Application):
+            return self.application(term, scope, context, out, indent)
+        if isinstance(term, IntValue):
+            return str(term.value)
+        if isinstance(term, (Forall, Universe)):
+            return "None"
+        if isinstance(term, Annotation):
+            return self.expression(term.expression, scope, context, out, indent)
+        if isinstance(term, Abstraction):
+            if not term.original_arguments:
+                return self.expression(term.term, scope, context, out, indent)
+            name = context.names.fresh("function")
+            self.function(name, term, scope, context, out, indent)
+            return name
+        if isinstance(term, Let):
+            scope = self.let(term, scope, context, out, indent)
+            return self.expression(term.term, scope, context, out, indent)
+        if isinstance(term, Case):
+            name = context.names.fresh("case")
+            self.case(term, scope, context, out, indent, name)
+            return name
+        raise LoweringStopped(UnsupportedTerm(term))
+
+    def name(
+        self, name: Identifier, scope: Environment, context: DefinitionContext
+    ) -> str:
+        position = scope.names.get(name)
+        if position is not None:
+            return scope.values[position].expression
+        if name in self.tags:
+            if self.signature.constructors[name][1] == 0:
+                return self.construct(name, [])
+            return self.names[name]
+        if name in self.definitions:
+            context.references.add(name)
+            function = self.functions.get(name)
+            return self.names[name] if function is None else function.value
+        if name in self.types:
+            return "None"
+        raise LoweringStopped(UnboundName(name))
+
+    def application(
+        self,
+        term: Application,
+        scope: Environment,
+        context: DefinitionContext,
+        out: list[str],
+        indent: int,
+    ) -> str:
+        head, arguments = spine(term)
+
+        def values(terms: list[Term]) -> list[str]:
+            return [
+                self.expression(t, scope, context, out, indent) for t in terms
+            ]
+
+        function: Optional[str] = None
+        if isinstance(head, (FreeVariable, Constructor)):
+            name = head.name
+            position = scope.names.get(name)
+            local = None if position is None else scope.values[position]
+            if local is not None:
+                if local.arity is not None and local.arity <= len(arguments):
+                    function = local.expression
+                    kept = values(arguments[: local.arity])
+                    arguments = arguments[local.arity :]
+            elif name in self.tags:
+                arity = self.signature.constructors[name][1]
+                if arity and arity == len(arguments):
+                    return self.construct(name, values(arguments))
+            elif name in self.functions:
+                known = self.functions[name]
+                if known.arity > len(arguments) and not any(known.erased):
+                    context.references.add(name)
+                    return f"_partial({', '.join([known.name, *values(arguments)])})"
+                if known.arity <= len(arguments):
+                    context.references.add(name)
+                    function = known.name
+                    kept = values(
+                        [
+                            a
+                            for a, erased in zip(arguments, known.erased)
+                            if not erased
+                        ]
+                    )
+                    arguments = arguments[known.arity :]
+        if function is not None:
+            call = f"{function}({', '.join(kept)})"
+            if not arguments:
+                return call
+            return f"_apply({', '.join([call, *values(arguments)])})"
+        callee = self.expression(head, scope, context, out, indent)
+        return f"_apply({', '.join([callee, *values(arguments)])})"
+
+    def function(
+        self,
+        name: str,
+        term: Abstraction,
+        scope: Environment,
+        context: DefinitionContext,
+        out: list[str],
+        indent: int,
+    ) -> None:
+        parameters = []
+        for argument in term.original_arguments:
+            binder = binder_name(argument)
+            parameter = context.names.fresh(python_name(binder or "_x"))
+            parameters.append(parameter)
+            scope = scope.bind(binder, Local(parameter))
+        line(out, indent, f"def {name}({', '.join(parameters)}):")
+        # The calls of a nested function don't loop the definition
+        loop, context.loop = context.loop, None
+        self.statement(term.term, scope, context, out, indent + 1, None)
+        context.loop = loop
+
+    def let(
+        self,
+        term: Let,
+        scope: Environment,
+        context: DefinitionContext,
+        out: list[str],
+        indent: int,
+    ) -> Environment:
+        def arity(definition: Term) -> Optional[int]:
+            if (
+                isinstance(definition, Abstraction)
+                and definition.original_arguments
+            ):
+                return len(definition.original_arguments)
+            return None
+
+        if not term.isRecursive:
+            for name, definition in term.definitions.items():
+                target = context.names.fresh(python_name(name))
+                self.statement(definition, scope, context, out, indent, target)
+                scope = scope.bind(name, Local(target, arity(definition)))
+            return scope
+        # Nested functions see each other as Python closures
+        targets = []
+        for name, definition in term.definitions.items():
+            if arity(definition) is None:
+                raise LoweringStopped(UnsupportedTerm(definition))
+            targets.append(context.names.fresh(python_name(name)))
+            scope = scope.bind(name, Local(targets[-1], arity(definition)))
+        for target, definition in zip(targets, term.definitions.values()):
+            assert isinstance(definition, Abstraction)
+            self.function(target, definition, scope, context, out, indent)
+        return scope
+
+    def case(
+        self,
+        term: Case,
+        scope: Environment,
+        context: DefinitionContext,
+        out: list[str],
+        indent: int,
+        target: Optional[str],
+    ) -> None:
+        scrutinee = self.expression(
+            term.expression, scope, context, out, indent
+        )
+        if not scrutinee.isidentifier():
+            name = context.names.fresh("scrutinee")
+            line(out, indent, f"{name} = {scrutinee}")
+            scrutinee = name
+        check_patterns(term.alternatives, self.signature)
+        case_tree = self.case_compiler.compile(term.alternatives)
+        self.tree(
+            case_tree.tree,
+            CaseEmission(term, case_tree, scope, context, target),
+            {(): scrutinee},
+            {},
+            out,
+            indent,
+        )
+
+    def tree(
+        self,
+        tree: Tree,
+        emission: CaseEmission,
+        parts: dict[Occurrence, str],
+        path: dict[Occurrence, Identifier],
+        out: list[str],
+        indent: int,
+    ) -> None:
+        """
+        `parts` has the names of the parts of the scrutinee assigned on
+        the way to `tree`, and `path` the constructors they matched.
+        """
+        if isinstance(tree, Leaf):
+            self.leaf(tree.alternative, emission, parts, path, out, indent)
+            return
+        if isinstance(tree, Fail):
+            line(out, indent, f"raise _NoMatchingAlternative({parts[()]})")
+            return
+        value = self.part(tree.occurrence, emission, parts, path, out, indent)
+        default = tree.default or Fail()
+        if isinstance(tree, LiteralSwitch):
+            line(out, indent, f"match {value}:")
+            for literal, subtree in tree.branches.items():
+                line(out, indent + 1, f"case {literal!r}:")
+                self.tree(subtree, emission, dict(parts), path, out, indent + 2)
+            line(out, indent + 1, "case _:")
+            self.tree(default, emission, dict(parts), path, out, indent + 2)
+            return
+        assert isinstance(tree, ConstructorSwitch)
+        data = self.signature.constructors[next(iter(tree.branches))][0]
+        natural = self.naturals.get(data)
+        if natural is not None:
+            for test, constructor in zip(["if", "else"], natural):
+                condition = f" {value} == 0" if test == "if" else ""
+                line(out, indent, f"{test}{condition}:")
+                self.tree(
+                    tree.branches.get(constructor, default),
+                    emission,
+                    dict(parts),
+                    {**path, tree.occurrence: constructor},
+                    out,
+                    indent + 1,
+                )
+            return
+        line(out, indent, f"match {value}[0]:")
+        for constructor, subtree in tree.branches.items():
+            line(out, indent + 1, f"case {self.tags[constructor]}:")
+            self.tree(
+                subtree,
+                emission,
+                dict(parts),
+                {**path, tree.occurrence: constructor},
+                out,
+                indent + 2,
+            )
+        line(out, indent + 1, "case _:")
+        self.tree(default, emission, dict(parts), path, out, indent + 2)
+
+    def part(
+        self,
+        occurrence: Occurrence,
+        emission: CaseEmission,
+        parts: dict[Occurrence, str],
+        path: dict[Occurrence, Identifier],
+        out: list[str],
+        indent: int,
+        name: Optional[str] = None,
+    ) -> str:
+        """
+        The name of the part of the scrutinee at `occurrence`, assigned
+        to `name` or a fresh name if it has none yet.
+        """
+        if occurrence in parts and name is None:
+            return parts[occurrence]
+        if occurrence in parts:
+            expression = parts[occurrence]
+        else:
+            parent = self.part(
+                occurrence[:-1], emission, parts, path, out, indent
+            )
+            data = self.signature.constructors[path[occurrence[:-1]]][0]
+            if data in self.naturals:
+                expression = f"{parent} - 1"
+            else:
+                expression = f"{parent}[{occurrence[-1] + 1}]"
+        if name is None:
+            name = emission.context.names.fresh("part")
+        line(out, indent, f"{name} = {expression}")
+        parts[occurrence] = name
+        return name
+
+    def leaf(
+        self,
+        alternative: int,
+        emission: CaseEmission,
+        parts: dict[Occurrence, str],
+        path: dict[Occurrence, Identifier],
+        out: list[str],
+        indent: int,
+    ) -> None:
+        scope = emission.scope
+        for variable, occurrence in emission.case_tree.binders[alternative]:
+            name = emission.context.names.fresh(python_name(variable))
+            self.part(occurrence, emission, parts, path, out, indent, name)
+            scope = scope.bind(variable, Local(name))
+        self.statement(
+            emission.term.alternatives[alternative].value,
+            scope,
+            emission.context,
+            out,
+            indent,
+            emission.target,
+        )
+
+
+@dataclass
+class CaseEmission:
+    term: Case
+    case_tree: CaseTree
+    # The scope of the `case`
+    scope: Environment
+    context: DefinitionContext
+    target: Optional[str]
+
+
+def source_hash(source: bytes) -> str:
+    return hashlib.sha256(generator_version + b"\0" + source).hexdigest()
+
+
+def generate_module(
+    statements: Iterable[object], name: str, source: bytes
+) -> str | BackendError:
+    """
+    The text of the Python module of the definitions and data types
+    among `statements`, parsed from `source`.
+    """
+    try:
+        return PythonGenerator(statements).generate(name, source_hash(source))
+    except LoweringStopped as e:
+        return e.error
+
+
+def cached_hash(path: Path) -> Optional[str]:
+    """
+    The source hash written in the module at `path`.
+    """
+    try:
+        with path.open(encoding="utf-8") as file:
+            file.readline()
+            second = file.readline()
+    except OSError:
+        return None
+    prefix = "# source hash: "
+    if not second.startswith(prefix):
+        return None
+    return second[len(prefix) :].strip()
+
+
+def write_module(
+    statements: Iterable[object], name: str, source: bytes, path: Path
+) -> bool | BackendError:
+    """
+    Writes the module of `statements` to `path`, unless the one there
+    was generated from the same `source`. Returns whether it wrote it.
+    """
+    if cached_hash(path) == source_hash(source):
+        return False
+    text = generate_module(statements, name, source)
+    if isinstance(text, BackendError):
+        return text
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+    return True
+
+
+def load_module(path: Path) -> ModuleType:
+    """
+    Imports the generated module at `path`, Python caches its bytecode
+    while the file doesn't change.
+    """
+    spec = importlib.util.spec_from_file_location(path.stem, path)
+    assert spec is not None and spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -1,4 +1,8 @@
-from typing import NamedTuple
+from array import array
+from bisect import bisect_right
+from dataclasses import dataclass
+from itertools import accumulate, islice
+from typing import Iterable, NamedTuple
 from pathlib import Path
 
 from lark import Token
@@ -40,17 +44,132 @@ def token2Range(token: Token) -> Range:
 
 
 def mergeRanges(range1: Range, range2: Range) -> Range:
-    if range1.position_start <= range2.position_start:
-        if range1.position_end <= range2.position_end:
-            return Range(
-                range1.line_start,
-                range2.line_end,
-                range1.column_start,
-                range2.column_end,
-                range1.position_start,
-                range2.position_end,
-            )
-        else:
-            return range1
-    else:
-        return mergeRanges(range2, range1)
+    if range2.position_start < range1.position_start:
+        range1, range2 = range2, range1
+    if range2.position_end <= range1.position_end:
+        return range1
+    return Range(
+        range1.line_start,
+        range2.line_end,
+        range1.column_start,
+        range2.column_end,
+        range1.position_start,
+        range2.position_end,
+    )
+
+
+def mergeManyRanges(ranges: Iterable[Range]) -> Range:
+    """
+    The smallest range that contains every range in `ranges`.
+    """
+    iterator = iter(ranges)
+    first = next(iterator)
+    last = first
+    for _range in iterator:
+        if _range.position_start < first.position_start:
+            first = _range
+        if _range.position_end > last.position_end:
+            last = _range
+    if last.position_end <= first.position_end:
+        return first
+    return Range(
+        first.line_start,
+        last.line_end,
+        first.column_start,
+        last.column_end,
+        first.position_start,
+        last.position_end,
+    )
+
+
+@dataclass(frozen=True, slots=True, order=True)
+class Span:
+    """
+    A compact `Range`: the positions where it starts and ends in the
+    file `file`, lines and columns come from the `LineIndex` of the
+    file when they are needed.
+
+    `file` is the number a compilation gives to a file, spans of
+    different files can't be merged.
+    """
+
+    file: int
+    start: int
+    end: int
+
+    def merge(self, other: "Span") -> "Span":
+        if self.start <= other.start:
+            if other.end <= self.end:
+                return self
+            if self.start == other.start:
+                return other
+            return Span(self.file, self.start, other.end)
+        if self.end <= other.end:
+            return other
+        return Span(self.file, other.start, self.end)
+
+    @staticmethod
+    def merge_many(spans: Iterable["Span"]) -> "Span":
+        """
+        The smallest span that contains every span in `spans`.
+        """
+        iterator = iter(spans)
+        first = next(iterator)
+        last = first
+        for span in iterator:
+            if span.start < first.start:
+                first = span
+            if span.end > last.end:
+                last = span
+        if last.end <= first.end:
+            return first
+        return Span(first.file, first.start, last.end)
+
+    def to_range(self, index: "LineIndex") -> Range:
+        return index.range(self.start, self.end)
+
+
+def token2Span(token: Token, file: int) -> Span:
+    return Span(file, token.start_pos, token.end_pos)  # type: ignore
+
+
+class LineIndex:
+    """
+    The position where every line of a text starts, to go from a
+    position to its line and column and back with a binary search
+    instead of counting line breaks.
+
+    Lines and columns start at 0, like the ranges of the segmenter.
+    """
+
+    def __init__(self, text: str = ""):
+        self.line_starts = array("q", [0])
+        self.length = 0
+        self.extend(text)
+
+    def extend(self, text: str) -> None:
+        """
+        Adds `text` at the end, so a source read by blocks can be
+        indexed while it is read.
+        """
+        lines = text.split("\n")
+        starts = accumulate(
+            (len(line) + 1 for line in lines[:-1]), initial=self.length
+        )
+        self.line_starts.extend(islice(starts, 1, None))
+        self.length += len(text)
+
+    def __len__(self) -> int:
+        return len(self.line_starts)
+
+    def line_column(self, position: int) -> tuple[int, int]:
+        line = bisect_right(self.line_starts, position) - 1
+        return (line, position - self.line_starts[line])
+
+    def position(self, line: int, column: int) -> int:
+        return self.line_starts[line] + column
+
+    def range(self, start: int, end: int) -> Range:
+        line_start, column_start = self.line_column(start)
+        line_end, column_end = self.line_column(end)
+        return Range(line_start, line_end, column_start, column_end, start, end)
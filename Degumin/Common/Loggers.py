@@ -1,15 +1,38 @@
 import logging
 import logging.config
+import os
 from pathlib import Path
 
 log_file = Path(__file__).parent.resolve().parent.resolve() / "logging.config"
 # print(log_file)
 
+# The directory of the log files, the loggers write to stderr without it
+log_directory_variable = "DEGUMIN_LOG_DIRECTORY"
+
+
+class LogFileHandler(logging.FileHandler):
+    """
+    Opens its file, and makes its directory, at the first record instead
+    of when the logger is made, importing Degumin writes nothing.
+    """
+
+    def __init__(self, path: Path):
+        super().__init__(path, mode="w", delay=True)
+
+    def _open(self):
+        Path(self.baseFilename).parent.mkdir(parents=True, exist_ok=True)
+        return super()._open()
+
 
 def get_logger(name: str):
     # print(name)
     log = logging.getLogger(name)
-    handler = logging.FileHandler(f"logs/{name}.log", mode="w")
+    directory = os.environ.get(log_directory_variable)
+    handler: logging.Handler
+    if directory is None:
+        handler = logging.StreamHandler()
+    else:
+        handler = LogFileHandler(Path(directory) / f"{name}.log")
     formatt = logging.Formatter(
         fmt="%(asctime)s - %(filename)s - %(funcName)s - %(lineno)s - %(levelname)s - %(message)s"
     )
@@ -0,0 +1,277 @@
+"""
+Persistent (immutable) collections: an update returns a new collection
+that shares most of its structure with the old one, which stays valid.
+
+- `PersistentVector` is a trie of 32-way nodes with the last elements
+  kept apart in a tail, like the vectors of Clojure. Indexing walks at
+  most log32(n) nodes (4 for a million elements), appending and
+  removing the last element copy at most the tail and one path.
+- `PersistentMap` is a hash array mapped trie (HAMT). Every level uses
+  5 bits of the hash of the key, a node only keeps the children that
+  exist and a bitmap of their positions. Keys with the same hash share
+  a collision node.
+"""
+from typing import Generic, Iterator, Optional, TypeVar, Union
+
+K = TypeVar("K")
+V = TypeVar("V")
+
+BITS = 5
+WIDTH = 1 << BITS
+MASK = WIDTH - 1
+
+
+# Nodes of the vector are tuples, of elements for the leaves and of
+# nodes above. They are filled from the left, only the last one of a
+# level may be partial.
+def new_path(level: int, leaf: tuple) -> tuple:
+    while level > 0:
+        leaf = (leaf,)
+        level -= BITS
+    return leaf
+
+
+def push_leaf(level: int, node: tuple, index: int, leaf: tuple) -> tuple:
+    """
+    `node` with `leaf` added as the leaf of the elements from `index`.
+    """
+    slot = (index >> level) & MASK
+    if level == BITS:
+        child = leaf
+    elif slot < len(node):
+        child = push_leaf(level - BITS, node[slot], index, leaf)
+    else:
+        child = new_path(level - BITS, leaf)
+    # `slot` is the last child or the next one
+    return node[:slot] + (child,)
+
+
+def pop_leaf(level: int, node: tuple) -> tuple:
+    """
+    `node` without its last leaf, and without the nodes left empty.
+    """
+    if level == BITS:
+        return node[:-1]
+    child = pop_leaf(level - BITS, node[-1])
+    if child:
+        return node[:-1] + (child,)
+    return node[:-1]
+
+
+class PersistentVector(Generic[V]):
+    __slots__ = ("count", "shift", "root", "tail")
+
+    def __init__(
+        self,
+        count: int = 0,
+        shift: int = BITS,
+        root: tuple = (),
+        tail: tuple = (),
+    ):
+        self.count = count
+        # The number of bits of an index used below the root
+        self.shift = shift
+        self.root = root
+        self.tail = tail
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self) -> Iterator[V]:
+        for start in range(0, self.count - len(self.tail), WIDTH):
+            yield from self.leaf(start)
+        yield from self.tail
+
+    def __repr__(self) -> str:
+        return f"PersistentVector({list(self)!r})"
+
+    def leaf(self, index: int) -> tuple:
+        """
+        The leaf that has the element `index`, which isn't in the tail.
+        """
+        node = self.root
+        for level in range(self.shift, 0, -BITS):
+            node = node[(index >> level) & MASK]
+        return node
+
+    def __getitem__(self, index: int) -> V:
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        offset = self.count - len(self.tail)
+        if index >= offset:
+            return self.tail[index - offset]
+        return self.leaf(index)[index & MASK]
+
+    def append(self, value: V) -> "PersistentVector[V]":
+        if len(self.tail) < WIDTH:
+            return PersistentVector(
+                self.count + 1, self.shift, self.root, self.tail + (value,)
+            )
+        # The tail is full, it goes in the trie
+        offset = self.count - WIDTH
+        if (offset >> BITS) >= (1 << self.shift):
+            # The root is full too
+            root = (self.root, new_path(self.shift, self.tail))
+            shift = self.shift + BITS
+        else:
+            root = push_leaf(self.shift, self.root, offset, self.tail)
+            shift = self.shift
+        return PersistentVector(self.count + 1, shift, root, (value,))
+
+    def pop(self) -> "PersistentVector[V]":
+        """
+        The vector without its last element.
+        """
+        if self.count == 0:
+            raise IndexError("pop from an empty vector")
+        if len(self.tail) > 1 or self.count == 1:
+            return PersistentVector(
+                self.count - 1, self.shift, self.root, self.tail[:-1]
+            )
+        # The tail becomes empty, the last leaf of the trie replaces it
+        tail = self.leaf(self.count - 2)
+        root = pop_leaf(self.shift, self.root)
+        shift = self.shift
+        if shift > BITS and len(root) == 1:
+            root = root[0]
+            shift -= BITS
+        return PersistentVector(self.count - 1, shift, root, tail)
+
+
+class Leaf:
+    __slots__ = ("hash", "key", "value")
+
+    def __init__(self, _hash: int, key: object, value: object):
+        self.hash = _hash
+        self.key = key
+        self.value = value
+
+
+class Collision:
+    # Keys whose hashes are equal
+    __slots__ = ("hash", "leaves")
+
+    def __init__(self, _hash: int, leaves: tuple[Leaf, ...]):
+        self.hash = _hash
+        self.leaves = leaves
+
+
+class Branch:
+    # `children` has a node for every bit set in `bitmap`, in order
+    __slots__ = ("bitmap", "children")
+
+    def __init__(self, bitmap: int, children: tuple["Node", ...]):
+        self.bitmap = bitmap
+        self.children = children
+
+
+Node = Union[Leaf, Collision, Branch]
+
+# Hashes are made positive, the levels read 5 bits at a time from the
+# lowest ones.
+hash_mask = (1 << 64) - 1
+
+
+def insert(node: Optional[Node], shift: int, leaf: Leaf) -> tuple[Node, bool]:
+    """
+    `node` with `leaf`, and whether it replaced a leaf with the same key.
+    """
+    if node is None:
+        return leaf, False
+    if isinstance(node, Branch):
+        bit = 1 << ((leaf.hash >> shift) & MASK)
+        index = (node.bitmap & (bit - 1)).bit_count()
+        children = node.children
+        if node.bitmap & bit:
+            child, replaced = insert(children[index], shift + BITS, leaf)
+            return (
+                Branch(
+                    node.bitmap,
+                    children[:index] + (child,) + children[index + 1 :],
+                ),
+                replaced,
+            )
+        return (
+            Branch(
+                node.bitmap | bit, children[:index] + (leaf,) + children[index:]
+            ),
+            False,
+        )
+    if node.hash != leaf.hash:
+        # Split on the bits where the hashes differ
+        branch = Branch(1 << ((node.hash >> shift) & MASK), (node,))
+        return insert(branch, shift, leaf)
+    if isinstance(node, Leaf):
+        if node.key == leaf.key:
+            return leaf, True
+        return Collision(leaf.hash, (node, leaf)), False
+    leaves = tuple(other for other in node.leaves if other.key != leaf.key)
+    return (
+        Collision(leaf.hash, leaves + (leaf,)),
+        len(leaves) < len(node.leaves),
+    )
+
+
+def find(node: Optional[Node], _hash: int, key: object) -> Optional[Leaf]:
+    shift = 0
+    while isinstance(node, Branch):
+        bit = 1 << ((_hash >> shift) & MASK)
+        if not node.bitmap & bit:
+            return None
+        node = node.children[(node.bitmap & (bit - 1)).bit_count()]
+        shift += BITS
+    if node is None or node.hash != _hash:
+        return None
+    if isinstance(node, Leaf):
+        return node if node.key == key else None
+    for leaf in node.leaves:
+        if leaf.key == key:
+            return leaf
+    return None
+
+
+def iter_leaves(node: Optional[Node]) -> Iterator[Leaf]:
+    stack = [] if node is None else [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, Leaf):
+            yield node
+        elif isinstance(node, Collision):
+            yield from node.leaves
+        else:
+            stack.extend(node.children)
+
+
+class PersistentMap(Generic[K, V]):
+    __slots__ = ("count", "root")
+
+    def __init__(self, count: int = 0, root: Optional[Node] = None):
+        self.count = count
+        self.root = root
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __contains__(self, key: K) -> bool:
+        return find(self.root, hash(key) & hash_mask, key) is not None
+
+    def __repr__(self) -> str:
+        return f"PersistentMap({dict(self.items())!r})"
+
+    def get(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        leaf = find(self.root, hash(key) & hash_mask, key)
+        if leaf is None:
+            return default
+        return leaf.value  # type:ignore
+
+    def set(self, key: K, value: V) -> "PersistentMap[K, V]":
+        leaf = Leaf(hash(key) & hash_mask, key, value)
+        root, replaced = insert(self.root, 0, leaf)
+        return PersistentMap(self.count + (not replaced), root)
+
+    def items(self) -> Iterator[tuple[K, V]]:
+        """
+        The entries in no particular order.
+        """
+        for leaf in iter_leaves(self.root):
+            yield leaf.key, leaf.value  # type:ignore
@@ -0,0 +1,113 @@
+import codecs
+import mmap
+from array import array
+from bisect import bisect_right
+from pathlib import Path
+from typing import Optional
+
+from Degumin.Common.File import Range
+
+
+class MappedSource:
+    """
+    A UTF-8 file mapped in memory with `mmap`.
+
+    It is read as a text stream, `read` decodes the next block of the
+    file. For every decoded block we remember the character and byte
+    offset of its start, so a `Range` found while reading can be turned
+    later into a view of the bytes or decoded again without keeping the
+    text around.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        with open(path, "rb") as file:
+            size = file.seek(0, 2)
+            if size == 0:
+                # mmap can't map empty files
+                self._map: Optional[mmap.mmap] = None
+            else:
+                self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.size = size
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._byte_position = 0
+        self._character_position = 0
+        self._block_characters = array("q", [0])
+        self._block_bytes = array("q", [0])
+
+    def __enter__(self) -> "MappedSource":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def read(self, size: int) -> str:
+        """
+        Decodes the next `size` bytes, returns "" at the end of the file.
+        """
+        if self._map is None or self.size <= self._byte_position:
+            return ""
+        end = min(self._byte_position + size, self.size)
+        text = ""
+        while not text and self._byte_position < self.size:
+            text = self._decoder.decode(
+                self._map[self._byte_position : end], end == self.size
+            )
+            self._byte_position = end
+            end = min(end + 4, self.size)
+        self._character_position += len(text)
+        # The decoder may hold the first bytes of an unfinished character
+        pending, _ = self._decoder.getstate()
+        self._block_characters.append(self._character_position)
+        self._block_bytes.append(self._byte_position - len(pending))
+        return text
+
+    def _decode_from(self, block: int, characters: int) -> str:
+        """
+        Decodes at least `characters` characters from the start of `block`
+        or until the end of the file.
+        """
+        assert self._map is not None
+        start = self._block_bytes[block]
+        # an UTF-8 character uses at most 4 bytes
+        end = min(start + 4 * characters, self.size)
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        return decoder.decode(self._map[start:end], end == self.size)
+
+    def text(self, start: int, end: int) -> str:
+        """
+        Decodes the characters from `start` to `end`.
+        """
+        if self._map is None or end <= start:
+            return ""
+        block = bisect_right(self._block_characters, start) - 1
+        block_start = self._block_characters[block]
+        decoded = self._decode_from(block, end - block_start)
+        return decoded[start - block_start : end - block_start]
+
+    def byte_position(self, position: int) -> int:
+        if self._map is None:
+            return 0
+        block = bisect_right(self._block_characters, position) - 1
+        block_start = self._block_characters[block]
+        prefix = self._decode_from(block, position - block_start)
+        prefix = prefix[: position - block_start]
+        return self._block_bytes[block] + len(prefix.encode("utf-8"))
+
+    def view(self, _range: Range) -> memoryview:
+        """
+        The bytes of `_range` without copying them.
+        """
+        if self._map is None:
+            return memoryview(b"")
+        start = self.byte_position(_range.position_start)
+        end = self.byte_position(_range.position_end)
+        return memoryview(self._map)[start:end]
+
+    def text_of(self, _range: Range) -> str:
+        return self.text(_range.position_start, _range.position_end)
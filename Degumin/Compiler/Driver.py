@@ -0,0 +1,258 @@
+"""
+Parses and transforms the modules of a compilation, on a pool of
+processes when asked for more than one job.
+
+The pool works on whole modules when there are enough of them to keep
+every process busy. Otherwise the modules are split in segments (see
+`Degumin.Parser.Lexer.iter_segments`) and batches of segments are sent
+to the pool, so a single big module uses all the processes.
+
+Unless the trees are asked for (`keep_trees`), the parser builds the
+Core of a segment while it parses it (see `parse_to_core`).
+"""
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from lark import Lark, Tree
+
+from Degumin.Common.File import FileInfo
+from Degumin.Common.Source import MappedSource
+from Degumin.Core.Transformation import (
+    ToCore,
+    TransformationError,
+    UnsupportedSyntax,
+    parse_to_core,
+    to_core,
+)
+from Degumin.Parser.Lexer import SegmenterError, WordStart, iter_segments
+from Degumin.Parser.Parser import (
+    FileLoadError,
+    LarkLoadError,
+    LoadGrammarError,
+    ParseError,
+    SegmentationError,
+    SegmentCache,
+    default_segment_cache,
+    load_grammar,
+    parse_file,
+    parse_segment,
+)
+
+
+SegmentResult = object | ParseError | UnsupportedSyntax | TransformationError
+
+
+@dataclass
+class ModuleResult:
+    info: FileInfo
+    # One item by segment of the file, in source order
+    segments: list[SegmentResult]
+
+
+CompileResult = ModuleResult | FileLoadError | LoadGrammarError | LarkLoadError
+
+# Number of characters of segments sent together to a worker, sending
+# them one by one costs more than parsing most of them.
+segment_batch_size = 64 * 1024
+
+# The parser of the current worker, see `initialize_worker`
+worker_parser: Optional[Lark | LoadGrammarError | LarkLoadError] = None
+worker_segment_cache: Optional[SegmentCache] = None
+worker_keep_trees = False
+
+
+def initialize_worker(use_parser_cache: bool, keep_trees: bool = False) -> None:
+    global worker_parser, worker_segment_cache, worker_keep_trees
+    worker_keep_trees = keep_trees
+    if keep_trees:
+        worker_parser = load_grammar(use_cache=use_parser_cache)
+        # Without the parser cache the segments are only cached in memory
+        worker_segment_cache = default_segment_cache(use_disk=use_parser_cache)
+    else:
+        worker_parser = load_grammar(
+            use_cache=use_parser_cache, transformer=ToCore()
+        )
+        # The segment cache keeps trees
+        worker_segment_cache = None
+
+
+def transform_segments(
+    info: FileInfo, file: int, segments: list[Tree | ParseError]
+) -> list[SegmentResult]:
+    return [
+        to_core(segment, info, file) if isinstance(segment, Tree) else segment
+        for segment in segments
+    ]
+
+
+def compile_module(path: Path, file: int) -> CompileResult:
+    """
+    Runs in a worker after `initialize_worker`, `file` is the number
+    of `path` in the compilation.
+    """
+    if not isinstance(worker_parser, Lark):
+        assert worker_parser is not None
+        return worker_parser
+    if not worker_keep_trees:
+        return compile_module_inline(worker_parser, path, file)
+    result = parse_file(path, worker_parser, False, worker_segment_cache)
+    if isinstance(result, FileLoadError):
+        return result
+    info, segments = result
+    return ModuleResult(info, transform_segments(info, file, segments))
+
+
+def compile_module_inline(lark: Lark, path: Path, file: int) -> CompileResult:
+    info = FileInfo(path.name, path)
+    segments: list[SegmentResult] = []
+    try:
+        with MappedSource(path) as source:
+            for item in iter_segments(source):
+                if isinstance(item, WordStart):
+                    segments.append(parse_to_core(lark, info, item, file))
+                elif isinstance(item, SegmenterError):
+                    segments.append(SegmentationError(info, item))
+    except (OSError, UnicodeDecodeError):
+        return FileLoadError(info)
+    return ModuleResult(info, segments)
+
+
+def compile_segments(
+    info: FileInfo, file: int, segments: list[WordStart]
+) -> list[SegmentResult] | LoadGrammarError | LarkLoadError:
+    """
+    Runs in a worker after `initialize_worker`. The segments keep their
+    absolute `Range`, so the results need no adjustment.
+    """
+    if not isinstance(worker_parser, Lark):
+        assert worker_parser is not None
+        return worker_parser
+    lark = worker_parser
+    if not worker_keep_trees:
+        return [
+            parse_to_core(lark, info, segment, file) for segment in segments
+        ]
+    return transform_segments(
+        info,
+        file,
+        [
+            parse_segment(lark, info, segment, worker_segment_cache)
+            for segment in segments
+        ],
+    )
+
+
+# A module split in batches of segments, the futures are interleaved with
+# the errors of the segmenter in source order.
+PendingModule = (
+    list[
+        Future[list[SegmentResult] | LoadGrammarError | LarkLoadError]
+        | SegmentationError
+    ]
+    | FileLoadError
+)
+
+
+def submit_segments(
+    executor: ProcessPoolExecutor, path: Path, file: int
+) -> PendingModule:
+    info = FileInfo(path.name, path)
+    pending: PendingModule = []
+    batch: list[WordStart] = []
+    batch_length = 0
+
+    def flush() -> None:
+        nonlocal batch, batch_length
+        if batch:
+            pending.append(executor.submit(compile_segments, info, file, batch))
+            batch = []
+            batch_length = 0
+
+    try:
+        with MappedSource(path) as source:
+            for item in iter_segments(source):
+                if isinstance(item, WordStart):
+                    batch.append(item)
+                    batch_length += len(item.chunk)
+                    if batch_length >= segment_batch_size:
+                        flush()
+                elif isinstance(item, SegmenterError):
+                    flush()
+                    pending.append(SegmentationError(info, item))
+    except (OSError, UnicodeDecodeError):
+        return FileLoadError(info)
+    flush()
+    return pending
+
+
+def collect_segments(path: Path, pending: PendingModule) -> CompileResult:
+    if isinstance(pending, FileLoadError):
+        return pending
+    segments: list[SegmentResult] = []
+    for item in pending:
+        if isinstance(item, SegmentationError):
+            segments.append(item)
+            continue
+        result = item.result()
+        if not isinstance(result, list):
+            return result
+        segments.extend(result)
+    return ModuleResult(FileInfo(path.name, path), segments)
+
+
+def file_size(path: Path) -> int:
+    try:
+        return path.stat().st_size
+    except OSError:
+        return 0
+
+
+def compile_modules(
+    paths: list[Path],
+    jobs: int = 1,
+    use_parser_cache: bool = True,
+    keep_trees: bool = False,
+) -> list[CompileResult]:
+    """
+    Returns the result of every module in the same order as `paths`.
+
+    With `jobs` bigger than 1 the modules are distributed on that number
+    of processes, 0 means one process by CPU. Each process loads the
+    grammar once. If there are fewer modules than processes the modules
+    are split by segments, otherwise the biggest modules are sent first,
+    so a big module doesn't start when the others are already done.
+
+    With `keep_trees` the Core is built from the trees of the segments,
+    which are kept in the segment cache, instead of while parsing.
+    """
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    if jobs == 1 or not paths:
+        initialize_worker(use_parser_cache, keep_trees)
+        return [compile_module(path, i) for i, path in enumerate(paths)]
+    with ProcessPoolExecutor(
+        max_workers=jobs,
+        initializer=initialize_worker,
+        initargs=(use_parser_cache, keep_trees),
+    ) as executor:
+        if len(paths) < jobs:
+            # Batches of a module are submitted while the segmenter reads
+            # the next ones, the workers start before the split ends.
+            pending = [
+                submit_segments(executor, path, i)
+                for i, path in enumerate(paths)
+            ]
+            return [
+                collect_segments(path, item)
+                for path, item in zip(paths, pending)
+            ]
+        by_size = sorted(
+            range(len(paths)), key=lambda i: file_size(paths[i]), reverse=True
+        )
+        futures: dict[int, Future[CompileResult]] = {
+            i: executor.submit(compile_module, paths[i], i) for i in by_size
+        }
+        return [futures[i].result() for i in range(len(paths))]
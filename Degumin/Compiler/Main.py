@@ -1,11 +1,24 @@
-from argparse import ArgumentParser
+from argparse import ArgumentParser, ArgumentTypeError
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Optional
 
+from Degumin.Backend.Bytecode import (
+    BackendError,
+    Program,
+    compile_program,
+    write_program,
+)
+from Degumin.Backend.PythonCode import write_module
 from Degumin.Common.Error import DeguminError
+from Degumin.Common.File import LineIndex, Span
 from Degumin.Common.Loggers import get_logger
-from Degumin.Parser.Parser import load_grammar
+from Degumin.Compiler.Driver import (
+    CompileResult,
+    ModuleResult,
+    compile_modules,
+)
+from Degumin.Core.TypeCheck import check_module
 
 log = get_logger(__name__)
 
@@ -15,6 +28,9 @@ class CompileModulesArguments:
     symbol_paths: list[Path]
     modules: list[Path]
     output_path: Path
+    use_parser_cache: bool = True
+    jobs: int = 1
+    target: str = "bytecode"
 
 
 @dataclass
@@ -36,6 +52,13 @@ class ArgumentParserError(DeguminError):
     pass
 
 
+def jobs_count(text: str) -> int:
+    jobs = int(text)
+    if jobs < 0:
+        raise ArgumentTypeError(f"expected 0 or more jobs, got {jobs}")
+    return jobs
+
+
 def generate_argument_parser() -> ArgumentParser:
     parser = ArgumentParser(
         prog="Degumin",
@@ -89,6 +112,27 @@ def generate_argument_parser() -> ArgumentParser:
         type=str,
         help="Places to look for packages",
     )
+    parser_compiler.add_argument(
+        "-j",
+        "--jobs",
+        type=jobs_count,
+        default=1,
+        metavar="N",
+        help="Number of processes used to parse, 0 uses one by CPU",
+    )
+    parser_compiler.add_argument(
+        "--no-parser-cache",
+        action="store_false",
+        dest="parser_cache",
+        help="Build the parser from the grammar instead of using the cache",
+    )
+    parser_compiler.add_argument(
+        "-t",
+        "--target",
+        choices=["bytecode", "python"],
+        default="bytecode",
+        help="Bytecode for the machine or importable Python modules",
+    )
     parser_compiler.add_argument(
         "modules",
         metavar="PATH",
@@ -100,14 +144,16 @@ def generate_argument_parser() -> ArgumentParser:
     return parser
 
 
-def parse_cli_arguments() -> (
+def parse_cli_arguments(
+    argv: Optional[list[str]] = None,
+) -> (
     ArgumentParserError
     | CompileModulesArguments
     | FormatModulesArguments
     | GenerateDocumentationArguments
 ):
     parser = generate_argument_parser()
-    parser_result = parser.parse_args()
+    parser_result = parser.parse_args(argv)
     match parser_result.sub_parser_name:
         case "format":
             print("Formatting!")
@@ -127,7 +173,12 @@ def parse_cli_arguments() -> (
                 modules = [Path(i) for i in parser_result.modules]
 
             return CompileModulesArguments(
-                symbol_paths, modules, parser_result.output
+                symbol_paths,
+                modules,
+                parser_result.output,
+                parser_result.parser_cache,
+                parser_result.jobs,
+                parser_result.target,
             )
 
         case _:
@@ -135,21 +186,105 @@ def parse_cli_arguments() -> (
             exit()
 
 
-def compile(args: CompileModulesArguments):
-    parser = load_grammar()
-    csts = [parser.parse(i) for i in args.modules]
-    asts = [to_ast(i) for i in csts]
-    resolutions = [
-        symbol_resolution(i, args.symbol_paths, args.modules) for i in asts
-    ]
-    typedAsts = [infer(i, j) for i, j in zip(asts, resolutions)]
-    cores = [core(i) for i in typedAsts]
-    optimizeds = [optimize(i) for i in typedAsts]
+def module_errors(module: ModuleResult) -> list[DeguminError]:
+    """
+    The errors of the segments of `module`, or when it parsed the errors
+    of its type check.
+    """
+    errors = [i for i in module.segments if isinstance(i, DeguminError)]
+    if errors:
+        return errors
+    report = check_module(module.segments)
+    return [d.error for d in report.definitions if d.error is not None]
 
 
-def main() -> None:
-    arguments = parse_cli_arguments()
-    print(arguments)
+def log_errors(module: ModuleResult, errors: list[DeguminError]) -> None:
+    """
+    Logs `errors` with the line and column of the ones that have a span,
+    the lines of the module are only indexed when one of them does.
+    """
+    index: Optional[LineIndex] = None
+    for error in errors:
+        span = getattr(error, "span", None)
+        if not isinstance(span, Span):
+            log.error(f"{module.info.path}: {error}")
+            continue
+        if index is None:
+            index = LineIndex(module.info.path.read_text())
+        line, column = index.line_column(span.start)
+        log.error(f"{module.info.path}:{line + 1}:{column + 1}: {error}")
+
+
+def write_programs(
+    asts: list[CompileResult], output: Path, target: str = "bytecode"
+) -> bool:
+    """
+    Writes every module to `output`, its bytecode in a `.dgb` file or
+    its Python module in a `.py` file named like the module. Returns
+    whether all of them were written.
+    """
+    written_all = True
+    for i in asts:
+        if not isinstance(i, ModuleResult):
+            continue
+        if target == "python":
+            written = write_module(
+                i.segments,
+                i.info.name,
+                i.info.path.read_bytes(),
+                output / i.info.path.with_suffix(".py").name,
+            )
+            if isinstance(written, BackendError):
+                log.error(f"{i.info.path}: {written}")
+                written_all = False
+            continue
+        program = compile_program(i.segments)
+        if isinstance(program, Program):
+            write_program(
+                program, output / i.info.path.with_suffix(".dgb").name
+            )
+        else:
+            log.error(f"{i.info.path}: {program}")
+            written_all = False
+    return written_all
+
+
+def compile(args: CompileModulesArguments) -> bool:
+    """
+    Parses and checks the modules, and writes the ones without errors.
+    Returns whether every module was written.
+    """
+    if args.symbol_paths:
+        # No rule of the grammar imports a module, nothing is looked for
+        log.warning(
+            "Modules can't import others yet, ignoring the paths "
+            + ", ".join(str(path) for path in args.symbol_paths)
+        )
+    asts = compile_modules(args.modules, args.jobs, args.use_parser_cache)
+    checked: list[CompileResult] = []
+    for i in asts:
+        if not isinstance(i, ModuleResult):
+            log.error(f"{i}")
+            continue
+        errors = module_errors(i)
+        log_errors(i, errors)
+        if not errors:
+            checked.append(i)
+    output = Path(args.output_path)
+    output.mkdir(parents=True, exist_ok=True)
+    written = write_programs(checked, output, args.target)
+    return written and len(checked) == len(asts)
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    arguments = parse_cli_arguments(argv)
+    match arguments:
+        case CompileModulesArguments():
+            if not compile(arguments):
+                print("Some modules have errors")
+                exit(1)
+        case _:
+            print(arguments)
 
 
 if __name__ == "__main__":
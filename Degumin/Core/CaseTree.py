@@ -0,0 +1,394 @@
+"""
+Compiles the alternatives of a `case` to a decision tree.
+
+The alternatives of a `Case` are tried in order, matching a value
+against each one tests again what the previous ones tested. A decision
+tree tests every part of the value at most once: a `ConstructorSwitch`
+selects a subtree by the constructor of a part in a dictionary, a
+`LiteralSwitch` by its literal, and a `Leaf` is the alternative that
+matches. The cost of a match depends on the depth of the patterns, not
+on the number of alternatives.
+
+A part of the scrutinee is an `Occurrence`: the positions of the
+arguments of the constructors to follow from the scrutinee to it, `()`
+is the scrutinee. `CaseCompiler.compile` builds the tree of a list of
+alternatives like in "Compiling Pattern Matching to Good Decision Trees"
+(Maranget), testing first the parts the first alternative that may
+match needs. On the way it finds the alternatives that can't be reached
+(`CaseTree.redundant`) and, when a `Signature` gives the constructors of
+every data type, examples of the values no alternative matches
+(`CaseTree.missing`). Without a signature a switch on constructors
+always has a default subtree.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Container, Iterable, Optional, Union
+
+from Degumin.Core.Core import (
+    Alternative,
+    Case,
+    DataType,
+    DefaultCase,
+    Forall,
+    Hole,
+    Identifier,
+    MatchConstructor,
+    MatchLiteralBool,
+    MatchLiteralInt,
+    MatchVariable,
+    Term,
+    VariableDefinition,
+)
+from Degumin.Core.Traversal import iter_terms
+
+Occurrence = tuple[int, ...]
+
+
+@dataclass(slots=True)
+class Leaf:
+    # The position of the alternative in the `case`
+    alternative: int
+
+
+@dataclass(slots=True)
+class Fail:
+    pass
+
+
+@dataclass(slots=True)
+class ConstructorSwitch:
+    occurrence: Occurrence
+    branches: dict[Identifier, "Tree"]
+    # None when the branches have every constructor of the type
+    default: Optional["Tree"]
+
+
+@dataclass(slots=True)
+class LiteralSwitch:
+    occurrence: Occurrence
+    branches: dict[Any, "Tree"]
+    default: Optional["Tree"]
+
+
+Tree = Union[Leaf, Fail, ConstructorSwitch, LiteralSwitch]
+
+
+@dataclass
+class Signature:
+    # By constructor, its data type and its number of arguments
+    constructors: dict[Identifier, tuple[Identifier, int]] = field(
+        default_factory=dict
+    )
+    # By data type, its constructors in source order
+    types: dict[Identifier, list[Identifier]] = field(default_factory=dict)
+
+    @staticmethod
+    def from_statements(statements: Iterable[object]) -> Signature:
+        signature = Signature()
+        for statement in statements:
+            if not isinstance(statement, DataType):
+                continue
+            names = signature.types.setdefault(statement.name, [])
+            for constructor in statement.constructors:
+                names.append(constructor.name)
+                signature.constructors[constructor.name] = (
+                    statement.name,
+                    arity(constructor.arguments),
+                )
+        return signature
+
+
+def arity(_type: Term) -> int:
+    count = 0
+    while isinstance(_type, Forall):
+        count += len(_type.arguments)
+        _type = _type.term
+    return count
+
+
+@dataclass(slots=True)
+class CaseTree:
+    tree: Tree
+    # By alternative, its variables with the part of the value they take,
+    # in the order `Evaluator.pattern_binders` gives them.
+    binders: list[list[tuple[Identifier, Occurrence]]]
+    # The positions of the alternatives that can't be reached
+    redundant: list[int]
+    # Patterns matching values no alternative matches
+    missing: list[Any]
+
+
+# A row of the pattern matrix: the patterns still to test, at the
+# occurrences compiled with the rows, and its alternative.
+Row = tuple[list[Any], int]
+
+
+class CaseCompiler:
+    def __init__(
+        self,
+        constructors: Container[Identifier],
+        signature: Optional[Signature] = None,
+    ):
+        """
+        A `MatchVariable` named like one of `constructors` matches that
+        constructor.
+        """
+        self.constructors = constructors
+        self.signature = signature
+
+    def is_constructor(self, pattern: Any) -> bool:
+        if isinstance(pattern, MatchConstructor):
+            return True
+        return (
+            isinstance(pattern, MatchVariable)
+            and pattern.name in self.constructors
+        )
+
+    def is_wildcard(self, pattern: Any) -> bool:
+        return isinstance(pattern, (DefaultCase, Hole)) or (
+            isinstance(pattern, MatchVariable)
+            and pattern.name not in self.constructors
+        )
+
+    def binders(
+        self, pattern: Any, occurrence: Occurrence = ()
+    ) -> list[tuple[Identifier, Occurrence]]:
+        if isinstance(pattern, MatchVariable):
+            if pattern.name in self.constructors:
+                return []
+            return [(pattern.name, occurrence)]
+        if isinstance(pattern, MatchConstructor):
+            result = []
+            for i, match in enumerate(pattern.matches):
+                result.extend(self.binders(match, occurrence + (i,)))
+            return result
+        return []
+
+    def compile(self, alternatives: list[Alternative]) -> CaseTree:
+        rows: list[Row] = [([a.case], i) for i, a in enumerate(alternatives)]
+        used: set[int] = set()
+        missing: list[Any] = []
+        tree = self.compile_rows(rows, [()], {}, used, missing)
+        return CaseTree(
+            tree,
+            [self.binders(a.case) for a in alternatives],
+            [i for i in range(len(alternatives)) if i not in used],
+            missing,
+        )
+
+    def compile_rows(
+        self,
+        rows: list[Row],
+        occurrences: list[Occurrence],
+        path: dict[Occurrence, Any],
+        used: set[int],
+        missing: list[Any],
+    ) -> Tree:
+        """
+        `path` has what was tested to reach these rows: by occurrence, a
+        constructor and its arity, a literal, or the set of the ones
+        excluded by a default.
+        """
+        if not rows:
+            missing.append(self.witness(path))
+            return Fail()
+        patterns, alternative = rows[0]
+        column = next(
+            (i for i, p in enumerate(patterns) if not self.is_wildcard(p)),
+            None,
+        )
+        if column is None:
+            used.add(alternative)
+            return Leaf(alternative)
+        occurrence = occurrences[column]
+        rest = occurrences[:column] + occurrences[column + 1 :]
+        if self.is_constructor(patterns[column]):
+            return self.switch_constructors(
+                rows, column, occurrences, rest, path, used, missing
+            )
+        literals: dict[Any, None] = {}
+        for row_patterns, _ in rows:
+            pattern = row_patterns[column]
+            if isinstance(pattern, (MatchLiteralInt, MatchLiteralBool)):
+                literals[pattern.literal] = None
+        branches: dict[Any, Tree] = {}
+        for literal in literals:
+            selected = [
+                (p[:column] + p[column + 1 :], a)
+                for p, a in rows
+                if self.is_wildcard(p[column]) or p[column].literal == literal
+            ]
+            branches[literal] = self.compile_rows(
+                selected, rest, {**path, occurrence: literal}, used, missing
+            )
+        default: Optional[Tree] = None
+        booleans = isinstance(patterns[column], MatchLiteralBool)
+        if not booleans or len(literals) < 2:
+            default = self.compile_rows(
+                self.default_rows(rows, column),
+                rest,
+                {**path, occurrence: set(literals)},
+                used,
+                missing,
+            )
+        return LiteralSwitch(occurrence, branches, default)
+
+    def switch_constructors(
+        self,
+        rows: list[Row],
+        column: int,
+        occurrences: list[Occurrence],
+        rest: list[Occurrence],
+        path: dict[Occurrence, Any],
+        used: set[int],
+        missing: list[Any],
+    ) -> ConstructorSwitch:
+        occurrence = occurrences[column]
+        # The constructors of the column with their arity
+        heads: dict[Identifier, int] = {}
+        for patterns, _ in rows:
+            pattern = patterns[column]
+            if isinstance(pattern, MatchConstructor):
+                heads.setdefault(pattern.name, len(pattern.matches))
+            elif self.is_constructor(pattern):
+                heads.setdefault(pattern.name, 0)
+        branches: dict[Identifier, Tree] = {}
+        for name, count in heads.items():
+            selected: list[Row] = []
+            for patterns, alternative in rows:
+                pattern = patterns[column]
+                if self.is_wildcard(pattern):
+                    arguments: list[Any] = [DefaultCase(None)] * count
+                elif pattern.name != name:
+                    continue
+                elif isinstance(pattern, MatchConstructor):
+                    arguments = list(pattern.matches)
+                else:
+                    arguments = []
+                selected.append(
+                    (
+                        patterns[:column] + arguments + patterns[column + 1 :],
+                        alternative,
+                    )
+                )
+            inner = (
+                occurrences[:column]
+                + [occurrence + (i,) for i in range(count)]
+                + occurrences[column + 1 :]
+            )
+            branches[name] = self.compile_rows(
+                selected,
+                inner,
+                {**path, occurrence: (name, count)},
+                used,
+                missing,
+            )
+        default: Optional[Tree] = None
+        others = self.other_constructors(heads)
+        if others is None or others:
+            excluded: Any = set(heads)
+            if others:
+                # An example of a constructor no alternative has
+                name = others[0]
+                excluded = (name, self.signature.constructors[name][1])  # type: ignore
+            default = self.compile_rows(
+                self.default_rows(rows, column),
+                rest,
+                {**path, occurrence: excluded},
+                used,
+                missing,
+            )
+        return ConstructorSwitch(occurrence, branches, default)
+
+    def other_constructors(
+        self, heads: dict[Identifier, int]
+    ) -> Optional[list[Identifier]]:
+        """
+        The constructors of the type of `heads` that aren't in it, None
+        if they aren't known.
+        """
+        if self.signature is None:
+            return None
+        entry = self.signature.constructors.get(next(iter(heads)))
+        if entry is None:
+            return None
+        return [c for c in self.signature.types[entry[0]] if c not in heads]
+
+    def default_rows(self, rows: list[Row], column: int) -> list[Row]:
+        return [
+            (patterns[:column] + patterns[column + 1 :], alternative)
+            for patterns, alternative in rows
+            if self.is_wildcard(patterns[column])
+        ]
+
+    def witness(self, path: dict[Occurrence, Any]) -> Any:
+        """
+        A pattern of the values that follow `path`.
+        """
+        # With an explicit stack, like the read back of the evaluator: the
+        # patterns of the parts done, and a part with whether its
+        # arguments are done.
+        results: list[Any] = []
+        stack: list[tuple[Occurrence, bool]] = [((), False)]
+        while stack:
+            occurrence, done = stack.pop()
+            test = path.get(occurrence)
+            if isinstance(test, tuple):
+                name, count = test
+                if count == 0:
+                    results.append(MatchVariable(name, None))
+                elif not done:
+                    stack.append((occurrence, True))
+                    stack.extend(
+                        (occurrence + (i,), False)
+                        for i in reversed(range(count))
+                    )
+                else:
+                    matches = results[-count:]
+                    del results[-count:]
+                    results.append(MatchConstructor(name, matches, None))
+            elif isinstance(test, bool):
+                results.append(MatchLiteralBool(test, None))
+            elif test is not None and not isinstance(test, set):
+                results.append(MatchLiteralInt(test, None))
+            else:
+                results.append(DefaultCase(None))
+        return results[0]
+
+
+@dataclass
+class CaseReport:
+    # The definition with the `case`
+    name: Identifier
+    case: Case
+    redundant: list[Alternative]
+    missing: list[Any]
+
+
+def case_reports(statements: Iterable[object]) -> list[CaseReport]:
+    """
+    The `case` terms of the definitions among `statements` with
+    redundant alternatives or values they don't match.
+    """
+    statements = list(statements)
+    signature = Signature.from_statements(statements)
+    compiler = CaseCompiler(signature.constructors, signature)
+    reports = []
+    for statement in statements:
+        if not isinstance(statement, VariableDefinition):
+            continue
+        for term in iter_terms(statement.definition):
+            if not isinstance(term, Case):
+                continue
+            tree = compiler.compile(term.alternatives)
+            if tree.redundant or tree.missing:
+                reports.append(
+                    CaseReport(
+                        statement.name,
+                        term,
+                        [term.alternatives[i] for i in tree.redundant],
+                        tree.missing,
+                    )
+                )
+    return reports
@@ -1,22 +1,11 @@
-from dataclasses import dataclass
+from __future__ import annotations
+
+from dataclasses import dataclass, field
 from typing import Generic, NewType, Optional, TypeVar, Union
 
-T = TypeVar("T")
+from Degumin.Common.Persistent import PersistentMap, PersistentVector
 
-Term = Union[
-    "IntValue"[T],
-    "Hole"[T],
-    "Universe"[T],
-    "Variable"[T],
-    "FreeVariable"[T],
-    "Abstraction"[T],
-    "Forall"[T],
-    "Application"[T],
-    "Let"[T],
-    "Constructor"[T],
-    "Case"[T],
-    "Annotation"[T],
-]
+T = TypeVar("T")
 
 Identifier = NewType("Identifier", str)
 
@@ -33,6 +22,13 @@ class Hole(Generic[T]):
     info: T
 
 
+@dataclass
+class MetaVariable(Generic[T]):
+    # A metavariable of `Degumin.Core.Unification`, never parsed
+    number: int
+    info: T
+
+
 @dataclass
 class Universe(Generic[T]):
     value: int
@@ -54,7 +50,7 @@ class FreeVariable(Generic[T]):
 
 @dataclass
 class Abstraction(Generic[T]):
-    original_arguments: list["DefaultCase"[T] | FreeVariable[T] | Hole[T]]
+    original_arguments: list[DefaultCase[T] | FreeVariable[T] | Hole[T]]
     term: Term[T]
     info: T
 
@@ -150,6 +146,23 @@ class Annotation(Generic[T]):
     info: T
 
 
+Term = Union[
+    IntValue[T],
+    Hole[T],
+    MetaVariable[T],
+    Universe[T],
+    Variable[T],
+    FreeVariable[T],
+    Abstraction[T],
+    Forall[T],
+    Application[T],
+    Let[T],
+    Constructor[T],
+    Case[T],
+    Annotation[T],
+]
+
+
 @dataclass
 class VariableDeclaration(Generic[T]):
     name: Identifier
@@ -187,21 +200,47 @@ class Module(Generic[T]):
     info: T
 
 
-@dataclass
+@dataclass(frozen=True)
 class Context(Generic[T]):
-    parent: "Context"
-    local: dict[Identifier | int, tuple[Term[T], Term[T]]]
+    """
+    The variables in scope, each with a pair of terms.
+
+    The variables bound by binders are in `bound`, the innermost last.
+    A `Variable` is looked up by its `number`, its de Bruijn index (0
+    for the innermost binder), that is the entry `len(bound) - 1 - number`.
+    Named variables are in `named`.
+
+    Both are persistent: `bind` and `extend` return a new context that
+    shares its structure with this one, which is unchanged. Leaving a
+    binder is going back to the previous context, or `unbind`.
+    """
+
+    bound: PersistentVector[tuple[Term[T], Term[T]]] = field(
+        default_factory=PersistentVector
+    )
+    named: PersistentMap[Identifier, tuple[Term[T], Term[T]]] = field(
+        default_factory=PersistentMap
+    )
 
     def lookup(
         self, name: Identifier | int
     ) -> Optional[tuple[Term[T], Term[T]]]:
-        result1 = self.local.get(name, None)
-        if result1 is None:
-            return self.parent.lookup(name)
-        else:
-            return result1
+        if isinstance(name, int):
+            if 0 <= name < len(self.bound):
+                return self.bound[len(self.bound) - 1 - name]
+            return None
+        return self.named.get(name)
+
+    def bind(self, entry: tuple[Term[T], Term[T]]) -> "Context[T]":
+        return Context(self.bound.append(entry), self.named)
+
+    def unbind(self) -> "Context[T]":
+        return Context(self.bound.pop(), self.named)
 
     def extend(
-        self, new: dict[Identifier | int, tuple[Term[T], Term[T]]]
-    ) -> "Context":
-        return Context(self, new)
+        self, new: dict[Identifier, tuple[Term[T], Term[T]]]
+    ) -> "Context[T]":
+        named = self.named
+        for name, entry in new.items():
+            named = named.set(name, entry)
+        return Context(self.bound, named)
@@ -0,0 +1,691 @@
+"""
+Normalization by evaluation of Core terms.
+
+`Evaluator.evaluate` turns a term into a `Value`. An abstraction becomes
+a closure with the environment it was evaluated in, applying it binds
+the argument in that environment and evaluates the body, terms are
+never copied by a substitution. A variable with nothing to reduce (a
+free name, a hole or, while reading back, a binder) is a neutral value
+that keeps the eliminations (applications and `case`) applied to it. A
+`case` on a constructor value with a neutral part its alternatives test
+is stuck too, its neutral value keeps the scrutinee.
+`Evaluator.quote` reads a value back to a term in normal form, and
+`normalize` does both.
+
+A `Variable` is looked up by its de Bruijn index, a `FreeVariable` by
+name: first in the binders around it, then in the definitions given to
+the evaluator, which are unfolded when they are reached. The names of
+`constructors` are constructors and the other names are free. Every
+binder, `let` definition and variable of a pattern takes one index. The
+definitions of a recursive `let` must be functions, their closures see
+each other.
+
+Every beta reduction, `let` definition, unfolding and `case` reduction
+is a step. `steps` counts them and with a `fuel` the evaluation stops
+with `OutOfFuel` after that many steps, as a recursive definition may
+not terminate.
+
+With a `MetaStore` (see `Degumin.Core.Unification`) the holes it knows
+are its metavariables applied to the variables of their context, and
+the solved metavariables are replaced by their solutions when a value
+is forced: before a `case` selects an alternative and before a value
+is read back. The others are neutral.
+
+The evaluation recurses on the nesting of the evaluated terms. The read
+back uses an explicit stack: a normal form can be much deeper than the
+term that computes it, like the result of Church numeral arithmetic.
+The terms read back have `None` as info, but binders and patterns are
+the ones of the evaluated terms.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Optional, Union
+
+from Degumin.Common.Error import DeguminError
+from Degumin.Common.Persistent import PersistentMap, PersistentVector
+from Degumin.Core.CaseTree import (
+    CaseCompiler,
+    CaseTree,
+    ConstructorSwitch,
+    Fail,
+    Leaf,
+    Occurrence,
+)
+from Degumin.Core.Core import (
+    Abstraction,
+    Alternative,
+    Annotation,
+    Application,
+    Case,
+    Constructor,
+    Forall,
+    FreeVariable,
+    Hole,
+    Identifier,
+    IntValue,
+    Let,
+    MetaVariable,
+    Term,
+    Universe,
+    Variable,
+)
+
+if TYPE_CHECKING:
+    from Degumin.Core.Unification import MetaStore
+
+
+@dataclass(slots=True)
+class Environment:
+    values: PersistentVector["Value"] = field(default_factory=PersistentVector)
+    # The position in `values` of the named ones, the last one bound
+    # hides the others.
+    names: PersistentMap[Identifier, int] = field(default_factory=PersistentMap)
+
+    def bind(self, name: Optional[Identifier], value: "Value") -> "Environment":
+        names = self.names
+        if name is not None:
+            names = names.set(name, len(self.values))
+        return Environment(self.values.append(value), names)
+
+
+@dataclass(slots=True)
+class Closure:
+    environment: Environment
+    # Binds the argument number `position` of `term`, the next ones are
+    # in other closures.
+    term: Abstraction | Forall
+    position: int
+
+
+@dataclass(slots=True)
+class LambdaValue:
+    closure: Closure
+
+
+@dataclass(slots=True)
+class PiValue:
+    domain: "Value"
+    closure: Closure
+
+
+@dataclass(slots=True)
+class UniverseValue:
+    level: int
+
+
+@dataclass(slots=True)
+class LiteralValue:
+    value: int
+
+
+@dataclass(slots=True)
+class ConstructorValue:
+    name: Identifier
+    arguments: tuple["Value", ...]
+
+
+@dataclass(slots=True)
+class BoundHead:
+    # A binder read back, by de Bruijn level
+    level: int
+    name: Optional[Identifier]
+
+
+@dataclass(slots=True)
+class FreeHead:
+    name: Identifier
+
+
+@dataclass(slots=True)
+class HoleHead:
+    name: Identifier
+
+
+@dataclass(slots=True)
+class MetaHead:
+    number: int
+
+
+@dataclass(slots=True, eq=False)
+class StuckCaseHead:
+    # A `case` on a constructor value whose tree needs one of its parts
+    # that is neutral
+    scrutinee: "Value"
+    alternatives: list[Alternative]
+    environment: Environment
+
+
+@dataclass(slots=True)
+class ApplicationFrame:
+    argument: "Value"
+
+
+@dataclass(slots=True)
+class CaseFrame:
+    alternatives: list[Alternative]
+    environment: Environment
+
+
+Head = BoundHead | FreeHead | HoleHead | MetaHead | StuckCaseHead
+Frame = ApplicationFrame | CaseFrame
+
+
+@dataclass(slots=True)
+class NeutralValue:
+    head: Head
+    spine: PersistentVector[Frame]
+
+
+Value = Union[
+    LambdaValue,
+    PiValue,
+    UniverseValue,
+    LiteralValue,
+    ConstructorValue,
+    NeutralValue,
+]
+
+empty_spine: PersistentVector[Frame] = PersistentVector()
+
+
+class EvaluationError(DeguminError):
+    pass
+
+
+@dataclass
+class OutOfFuel(EvaluationError):
+    fuel: int
+
+
+@dataclass
+class NotAFunction(EvaluationError):
+    value: Value
+
+
+@dataclass
+class NoMatchingAlternative(EvaluationError):
+    value: Value
+
+
+@dataclass
+class UnboundIndex(EvaluationError):
+    number: int
+
+
+@dataclass
+class RecursiveValue(EvaluationError):
+    # A recursive `let` defines it with something else than a function
+    name: Identifier
+
+
+class EvaluationStopped(Exception):
+    def __init__(self, error: EvaluationError):
+        super().__init__(error)
+        self.error = error
+
+
+def binder_name(binder: Any) -> Optional[Identifier]:
+    if isinstance(binder, FreeVariable):
+        return binder.name
+    return None
+
+
+def bound(level: int, name: Optional[Identifier]) -> NeutralValue:
+    return NeutralValue(BoundHead(level, name), empty_spine)
+
+
+@dataclass(slots=True)
+class Pending:
+    # Builds a term from the read back of the last `count` values
+    build: Callable[[list[Term[None]]], Term[None]]
+    count: int
+
+
+class Evaluator:
+    def __init__(
+        self,
+        definitions: Optional[dict[Identifier, Term]] = None,
+        constructors: Iterable[Identifier] = (),
+        fuel: Optional[int] = None,
+        metas: Optional[MetaStore] = None,
+    ):
+        self.definitions = definitions or {}
+        self.constructors = frozenset(constructors)
+        self.case_compiler = CaseCompiler(self.constructors)
+        # By id of the alternatives of a `case`, them and their tree
+        self.case_trees: dict[int, tuple[list[Alternative], CaseTree]] = {}
+        self.fuel = fuel
+        self.metas = metas
+        # Unsolved metavariables read back, a term read back has none if
+        # it didn't change.
+        self.read_metas = 0
+        self.steps = 0
+        # The values of the definitions already unfolded
+        self.unfolded: dict[Identifier, Value] = {}
+        self.evaluators: dict[type, Callable[[Any, Environment], Value]] = {
+            Variable: self.evaluate_variable,
+            FreeVariable: self.evaluate_free_variable,
+            Application: self.evaluate_application,
+            Abstraction: self.evaluate_abstraction,
+            Forall: self.evaluate_forall,
+            Let: self.evaluate_let,
+            Case: self.evaluate_case,
+            Annotation: self.evaluate_annotation,
+            IntValue: lambda term, _: LiteralValue(term.value),
+            Universe: lambda term, _: UniverseValue(term.value),
+            Hole: self.evaluate_hole,
+            MetaVariable: lambda term, _: self.meta(term.number),
+            Constructor: lambda term, _: ConstructorValue(term.name, ()),
+        }
+
+    def step(self) -> None:
+        self.steps += 1
+        if self.fuel is not None and self.steps > self.fuel:
+            raise EvaluationStopped(OutOfFuel(self.fuel))
+
+    def normalize(self, term: Term) -> Term[None] | EvaluationError:
+        try:
+            return self.quote(self.evaluate(term))
+        except EvaluationStopped as e:
+            return e.error
+
+    def evaluate(
+        self, term: Term, environment: Optional[Environment] = None
+    ) -> Value:
+        """
+        May raise `EvaluationStopped`.
+        """
+        if environment is None:
+            environment = Environment()
+        return self.evaluators[type(term)](term, environment)
+
+    def evaluate_variable(
+        self, term: Variable, environment: Environment
+    ) -> Value:
+        size = len(environment.values)
+        if not 0 <= term.number < size:
+            raise EvaluationStopped(UnboundIndex(term.number))
+        return environment.values[size - 1 - term.number]
+
+    def evaluate_free_variable(
+        self, term: FreeVariable, environment: Environment
+    ) -> Value:
+        name = term.name
+        position = environment.names.get(name)
+        if position is not None:
+            return environment.values[position]
+        if name in self.constructors:
+            return ConstructorValue(name, ())
+        definition = self.definitions.get(name)
+        if definition is None:
+            return NeutralValue(FreeHead(name), empty_spine)
+        self.step()
+        value = self.unfolded.get(name)
+        if value is None:
+            value = self.evaluate(definition, Environment())
+            self.unfolded[name] = value
+        return value
+
+    def evaluate_application(
+        self, term: Application, environment: Environment
+    ) -> Value:
+        function = self.evaluate(term.left, environment)
+        return self.apply(function, self.evaluate(term.right, environment))
+
+    def evaluate_abstraction(
+        self, term: Abstraction, environment: Environment
+    ) -> Value:
+        if not term.original_arguments:
+            return self.evaluate(term.term, environment)
+        return LambdaValue(Closure(environment, term, 0))
+
+    def evaluate_forall(self, term: Forall, environment: Environment) -> Value:
+        if not term.arguments:
+            return self.evaluate(term.term, environment)
+        domain = self.evaluate(term.arguments[0][1], environment)  # type:ignore
+        return PiValue(domain, Closure(environment, term, 0))
+
+    def evaluate_let(self, term: Let, environment: Environment) -> Value:
+        if term.isRecursive:
+            environment = self.recursive_environment(term, environment)
+            return self.evaluate(term.term, environment)
+        for name, definition in term.definitions.items():
+            self.step()
+            value = self.evaluate(definition, environment)
+            environment = environment.bind(name, value)
+        return self.evaluate(term.term, environment)
+
+    def recursive_environment(
+        self, term: Let, environment: Environment
+    ) -> Environment:
+        """
+        `environment` with the functions of a recursive `let`, the
+        environment of their closures is the one they are bound in.
+        """
+        closures = []
+        for name, definition in term.definitions.items():
+            while isinstance(definition, Annotation):
+                definition = definition.expression
+            if (
+                not isinstance(definition, Abstraction)
+                or not definition.original_arguments
+            ):
+                raise EvaluationStopped(RecursiveValue(name))
+            self.step()
+            closures.append(Closure(environment, definition, 0))
+            environment = environment.bind(name, LambdaValue(closures[-1]))
+        for closure in closures:
+            closure.environment = environment
+        return environment
+
+    def evaluate_hole(self, term: Hole, environment: Environment) -> Value:
+        number = None
+        if self.metas is not None:
+            number = self.metas.hole_meta(term, len(environment.values))
+        if number is None:
+            return NeutralValue(HoleHead(term.name), empty_spine)
+        # A metavariable takes every variable of its context
+        value = self.meta(number)
+        for argument in environment.values:
+            value = self.apply(value, argument)
+        return value
+
+    def meta(self, number: int) -> Value:
+        if self.metas is None:
+            return NeutralValue(MetaHead(number), empty_spine)
+        number = self.metas.find(number)
+        solution = self.metas.solutions[number]
+        if solution is None:
+            return NeutralValue(MetaHead(number), empty_spine)
+        return solution
+
+    def force(self, value: Value) -> Value:
+        """
+        `value` with the solutions of the metavariables at its head.
+        """
+        while isinstance(value, NeutralValue) and self.metas is not None:
+            head = value.head
+            if isinstance(head, MetaHead):
+                solution = self.metas.solutions[self.metas.find(head.number)]
+                if solution is None:
+                    return value
+            elif isinstance(head, StuckCaseHead):
+                # A solution may have made the part it needs known
+                solution = self.select(
+                    head.scrutinee, head.alternatives, head.environment
+                )
+                if isinstance(solution, NeutralValue) and isinstance(
+                    solution.head, StuckCaseHead
+                ):
+                    return value
+            else:
+                return value
+            for frame in value.spine:
+                if isinstance(frame, ApplicationFrame):
+                    solution = self.apply(solution, frame.argument)
+                else:
+                    solution = self.select(
+                        solution, frame.alternatives, frame.environment
+                    )
+            value = solution
+        return value
+
+    def evaluate_case(self, term: Case, environment: Environment) -> Value:
+        scrutinee = self.evaluate(term.expression, environment)
+        return self.select(scrutinee, term.alternatives, environment)
+
+    def select(
+        self,
+        scrutinee: Value,
+        alternatives: list[Alternative],
+        environment: Environment,
+    ) -> Value:
+        """
+        The value of the first of `alternatives` matching `scrutinee`,
+        found with their decision tree.
+        """
+        entry = self.case_trees.get(id(alternatives))
+        if entry is None:
+            entry = (alternatives, self.case_compiler.compile(alternatives))
+            self.case_trees[id(alternatives)] = entry
+        case_tree = entry[1]
+        scrutinee = self.force(scrutinee)
+        parts: dict[Occurrence, Value] = {(): scrutinee}
+        tree = case_tree.tree
+        while not isinstance(tree, Leaf):
+            if isinstance(tree, Fail):
+                raise EvaluationStopped(NoMatchingAlternative(scrutinee))
+            value = self.part(parts, tree.occurrence)
+            if isinstance(value, NeutralValue):
+                if isinstance(scrutinee, NeutralValue):
+                    frame = CaseFrame(alternatives, environment)
+                    return NeutralValue(
+                        scrutinee.head, scrutinee.spine.append(frame)
+                    )
+                # A part of a constructor value blocks it
+                head = StuckCaseHead(scrutinee, alternatives, environment)
+                return NeutralValue(head, empty_spine)
+            subtree = None
+            if isinstance(tree, ConstructorSwitch):
+                if isinstance(value, ConstructorValue):
+                    subtree = tree.branches.get(value.name)
+            elif isinstance(value, LiteralValue):
+                subtree = tree.branches.get(value.value)
+            if subtree is None:
+                subtree = tree.default
+                if subtree is None:
+                    raise EvaluationStopped(NoMatchingAlternative(scrutinee))
+            tree = subtree
+        self.step()
+        for name, occurrence in case_tree.binders[tree.alternative]:
+            environment = environment.bind(name, self.part(parts, occurrence))
+        return self.evaluate(alternatives[tree.alternative].value, environment)
+
+    def part(
+        self, parts: dict[Occurrence, Value], occurrence: Occurrence
+    ) -> Value:
+        """
+        The part of the scrutinee at `occurrence`, its parents were
+        matched with a constructor.
+        """
+        value = parts.get(occurrence)
+        if value is None:
+            parent = self.part(parts, occurrence[:-1])
+            assert isinstance(parent, ConstructorValue)
+            if occurrence[-1] >= len(parent.arguments):
+                raise EvaluationStopped(NoMatchingAlternative(parent))
+            value = self.force(parent.arguments[occurrence[-1]])
+            parts[occurrence] = value
+        return value
+
+    def evaluate_annotation(
+        self, term: Annotation, environment: Environment
+    ) -> Value:
+        return self.evaluate(term.expression, environment)
+
+    def apply(self, function: Value, argument: Value) -> Value:
+        if isinstance(function, LambdaValue):
+            self.step()
+            return self.instantiate(function.closure, argument)
+        if isinstance(function, NeutralValue):
+            frame = ApplicationFrame(argument)
+            return NeutralValue(function.head, function.spine.append(frame))
+        if isinstance(function, ConstructorValue):
+            return ConstructorValue(
+                function.name, function.arguments + (argument,)
+            )
+        raise EvaluationStopped(NotAFunction(function))
+
+    def instantiate(self, closure: Closure, argument: Value) -> Value:
+        """
+        The body of `closure` with `argument` for its binder.
+        """
+        term, position = closure.term, closure.position
+        if isinstance(term, Abstraction):
+            binders = term.original_arguments
+            environment = closure.environment.bind(
+                binder_name(binders[position]), argument
+            )
+            if position + 1 < len(binders):
+                return LambdaValue(Closure(environment, term, position + 1))
+            return self.evaluate(term.term, environment)
+        arguments: list = term.arguments
+        environment = closure.environment.bind(
+            binder_name(arguments[position][0]), argument
+        )
+        if position + 1 < len(arguments):
+            domain = self.evaluate(arguments[position + 1][1], environment)
+            return PiValue(domain, Closure(environment, term, position + 1))
+        return self.evaluate(term.term, environment)
+
+    def pattern_binders(self, pattern: Any) -> list[Identifier]:
+        """
+        The variables bound by `pattern`, from left to right.
+        """
+        return [name for name, _ in self.case_compiler.binders(pattern)]
+
+    def quote(self, value: Value, depth: int = 0) -> Term[None]:
+        """
+        The normal form of `value` under `depth` binders. May raise
+        `EvaluationStopped`.
+        """
+        results: list[Term[None]] = []
+        stack: list[Pending | tuple[Value, int]] = [(value, depth)]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, Pending):
+                start = len(results) - item.count
+                term = item.build(results[start:])
+                del results[start:]
+                results.append(term)
+                continue
+            build, children = self.expand(*item)
+            if not children:
+                results.append(build([]))
+                continue
+            stack.append(Pending(build, len(children)))
+            stack.extend(reversed(children))
+        return results[0]
+
+    def expand(
+        self, value: Value, depth: int
+    ) -> tuple[
+        Callable[[list[Term[None]]], Term[None]], list[tuple[Value, int]]
+    ]:
+        """
+        The values to read back for `value` and how to build its term
+        from theirs.
+        """
+        value = self.force(value)
+        if isinstance(value, LambdaValue):
+            closure = value.closure
+            binder = closure.term.original_arguments[  # type:ignore
+                closure.position
+            ]
+            body = self.instantiate(closure, bound(depth, binder_name(binder)))
+            return (
+                lambda terms: Abstraction([binder], terms[0], None),
+                [(body, depth + 1)],
+            )
+        if isinstance(value, PiValue):
+            closure = value.closure
+            binder = closure.term.arguments[closure.position][0]  # type:ignore
+            body = self.instantiate(closure, bound(depth, binder_name(binder)))
+            return (
+                lambda terms: Forall(
+                    [(binder, terms[0])], terms[1], None  # type:ignore
+                ),
+                [(value.domain, depth), (body, depth + 1)],
+            )
+        if isinstance(value, UniverseValue):
+            level = value.level
+            return lambda _: Universe(level, None), []
+        if isinstance(value, LiteralValue):
+            literal = value.value
+            return lambda _: IntValue(literal, None), []
+        if isinstance(value, ConstructorValue):
+            name = value.name
+
+            def build_constructor(terms: list[Term[None]]) -> Term[None]:
+                term: Term[None] = FreeVariable(name, None)
+                for argument in terms:
+                    term = Application(term, argument, None)
+                return term
+
+            return build_constructor, [(a, depth) for a in value.arguments]
+        return self.expand_neutral(value, depth)
+
+    def expand_neutral(
+        self, value: NeutralValue, depth: int
+    ) -> tuple[
+        Callable[[list[Term[None]]], Term[None]], list[tuple[Value, int]]
+    ]:
+        head = value.head
+        children: list[tuple[Value, int]] = []
+        head_term: Optional[Term[None]] = None
+        if isinstance(head, StuckCaseHead):
+            # Read back as the `case` it is, before the spine
+            stuck = CaseFrame(head.alternatives, head.environment)
+            children.append((head.scrutinee, depth))
+            children.extend(self.alternative_bodies(stuck, depth))
+        elif isinstance(head, BoundHead):
+            name = head.name or Identifier("_")
+            head_term = Variable(depth - 1 - head.level, name, None)
+        elif isinstance(head, FreeHead):
+            head_term = FreeVariable(head.name, None)
+        elif isinstance(head, MetaHead):
+            self.read_metas += 1
+            head_term = MetaVariable(head.number, None)
+        else:
+            head_term = Hole(head.name, None)
+        frames = list(value.spine)
+        for frame in frames:
+            if isinstance(frame, ApplicationFrame):
+                children.append((frame.argument, depth))
+            else:
+                children.extend(self.alternative_bodies(frame, depth))
+
+        def build(terms: list[Term[None]]) -> Term[None]:
+            if head_term is None:
+                assert isinstance(head, StuckCaseHead)
+                alternatives = [
+                    Alternative(a.case, terms[1 + i], None)
+                    for i, a in enumerate(head.alternatives)
+                ]
+                term: Term[None] = Case(terms[0], alternatives, None)
+                position = 1 + len(alternatives)
+            else:
+                term = head_term
+                position = 0
+            for frame in frames:
+                if isinstance(frame, ApplicationFrame):
+                    term = Application(term, terms[position], None)
+                    position += 1
+                    continue
+                alternatives = [
+                    Alternative(a.case, terms[position + i], None)
+                    for i, a in enumerate(frame.alternatives)
+                ]
+                position += len(alternatives)
+                term = Case(term, alternatives, None)
+            return term
+
+        return build, children
+
+    def alternative_bodies(
+        self, frame: CaseFrame, depth: int
+    ) -> list[tuple[Value, int]]:
+        """
+        The values of the alternatives of `frame` with their pattern
+        variables bound, to read back under `depth` binders.
+        """
+        result = []
+        for alternative in frame.alternatives:
+            environment = frame.environment
+            names = self.pattern_binders(alternative.case)
+            for i, name in enumerate(names):
+                environment = environment.bind(name, bound(depth + i, name))
+            body = self.evaluate(alternative.value, environment)
+            result.append((body, depth + len(names)))
+        return result
@@ -0,0 +1,108 @@
+"""
+Hash-consing of Core terms: a `HashConsTable` gives back the same object
+for terms that are equal when their `info` is ignored. Two terms interned
+in the same table are equal exactly when they are the same object, so
+comparing them is `a is b` instead of a walk of both, and a subterm that
+appears many times is stored once.
+
+The table keeps its terms through weak references, a term is dropped
+from it when nothing else uses it.
+
+Interning is optional, the rest of Core doesn't depend on it, but an
+interned term is shared and must not be mutated. Holes aren't interned,
+each one is a different unknown. The terms around a hole are interned,
+with the hole as part of their key by identity, so they are only shared
+with terms holding the same hole. The `info` of an interned node is the
+one of the first node of its shape that was interned, so a pass that
+reports positions should keep the original term.
+
+Whether it saves memory depends on the sharing. With the default
+arguments of `benchmarks.hash_cons`, the declared types (5391 nodes, 2
+distinct) go from 1804 KB to 263 KB. The definitions (16173 nodes, 7193
+distinct) go from 5529 KB to 6550 KB: the entries of the table cost
+more than the nodes they save. Intern types and other repeated terms,
+not whole definitions.
+"""
+from dataclasses import fields, is_dataclass
+from typing import Any, Hashable, TypeVar
+from weakref import WeakValueDictionary
+
+from Degumin.Core.Core import Hole, Term
+from Degumin.Core.Traversal import CoreTransformer, children
+
+T = TypeVar("T")
+
+# The fields of a node type, without `info`
+field_names: dict[type, tuple[str, ...]] = {}
+
+
+def names_of(_type: type) -> tuple[str, ...]:
+    names = field_names.get(_type)
+    if names is None:
+        names = tuple(f.name for f in fields(_type) if f.name != "info")
+        field_names[_type] = names
+    return names
+
+
+def shallow_key(term: Term[T]) -> Hashable:
+    """
+    The shape of `term` without `info`. Its subterms must be interned
+    already, they are part of the key by identity. Binders and patterns
+    aren't subterms (see `children`), they are part of the key by value.
+    """
+    subterms = {id(child) for child in children(term)}
+
+    def key(value: Any) -> Hashable:
+        if id(value) in subterms:
+            return id(value)
+        if is_dataclass(value):
+            return (
+                type(value),
+                *(key(getattr(value, name)) for name in names_of(type(value))),
+            )
+        if isinstance(value, (list, tuple)):
+            return tuple(key(item) for item in value)
+        if isinstance(value, dict):
+            return tuple((name, key(item)) for name, item in value.items())
+        # Names and literals, `True == 1` but the type of their node
+        # tells them apart.
+        return value
+
+    return key(term)
+
+
+class HashConsTable(CoreTransformer[T]):
+    def __init__(self) -> None:
+        # The ids in a key are the ones of subterms of the value, they
+        # live as long as the value and so as long as the entry.
+        self.table: WeakValueDictionary[Hashable, Term[T]]
+        self.table = WeakValueDictionary()
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def intern(self, term: Term[T]) -> Term[T]:
+        """
+        The shared term equal to `term` (ignoring `info`), built from
+        the bottom up so that every subterm is shared too.
+        """
+        return self.transform(term)
+
+    def node(self, term: Term[T]) -> Term[T]:
+        """
+        Like `intern` for a node whose subterms were interned already in
+        this table, it doesn't look at them.
+        """
+        if isinstance(term, Hole):
+            # Every hole of the source is a metavariable of its own, so
+            # two holes of the same name aren't shared.
+            return term
+        key = shallow_key(term)
+        shared = self.table.get(key)
+        if shared is None:
+            self.table[key] = term
+            return term
+        return shared
+
+    def post(self, term: Term[T]) -> Term[T]:
+        return self.node(term)
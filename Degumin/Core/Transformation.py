@@ -1,14 +1,29 @@
 from typing import Generic, NewType, Optional, TypeVar, Union
 
-from lark import Token, Transformer, Tree, v_args
+from dataclasses import dataclass
 
-from Degumin.Common.File import Range, mergeRanges, token2Range
+from lark import Lark, Token, Transformer, Tree, v_args
+from lark.exceptions import VisitError
+
+from Degumin.Common.Error import DeguminError
+from Degumin.Common.File import FileInfo, Span, token2Span
 from Degumin.Core.Core import (
+    Abstraction,
+    Alternative,
+    Annotation,
+    Application,
+    Case,
     Constructor,
     DataType,
+    DefaultCase,
+    Forall,
     FreeVariable,
     Hole,
+    Identifier,
     IntValue,
+    Let,
+    MatchConstructor,
+    MatchVariable,
     Module,
     ModuleHeader,
     Term,
@@ -16,60 +31,157 @@ from Degumin.Core.Core import (
     VariableDeclaration,
     VariableDefinition,
 )
+from Degumin.Parser.Lexer import WordStart
+from Degumin.Parser.Parser import ParseError, parse_chunk, shift_parse_error
 
 T = TypeVar("T")
 T2 = TypeVar("T2")
 
+Argument = DefaultCase[Span] | FreeVariable[Span] | Hole[Span]
+Pattern = (
+    DefaultCase[Span]
+    | Hole[Span]
+    | MatchVariable[Span]
+    | MatchConstructor[Span]
+)
+
+
+# ToCore failed on a tree, this is a bug in ToCore.
+@dataclass
+class TransformationError(DeguminError):
+    info: FileInfo
+    msg: str
+
+
+# The grammar accepts it but Core can't represent it yet.
+@dataclass
+class UnsupportedSyntax(DeguminError):
+    info: FileInfo
+    span: Span
+    msg: str
+
+
+class SyntaxStopped(Exception):
+    """
+    Raised by `ToCore`, the file of the span is only known by its
+    caller, which returns an `UnsupportedSyntax`.
+    """
+
+    def __init__(self, span: Span, msg: str):
+        super().__init__(msg)
+        self.span = span
+        self.msg = msg
+
+
+def _atom(children: tuple[Token | Term[Span], ...]) -> Term[Span]:
+    """
+    The term of an `_atom_term` inlined in its parent, the parentheses
+    around a term don't make a Core node.
+    """
+    if len(children) == 3:
+        term = children[1]
+    else:
+        term = children[0]
+    assert not isinstance(term, Token)
+    return term
+
 
 @v_args(inline=True)
 class ToCore(Transformer):
+    """
+    `file` is the number of the file in the compilation, see `Span`.
+    `offset` is added to the positions of the tokens, when we transform
+    a segment while it is parsed (see `parse_to_core`) the tokens have
+    positions relative to it.
+    """
+
+    def __init__(self, file: int = 0, offset: int = 0):
+        super().__init__()
+        self.file = file
+        self.offset = offset
+
+    def _token_span(self, token: Token) -> Span:
+        if self.offset == 0:
+            return token2Span(token, self.file)
+        return Span(
+            self.file,
+            token.start_pos + self.offset,  # type:ignore
+            token.end_pos + self.offset,  # type:ignore
+        )
+
     def module(
         self,
         header: ModuleHeader,
-        *statements: VariableDeclaration[Range]
-        | VariableDefinition[Range]
-        | DataType[Range],
-    ) -> Module[Range]:
-        _range = header.info
-        for statement in statements:
-            new_range = mergeRanges(statement.info, _range)
-        return Module(header, list(*statements), new_range)
+        *statements: VariableDeclaration[Span]
+        | VariableDefinition[Span]
+        | DataType[Span],
+    ) -> Module[Span]:
+        span = Span.merge_many(
+            [header.info, *(statement.info for statement in statements)]
+        )
+        return Module(header, list(statements), span)
 
-    def module_level(
+    def segment(
         self,
-        statement: VariableDeclaration[Range]
-        | VariableDefinition[Range]
-        | DataType[Range],
+        statement: ModuleHeader[Span]
+        | VariableDeclaration[Span]
+        | VariableDefinition[Span]
+        | DataType[Span],
     ) -> (
-        VariableDeclaration[Range] | VariableDefinition[Range] | DataType[Range]
+        ModuleHeader[Span]
+        | VariableDeclaration[Span]
+        | VariableDefinition[Span]
+        | DataType[Span]
     ):
         return statement
 
+    def module_level(
+        self,
+        statement: VariableDeclaration[Span]
+        | VariableDefinition[Span]
+        | DataType[Span],
+    ) -> VariableDeclaration[Span] | VariableDefinition[Span] | DataType[Span]:
+        return statement
+
     def module_header(
         self, module: Token, identifier: Token, where: Token
-    ) -> ModuleHeader[Range]:
-        return ModuleHeader(identifier.value, token2Range(identifier))
+    ) -> ModuleHeader[Span]:
+        return ModuleHeader(identifier.value, self._token_span(identifier))
 
     def variable_declaration(
         self,
         identifier: Token,
         colon: Token,
-        term: Term[Range],
+        term: Term[Span],
         semi_colon: Token,
-    ) -> VariableDeclaration[Range]:
+    ) -> VariableDeclaration[Span]:
         return VariableDeclaration(
-            identifier.value, term, token2Range(identifier)
+            identifier.value, term, self._token_span(identifier)
         )
 
     def variable_definition(
+        self,
+        identifier: Token,
+        arguments: list[Argument],
+        equal: Token,
+        term: Term[Span],
+        semi_colon: Token,
+    ) -> VariableDefinition[Span]:
+        return VariableDefinition(
+            identifier.value,
+            self._abstraction(arguments, term),
+            self._token_span(identifier),
+        )
+
+    def variable_definition_no_arguments(
         self,
         identifier: Token,
         equal: Token,
-        term: Term[Range],
+        term: Term[Span],
         semi_colon: Token,
-    ) -> VariableDefinition[Range]:
+    ) -> VariableDefinition[Span]:
         return VariableDefinition(
-            identifier.value, term, token2Range(identifier)
+            identifier.value, term, self._token_span(identifier)
         )
 
     def data_definition(
@@ -77,44 +189,318 @@ class ToCore(Transformer):
         data: Token,
         identifier: Token,
         colon: Token,
-        term: Term[Range],
+        term: Term[Span],
         equal: Token,
-        definitions: list[Constructor[Range]],
+        definitions: list[Constructor[Span]],
         semi_colon: Token,
-    ) -> DataType[Range]:
+    ) -> DataType[Span]:
         return DataType(
             identifier.value,
             term,
             definitions,
-            mergeRanges(token2Range(data), token2Range(semi_colon)),
+            self._token_span(data).merge(self._token_span(semi_colon)),
         )
 
     def constructors_definition(
-        self, *definitions: Constructor[Range]
-    ) -> list[Constructor[Range]]:
-        return list(*definitions)
+        self, *definitions: Constructor[Span]
+    ) -> list[Constructor[Span]]:
+        return list(definitions)
 
     def constructor_definition(
         self,
         identifier: Token,
         colon: Token,
-        term: Term[Range],
+        term: Term[Span],
         semi_colon: Token,
-    ) -> Constructor[Range]:
+    ) -> Constructor[Span]:
         return Constructor(
             identifier.value,
             term,
-            mergeRanges(token2Range(identifier), token2Range(semi_colon)),
+            self._token_span(identifier).merge(self._token_span(semi_colon)),
         )
 
-    def value(self, _int: Token) -> IntValue[Range]:
-        return IntValue(_int.value, token2Range(_int))
+    def value(self, _int: Token) -> IntValue[Span]:
+        return IntValue(int(_int.value), self._token_span(_int))
 
-    def basic_type(self, token: Token) -> Universe[Range]:
+    def basic_type(self, token: Token) -> Universe[Span]:
         # TODO: Replace Universe for "Type" and add "universe polymorphism"
-        return Universe(
-            int(token.value.removeprefix("Universe")), token2Range(token)
+        level = token.value.removeprefix("Type").removeprefix("Universe")
+        return Universe(int(level) if level else 0, self._token_span(token))
+
+    def hole(self, token: Token) -> Hole[Span]:
+        return Hole(token.value.removeprefix("_"), self._token_span(token))
+
+    def default_case(self, token: Token) -> DefaultCase[Span]:
+        return DefaultCase(self._token_span(token))
+
+    def variable(self, identifier: Token) -> FreeVariable[Span]:
+        return FreeVariable(identifier.value, self._token_span(identifier))
+
+    def parens(self, left: Token, inner: T, right: Token) -> T:
+        return inner
+
+    def braces(self, left: Token, inner: T, right: Token) -> T:
+        return inner
+
+    def term(self, term: Term[Span]) -> Term[Span]:
+        return term
+
+    def application_single(self, *atom: Token | Term[Span]) -> Term[Span]:
+        return _atom(atom)
+
+    def application_item(self, *atom: Token | Term[Span]) -> Term[Span]:
+        return _atom(atom)
+
+    def application(self, *children: Token | Term[Span]) -> Term[Span]:
+        # The first atom is inlined, with its parentheses if it has them
+        if isinstance(children[0], Token):
+            term = _atom(children[:3])
+            arguments = children[3:]
+        else:
+            term = _atom(children[:1])
+            arguments = children[1:]
+        for argument in arguments:
+            assert not isinstance(argument, Token)
+            term = Application(term, argument, term.info.merge(argument.info))
+        return term
+
+    def annotation(
+        self,
+        left: Token,
+        expression: Term[Span],
+        dot: Token,
+        annotation: Term[Span],
+        right: Token,
+    ) -> Annotation[Span]:
+        return Annotation(
+            expression,
+            annotation,
+            self._token_span(left).merge(self._token_span(right)),
+        )
+
+    def argument(self, argument: Argument) -> Argument:
+        return argument
+
+    def arguments(self, *arguments: Argument) -> list[Argument]:
+        return list(arguments)
+
+    def implicit_argument_helper(
+        self, name: Token, equal: Token, value: Token
+    ) -> None:
+        span = self._token_span(name).merge(self._token_span(value))
+        raise SyntaxStopped(span, "Core has no implicit arguments yet")
+
+    def _abstraction(
+        self, arguments: list[Argument], term: Term[Span]
+    ) -> Abstraction[Span]:
+        span = Span.merge_many([*(a.info for a in arguments), term.info])
+        return Abstraction(arguments, term, span)
+
+    def _lambda(
+        self,
+        _lambda: Token,
+        arguments: list[Argument],
+        arrow: Token,
+        term: Term[Span],
+    ) -> Abstraction[Span]:
+        return Abstraction(
+            arguments, term, self._token_span(_lambda).merge(term.info)
+        )
+
+    def product_argument(
+        self,
+        variable: FreeVariable[Span],
+        colon: Optional[Token] = None,
+        _type: Optional[Term[Span]] = None,
+    ) -> tuple[FreeVariable[Span], Term[Span]]:
+        if _type is None:
+            # The type is left to the inference
+            _type = Hole(Identifier(""), variable.info)
+        return (variable, _type)
+
+    def explicit_product_argument_helper(
+        self, argument: tuple[FreeVariable[Span], Term[Span]]
+    ) -> tuple[FreeVariable[Span], Term[Span]]:
+        return argument
+
+    def implicit_product_argument_helper(
+        self, argument: tuple[FreeVariable[Span], Term[Span]]
+    ) -> None:
+        span = argument[0].info.merge(argument[1].info)
+        raise SyntaxStopped(span, "Core has no implicit arguments yet")
+
+    def product_arguments(
+        self, *arguments: tuple[FreeVariable[Span], Term[Span]]
+    ) -> list[tuple[FreeVariable[Span], Term[Span]]]:
+        return list(arguments)
+
+    def product(
+        self,
+        forall: Token,
+        arguments: list[tuple[FreeVariable[Span], Term[Span]]]
+        | tuple[FreeVariable[Span], Term[Span]],
+        dot: Token,
+        term: Term[Span],
+    ) -> Forall[Span]:
+        if isinstance(arguments, tuple):
+            arguments = [arguments]
+        return Forall(
+            arguments,  # type:ignore
+            term,
+            self._token_span(forall).merge(term.info),
+        )
+
+    def definition_no_arguments(
+        self, identifier: Token, equal: Token, term: Term[Span]
+    ) -> tuple[Identifier, Term[Span]]:
+        return (Identifier(identifier.value), term)
+
+    def definition_arguments(
+        self,
+        identifier: Token,
+        arguments: list[Argument],
+        equal: Token,
+        term: Term[Span],
+    ) -> tuple[Identifier, Term[Span]]:
+        return (
+            Identifier(identifier.value),
+            self._abstraction(arguments, term),
+        )
+
+    def definition_no_arguments_with_type(
+        self,
+        identifier: Token,
+        colon: Token,
+        _type: Term[Span],
+        equal: Token,
+        term: Term[Span],
+    ) -> tuple[Identifier, Term[Span]]:
+        annotation = Annotation(term, _type, _type.info.merge(term.info))
+        return (Identifier(identifier.value), annotation)
+
+    def definition_arguments_and_type(
+        self,
+        identifier: Token,
+        arguments: list[Argument],
+        colon: Token,
+        _type: Term[Span],
+        equal: Token,
+        term: Term[Span],
+    ) -> tuple[Identifier, Term[Span]]:
+        abstraction = self._abstraction(arguments, term)
+        annotation = Annotation(
+            abstraction, _type, abstraction.info.merge(_type.info)
+        )
+        return (Identifier(identifier.value), annotation)
+
+    def let_definitions(
+        self, *children: Token | tuple[Identifier, Term[Span]]
+    ) -> dict[Identifier, Term[Span]]:
+        # Without the semicolons and layout separators
+        return dict(child for child in children if isinstance(child, tuple))
+
+    def let(
+        self,
+        let: Token,
+        layout_open: Token,
+        definitions: dict[Identifier, Term[Span]],
+        layout_close: Token,
+        _in: Token,
+        term: Term[Span],
+    ) -> Let[Span]:
+        # Whether it is recursive is found by the symbol resolution
+        return Let(
+            False, definitions, term, self._token_span(let).merge(term.info)
         )
 
-    def hole(self, token: Token) -> Hole[Range]:
-        return Hole(token.value.removeprefix("_"), token2Range(token))
+    def pattern_match(self, *children: Token | Pattern) -> Pattern:
+        head = children[0]
+        if not isinstance(head, Token):
+            # A default case or a hole
+            return head
+        span = self._token_span(head)
+        if len(children) == 1:
+            # The symbol resolution finds if it is a constructor
+            return MatchVariable(Identifier(head.value), span)
+        matches = list(children[1:])
+        return MatchConstructor(
+            Identifier(head.value),
+            matches,  # type:ignore
+            span.merge(matches[-1].info),  # type:ignore
+        )
+
+    def alternative(
+        self,
+        pattern: Pattern,
+        arrow: Token,
+        value: Term[Span],
+        semi_colon: Optional[Token],
+    ) -> Alternative[Span]:
+        end = value.info
+        if semi_colon is not None:
+            end = self._token_span(semi_colon)
+        return Alternative(
+            pattern,  # type:ignore
+            value,
+            pattern.info.merge(end),
+        )
+
+    def alternatives(
+        self, *children: Token | Alternative[Span]
+    ) -> list[Alternative[Span]]:
+        # Without the layout tokens
+        return [child for child in children if not isinstance(child, Token)]
+
+    def case(
+        self,
+        case: Token,
+        expression: Term[Span],
+        of: Token,
+        alternatives: list[Alternative[Span]],
+    ) -> Case[Span]:
+        span = self._token_span(case).merge(expression.info)
+        if alternatives:
+            span = span.merge(alternatives[-1].info)
+        return Case(expression, alternatives, span)
+
+
+# `lambda` is a keyword
+setattr(ToCore, "lambda", v_args(inline=True)(ToCore._lambda))
+
+
+def to_core(
+    tree: Tree, info: FileInfo, file: int = 0
+) -> object | UnsupportedSyntax | TransformationError:
+    try:
+        return ToCore(file).transform(tree)
+    except VisitError as e:
+        if isinstance(e.orig_exc, SyntaxStopped):
+            return UnsupportedSyntax(info, e.orig_exc.span, e.orig_exc.msg)
+        # The same message `parse_to_core` gives
+        return TransformationError(info, str(e.orig_exc))
+
+
+def parse_to_core(
+    lark: Lark, info: FileInfo, segment: WordStart, file: int = 0
+) -> object | ParseError | UnsupportedSyntax:
+    """
+    Like `to_core` on the tree of `parse_segment`, but `lark` must come
+    from `load_grammar(transformer=ToCore())`: the Core is built while
+    the segment is parsed, without the tree.
+    """
+    transformer = lark.options.transformer
+    assert isinstance(transformer, ToCore)
+    _range = segment._range
+    transformer.file = file
+    transformer.offset = _range.position_start
+    try:
+        result = parse_chunk(lark, info, segment.chunk)
+    except SyntaxStopped as e:
+        # Lark doesn't wrap the exceptions of the transformer when it
+        # calls it while parsing.
+        return UnsupportedSyntax(info, e.span, e.msg)
+    if isinstance(result, ParseError):
+        return shift_parse_error(
+            result, _range.line_start, _range.position_start
+        )
+    return result
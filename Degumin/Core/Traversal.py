@@ -0,0 +1,178 @@
+"""
+Walks Core terms with an explicit stack instead of recursion, so long
+application spines and deep `let` chains don't hit the recursion limit.
+
+The subterms of a node are the ones `children` returns: binders and
+patterns aren't terms, only the types of `Forall` arguments and the
+values of `Case` alternatives are. `with_children` builds the same node
+with other subterms.
+
+- `CoreTransformer.transform` rebuilds a term bottom up, a node is only
+  rebuilt when one of its subterms changed, the rest is shared with the
+  original term.
+- `fold` computes a value for every node from the values of its
+  subterms.
+- `iter_terms` yields every node before its subterms.
+"""
+from dataclasses import replace
+from itertools import repeat
+from typing import Any, Callable, Generic, Iterator, Optional, TypeVar
+
+from Degumin.Core.Core import (
+    Abstraction,
+    Annotation,
+    Application,
+    Case,
+    Constructor,
+    Forall,
+    Let,
+    Term,
+)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+# The subterms by type of node, the traversals call it for every node
+# so a `match` on the node costs too much.
+subterms: dict[type, Callable[[Any], tuple[Term, ...]]] = {
+    Application: lambda term: (term.left, term.right),
+    Abstraction: lambda term: (term.term,),
+    Forall: lambda term: (*(a[1] for a in term.arguments), term.term),
+    Let: lambda term: (*term.definitions.values(), term.term),
+    Case: lambda term: (
+        term.expression,
+        *(a.value for a in term.alternatives),
+    ),
+    Annotation: lambda term: (term.expression, term.annotation),
+    Constructor: lambda term: (term.arguments,),
+}
+
+
+def no_subterms(term: Term[T]) -> tuple[Term[T], ...]:
+    # IntValue, Hole, MetaVariable, Universe, Variable and FreeVariable
+    return ()
+
+
+def children(term: Term[T]) -> tuple[Term[T], ...]:
+    return subterms.get(type(term), no_subterms)(term)
+
+
+def with_children(term: Term[T], new: list[Term[T]]) -> Term[T]:
+    """
+    `term` with the subterms `new`, in the order of `children`.
+    """
+    match term:
+        case Application():
+            return replace(term, left=new[0], right=new[1])
+        case Abstraction():
+            return replace(term, term=new[0])
+        case Forall(arguments):
+            return replace(
+                term,
+                arguments=[
+                    (argument[0], _type)  # type:ignore
+                    for argument, _type in zip(arguments, new)
+                ],
+                term=new[-1],
+            )
+        case Let(_, definitions):
+            return replace(
+                term, definitions=dict(zip(definitions, new)), term=new[-1]
+            )
+        case Case(_, alternatives):
+            return replace(
+                term,
+                expression=new[0],
+                alternatives=[
+                    a if a.value is value else replace(a, value=value)
+                    for a, value in zip(alternatives, new[1:])
+                ],
+            )
+        case Annotation():
+            return replace(term, expression=new[0], annotation=new[1])
+        case Constructor():
+            return replace(term, arguments=new[0])
+    return term
+
+
+class CoreTransformer(Generic[T]):
+    """
+    `pre` is called on a node before its subterms and may replace it,
+    its subterms are the ones of the replacement. `descend` tells if the
+    subterms of a node are visited. `post` is called after the subterms
+    with the node rebuilt from the new ones, and gives its result.
+
+    A pass that needs context (like the binders a term is under) can
+    push it in `pre` and pop it in `post`.
+    """
+
+    def pre(self, term: Term[T]) -> Term[T]:
+        return term
+
+    def descend(self, term: Term[T]) -> bool:
+        return True
+
+    def post(self, term: Term[T]) -> Term[T]:
+        return term
+
+    def transform(self, term: Term[T]) -> Term[T]:
+        # Results of the nodes already done, the subterms of a node are
+        # the last ones when it is done.
+        results: list[Term[T]] = []
+        # A node and its subterms once they were pushed
+        stack: list[tuple[Term[T], Optional[tuple[Term[T], ...]]]] = [
+            (term, None)
+        ]
+        while stack:
+            node, old = stack.pop()
+            if old is None:
+                node = self.pre(node)
+                if not self.descend(node):
+                    results.append(self.post(node))
+                    continue
+                old = children(node)
+                stack.append((node, old))
+                stack.extend(zip(reversed(old), repeat(None)))
+                continue
+            if old:
+                start = len(results) - len(old)
+                new = results[start:]
+                del results[start:]
+                if any(a is not b for a, b in zip(old, new)):
+                    node = with_children(node, new)
+            results.append(self.post(node))
+        return results[0]
+
+
+def fold(term: Term[T], f: Callable[[Term[T], list[R]], R]) -> R:
+    """
+    `f(node, values)` with the values of the subterms of `node`, from
+    the leaves to `term`.
+    """
+    values: list[R] = []
+    stack: list[tuple[Term[T], Optional[int]]] = [(term, None)]
+    while stack:
+        node, count = stack.pop()
+        if count is None:
+            nodes = children(node)
+            stack.append((node, len(nodes)))
+            stack.extend(zip(reversed(nodes), repeat(None)))
+            continue
+        start = len(values) - count
+        value = f(node, values[start:])
+        del values[start:]
+        values.append(value)
+    return values[0]
+
+
+def iter_terms(term: Term[T]) -> Iterator[Term[T]]:
+    """
+    Every node of `term`, each one before its subterms and those in the
+    order of `children`.
+    """
+    stack = [term]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(reversed(children(node)))
@@ -0,0 +1,782 @@
+"""
+Bidirectional type checking of Core terms. Types are values of
+`Degumin.Core.Evaluation`, two types are the same when they unify (see
+`Degumin.Core.Unification`): their values are equal up to beta, eta,
+the unfolding of definitions and the solutions of metavariables.
+
+`Checker.check` checks a term against a type, `Checker.infer` computes
+the type of the terms that carry enough information: variables,
+applications, products, annotations, `let` and `case`. An abstraction
+is only checked, so the functions of a recursive `let` are annotated.
+Every hole becomes a metavariable, its type is a new metavariable too
+when it is inferred. A hole is the same metavariable every time it is
+met in a context of the same size, holes are told apart by their place
+in the source.
+
+With `memoize`, inferred types are memoized by term identity and a
+fingerprint of the context: the values and types bound to the free
+variables of the term. A term object seen again where its free
+variables are bound to the same values with the same types has the same
+type, so a subterm shared by many definitions (see
+`Degumin.Core.HashCons`) is inferred once. Successful checks are
+memoized the same way with the expected type. `hits` and `misses`
+count the lookups. The memo costs more than it saves unless many terms
+are shared, it is off by default.
+
+`check_module` checks the statements of a module in order and times
+each one. A hole of a declaration may be solved by a later definition,
+so the metavariables left unsolved at the end of the module, and the
+constraints still blocked on them, are errors of the statements that
+made them.
+"""
+from __future__ import annotations
+
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from time import perf_counter
+from typing import Any, Callable, Iterable, Optional
+
+from Degumin.Common.Error import DeguminError
+from Degumin.Common.Persistent import PersistentVector
+from Degumin.Core.Core import (
+    Abstraction,
+    Annotation,
+    Application,
+    Case,
+    DataType,
+    DefaultCase,
+    Forall,
+    FreeVariable,
+    Hole,
+    Identifier,
+    IntValue,
+    Let,
+    MatchConstructor,
+    MatchLiteralBool,
+    MatchLiteralInt,
+    MatchVariable,
+    Term,
+    Universe,
+    Variable,
+    VariableDeclaration,
+    VariableDefinition,
+)
+from Degumin.Core.Evaluation import (
+    ConstructorValue,
+    Environment,
+    EvaluationError,
+    EvaluationStopped,
+    Evaluator,
+    FreeHead,
+    HoleHead,
+    LiteralValue,
+    NeutralValue,
+    PiValue,
+    UnboundIndex,
+    UniverseValue,
+    Value,
+    binder_name,
+    bound,
+    empty_spine,
+)
+from Degumin.Core.Unification import MetaStore, Unifier, meta_number
+
+int_type: Value = NeutralValue(FreeHead(Identifier("Int")), empty_spine)
+bool_type: Value = NeutralValue(FreeHead(Identifier("Bool")), empty_spine)
+
+
+class TypeCheckError(DeguminError):
+    pass
+
+
+@dataclass
+class UnboundName(TypeCheckError):
+    term: FreeVariable
+
+
+@dataclass
+class CannotInfer(TypeCheckError):
+    term: Term
+
+
+@dataclass
+class NotAFunctionType(TypeCheckError):
+    term: Term
+    _type: Term[None]
+
+
+@dataclass
+class NotAType(TypeCheckError):
+    term: Term
+    _type: Term[None]
+
+
+@dataclass
+class TypeMismatch(TypeCheckError):
+    # A term or a pattern
+    term: Any
+    expected: Term[None]
+    found: Term[None]
+
+
+@dataclass
+class UnsolvedConstraint(TypeCheckError):
+    # Two types that must be the same, blocked on a metavariable that
+    # no other constraint solved
+    left: Term[None]
+    right: Term[None]
+
+
+@dataclass
+class UnsolvedMeta(TypeCheckError):
+    number: int
+    # None for the metavariable of a type
+    hole: Optional[Hole]
+
+
+class TypeCheckStopped(Exception):
+    def __init__(self, error: TypeCheckError):
+        super().__init__(error)
+        self.error = error
+
+
+@dataclass(slots=True)
+class Scope:
+    environment: Environment = field(default_factory=Environment)
+    # The type of every value of `environment`, at the same position
+    types: PersistentVector[Value] = field(default_factory=PersistentVector)
+
+    def bind(
+        self,
+        name: Optional[Identifier],
+        _type: Value,
+        value: Optional[Value] = None,
+    ) -> Scope:
+        """
+        With `value` for the new variable, or itself as a neutral one.
+        """
+        if value is None:
+            value = bound(len(self.types), name)
+        return Scope(
+            self.environment.bind(name, value), self.types.append(_type)
+        )
+
+
+# The free names and de Bruijn indices of a term
+FreeVariables = tuple[frozenset[Identifier], frozenset[int]]
+
+nothing: frozenset = frozenset()
+no_free_variables: FreeVariables = (nothing, nothing)
+
+# Their types don't need inference, memoizing them costs more
+leaf_types = (Variable, FreeVariable, IntValue, Universe, Hole)
+
+
+class Checker:
+    def __init__(
+        self,
+        definitions: Optional[dict[Identifier, Term]] = None,
+        constructors: Iterable[Identifier] = (),
+        fuel: Optional[int] = None,
+        memoize: bool = False,
+    ):
+        self.metas = MetaStore()
+        self.evaluator = Evaluator(definitions, constructors, fuel, self.metas)
+        self.unifier = Unifier(self.evaluator)
+        # The types of the declarations, constructors and definitions
+        self.global_types: dict[Identifier, Value] = {}
+        self.memoize = memoize
+        self.hits = 0
+        self.misses = 0
+        # The holes met, with their type and metavariable
+        self.holes: list[tuple[Hole, Value, int]] = []
+        # By key, the result and the objects whose ids are in the key so
+        # they stay alive.
+        self.inferred: dict[tuple, tuple[Value, tuple]] = {}
+        self.checked: dict[tuple, tuple] = {}
+        self.free: dict[int, tuple[Term, FreeVariables]] = {}
+        self.inferers: dict[type, Callable[[Any, Scope], Value]] = {
+            Variable: self.infer_variable,
+            FreeVariable: self.infer_free_variable,
+            IntValue: lambda term, scope: int_type,
+            Universe: lambda term, scope: UniverseValue(term.value + 1),
+            Application: self.infer_application,
+            Forall: self.infer_forall,
+            Let: self.infer_let,
+            Case: self.infer_case,
+            Annotation: self.infer_annotation,
+            Hole: self.infer_hole,
+        }
+
+    @property
+    def constructors(self) -> frozenset[Identifier]:
+        return self.evaluator.constructors
+
+    def evaluate(self, term: Term, scope: Scope) -> Value:
+        return self.evaluator.evaluate(term, scope.environment)
+
+    def quote(self, value: Value, scope: Scope) -> Term[None]:
+        return self.evaluator.quote(value, len(scope.types))
+
+    def hole(self, term: Hole, _type: Value, scope: Scope) -> None:
+        depth = len(scope.types)
+        if self.metas.hole_meta(term, depth) is None:
+            number = self.metas.add_hole(term, _type, depth)
+            self.holes.append((term, _type, number))
+
+    # Memoization
+
+    def free_variables(self, term: Term) -> FreeVariables:
+        """
+        Computed once by term, with an explicit stack since the subterms
+        are done first.
+        """
+        free = self.free
+        entry = free.get(id(term))
+        if entry is not None:
+            return entry[1]
+        stack: list[tuple[Term, Optional[list]]] = [(term, None)]
+        while stack:
+            node, subterms = stack.pop()
+            if id(node) in free:
+                continue
+            if subterms is None:
+                leaf = leaf_free_variables(node)
+                if leaf is not None:
+                    free[id(node)] = (node, leaf)
+                    continue
+                subterms = free_subterms(node)
+                stack.append((node, subterms))
+                stack.extend(
+                    (child, None)
+                    for child, _, _ in subterms
+                    if id(child) not in free
+                )
+                continue
+            names: set[Identifier] = set()
+            indices: set[int] = set()
+            for child, binders, count in subterms:
+                child_names, child_indices = free[id(child)][1]
+                if child_names:
+                    names.update(child_names - binders)
+                if child_indices:
+                    indices.update(
+                        i - count for i in child_indices if i >= count
+                    )
+            result = no_free_variables
+            if names or indices:
+                result = (frozenset(names), frozenset(indices))
+            free[id(node)] = (node, result)
+        return free[id(term)][1]
+
+    def fingerprint(self, term: Term, scope: Scope) -> tuple[tuple, tuple]:
+        """
+        The key of `term` in `scope` and the objects that must stay alive
+        for its ids to keep their meaning.
+        """
+        names, indices = self.free_variables(term)
+        environment = scope.environment
+        key: list[object] = [id(term)]
+        keep: list[object] = [term]
+
+        def bound(value: Value, _type: Value) -> None:
+            key.append(id(value))
+            key.append(id(_type))
+            keep.append(value)
+            keep.append(_type)
+
+        for name in sorted(names):
+            position = environment.names.get(name)
+            if position is not None:
+                bound(environment.values[position], scope.types[position])
+            else:
+                # A global, its type doesn't change. Equal names from
+                # different tokens are different objects.
+                key.append(name)
+        depth = len(scope.types)
+        for index in sorted(indices):
+            if index < depth:
+                level = depth - 1 - index
+                bound(environment.values[level], scope.types[level])
+        return tuple(key), tuple(keep)
+
+    # Inference
+
+    def infer(self, term: Term, scope: Scope) -> Value:
+        """
+        May raise `TypeCheckStopped` or `EvaluationStopped`.
+        """
+        inferer = self.inferers.get(type(term))
+        if inferer is None:
+            raise TypeCheckStopped(CannotInfer(term))
+        if not self.memoize or isinstance(term, leaf_types):
+            return inferer(term, scope)
+        key, keep = self.fingerprint(term, scope)
+        entry = self.inferred.get(key)
+        if entry is not None:
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        _type = inferer(term, scope)
+        self.inferred[key] = (_type, keep)
+        return _type
+
+    def infer_variable(self, term: Variable, scope: Scope) -> Value:
+        depth = len(scope.types)
+        if not 0 <= term.number < depth:
+            raise EvaluationStopped(UnboundIndex(term.number))
+        return scope.types[depth - 1 - term.number]
+
+    def infer_free_variable(self, term: FreeVariable, scope: Scope) -> Value:
+        position = scope.environment.names.get(term.name)
+        if position is not None:
+            return scope.types[position]
+        _type = self.global_types.get(term.name)
+        if _type is None:
+            raise TypeCheckStopped(UnboundName(term))
+        return _type
+
+    def infer_application(self, term: Application, scope: Scope) -> Value:
+        function_type = self.evaluator.force(self.infer(term.left, scope))
+        if not isinstance(function_type, PiValue):
+            raise TypeCheckStopped(
+                NotAFunctionType(term, self.quote(function_type, scope))
+            )
+        self.check(term.right, function_type.domain, scope)
+        argument = self.evaluate(term.right, scope)
+        return self.evaluator.instantiate(function_type.closure, argument)
+
+    def infer_forall(self, term: Forall, scope: Scope) -> Value:
+        level = 0
+        for binder, _type in term.arguments:  # type:ignore
+            level = max(level, self.universe_level(_type, scope))
+            scope = scope.bind(binder_name(binder), self.evaluate(_type, scope))
+        return UniverseValue(max(level, self.universe_level(term.term, scope)))
+
+    def universe_level(self, term: Term, scope: Scope) -> int:
+        _type = self.evaluator.force(self.infer(term, scope))
+        if meta_number(_type) is not None:
+            # A hole for a type, like the one of an argument without type
+            self.unifier.unify(_type, UniverseValue(0), len(scope.types))
+            return 0
+        if not isinstance(_type, UniverseValue):
+            raise TypeCheckStopped(NotAType(term, self.quote(_type, scope)))
+        return _type.level
+
+    def infer_hole(self, term: Hole, scope: Scope) -> Value:
+        _type = self.fresh_type(scope)
+        self.hole(term, _type, scope)
+        return _type
+
+    def fresh_type(self, scope: Scope) -> Value:
+        """
+        A new metavariable for a type in `scope`.
+        """
+        number = self.metas.fresh(UniverseValue(0), len(scope.types))
+        _type = self.evaluator.meta(number)
+        for value in scope.environment.values:
+            _type = self.evaluator.apply(_type, value)
+        return _type
+
+    def infer_let(self, term: Let, scope: Scope) -> Value:
+        return self.infer(term.term, self.let_scope(term, scope))
+
+    def let_scope(self, term: Let, scope: Scope) -> Scope:
+        if term.isRecursive:
+            return self.recursive_let_scope(term, scope)
+        for name, definition in term.definitions.items():
+            _type = self.infer(definition, scope)
+            scope = scope.bind(name, _type, self.evaluate(definition, scope))
+        return scope
+
+    def recursive_let_scope(self, term: Let, scope: Scope) -> Scope:
+        """
+        The definitions are checked with each other as variables of
+        their annotated types, or of the types inferred for them. The
+        term after them sees their values.
+        """
+        inner = scope
+        for name, definition in term.definitions.items():
+            if isinstance(definition, Annotation):
+                self.universe_level(definition.annotation, inner)
+                _type = self.evaluate(definition.annotation, inner)
+            else:
+                _type = self.fresh_type(inner)
+            inner = inner.bind(name, _type)
+        depth = len(inner.types)
+        start = len(scope.types)
+        for i, definition in enumerate(term.definitions.values()):
+            _type = inner.types[start + i]
+            if isinstance(definition, Annotation):
+                self.check(definition.expression, _type, inner)
+                continue
+            found = self.infer(definition, inner)
+            if not self.convertible(found, _type, depth):
+                raise TypeCheckStopped(
+                    TypeMismatch(
+                        definition,
+                        self.quote(_type, inner),
+                        self.quote(found, inner),
+                    )
+                )
+        environment = self.evaluator.recursive_environment(
+            term, scope.environment
+        )
+        return Scope(environment, inner.types)
+
+    def infer_annotation(self, term: Annotation, scope: Scope) -> Value:
+        self.universe_level(term.annotation, scope)
+        _type = self.evaluate(term.annotation, scope)
+        self.check(term.expression, _type, scope)
+        return _type
+
+    def infer_case(self, term: Case, scope: Scope) -> Value:
+        if not term.alternatives:
+            raise TypeCheckStopped(CannotInfer(term))
+        scopes = self.alternative_scopes(term, scope)
+        first = term.alternatives[0]
+        _type = self.infer(first.value, scopes[0])
+        # The types of the variables of the first pattern can't be in
+        # the type of the other alternatives.
+        expected = self.evaluate(self.quote(_type, scopes[0]), scope)
+        for alternative, inner in zip(term.alternatives[1:], scopes[1:]):
+            self.check(alternative.value, expected, inner)
+        return expected
+
+    def alternative_scopes(self, term: Case, scope: Scope) -> list[Scope]:
+        scrutinee_type = self.infer(term.expression, scope)
+        return [
+            self.pattern_scope(alternative.case, scrutinee_type, scope)
+            for alternative in term.alternatives
+        ]
+
+    def pattern_scope(self, pattern: Any, _type: Value, scope: Scope) -> Scope:
+        """
+        `scope` with the variables of `pattern`, matched on a value of
+        type `_type`. They are bound in the order of `pattern_binders`.
+        """
+        if isinstance(pattern, (DefaultCase, Hole)):
+            return scope
+        if isinstance(pattern, MatchVariable):
+            if pattern.name not in self.constructors:
+                return scope.bind(pattern.name, _type)
+            self.unify_pattern(
+                pattern, self.constructor_type(pattern), _type, scope
+            )
+            return scope
+        if isinstance(pattern, MatchLiteralInt):
+            self.unify_pattern(pattern, int_type, _type, scope)
+            return scope
+        if isinstance(pattern, MatchLiteralBool):
+            self.unify_pattern(pattern, bool_type, _type, scope)
+            return scope
+        constructor_type = self.constructor_type(pattern)
+        for match in pattern.matches:
+            if not isinstance(constructor_type, PiValue):
+                raise TypeCheckStopped(
+                    NotAFunctionType(
+                        pattern, self.quote(constructor_type, scope)
+                    )
+                )
+            domain = constructor_type.domain
+            if (
+                isinstance(match, MatchVariable)
+                and match.name not in self.constructors
+            ):
+                scope = scope.bind(match.name, domain)
+                value: Value = scope.environment.values[len(scope.types) - 1]
+            else:
+                scope = self.pattern_scope(match, domain, scope)
+                value = self.pattern_value(match)
+            constructor_type = self.evaluator.instantiate(
+                constructor_type.closure, value
+            )
+        self.unify_pattern(pattern, constructor_type, _type, scope)
+        return scope
+
+    def constructor_type(self, pattern: Any) -> Value:
+        _type = self.global_types.get(pattern.name)
+        if _type is None:
+            raise TypeCheckStopped(
+                UnboundName(FreeVariable(pattern.name, pattern.info))
+            )
+        return _type
+
+    def pattern_value(self, pattern: Any) -> Value:
+        """
+        The value of a pattern that binds nothing.
+        """
+        if isinstance(pattern, MatchVariable):
+            return ConstructorValue(pattern.name, ())
+        if isinstance(pattern, (MatchLiteralInt, MatchLiteralBool)):
+            return LiteralValue(pattern.literal)  # type:ignore
+        return NeutralValue(HoleHead(Identifier("_")), empty_spine)
+
+    def unify_pattern(
+        self, pattern: Any, found: Value, expected: Value, scope: Scope
+    ) -> None:
+        if not self.convertible(found, expected, len(scope.types)):
+            raise TypeCheckStopped(
+                TypeMismatch(
+                    pattern,
+                    self.quote(expected, scope),
+                    self.quote(found, scope),
+                )
+            )
+
+    # Checking
+
+    def check(self, term: Term, expected: Value, scope: Scope) -> None:
+        """
+        May raise `TypeCheckStopped` or `EvaluationStopped`.
+        """
+        if not self.memoize or isinstance(term, leaf_types):
+            self.check_term(term, expected, scope)
+            return
+        key, keep = self.fingerprint(term, scope)
+        key = (*key, id(expected))
+        if key in self.checked:
+            self.hits += 1
+            return
+        self.misses += 1
+        self.check_term(term, expected, scope)
+        self.checked[key] = (*keep, expected)
+
+    def check_term(self, term: Term, expected: Value, scope: Scope) -> None:
+        if isinstance(term, Abstraction):
+            for binder in term.original_arguments:
+                expected = self.evaluator.force(expected)
+                if not isinstance(expected, PiValue):
+                    raise TypeCheckStopped(
+                        NotAFunctionType(term, self.quote(expected, scope))
+                    )
+                scope = scope.bind(binder_name(binder), expected.domain)
+                variable = scope.environment.values[len(scope.types) - 1]
+                expected = self.evaluator.instantiate(
+                    expected.closure, variable
+                )
+            self.check(term.term, expected, scope)
+        elif isinstance(term, Let):
+            self.check(term.term, expected, self.let_scope(term, scope))
+        elif isinstance(term, Case):
+            scopes = self.alternative_scopes(term, scope)
+            for alternative, inner in zip(term.alternatives, scopes):
+                self.check(alternative.value, expected, inner)
+        elif isinstance(term, Hole):
+            self.hole(term, expected, scope)
+        else:
+            found = self.infer(term, scope)
+            if not self.convertible(found, expected, len(scope.types)):
+                raise TypeCheckStopped(
+                    TypeMismatch(
+                        term,
+                        self.quote(expected, scope),
+                        self.quote(found, scope),
+                    )
+                )
+
+    def convertible(self, left: Value, right: Value, depth: int) -> bool:
+        return self.unifier.unify(left, right, depth)
+
+
+def leaf_free_variables(term: Term) -> Optional[FreeVariables]:
+    if isinstance(term, FreeVariable):
+        return frozenset((term.name,)), frozenset()
+    if isinstance(term, Variable):
+        return frozenset(), frozenset((term.number,))
+    if isinstance(term, (IntValue, Universe, Hole)):
+        return no_free_variables
+    return None
+
+
+def free_subterms(
+    term: Term,
+) -> list[tuple[Term, frozenset[Identifier], int]]:
+    """
+    The subterms of `term` with the names and the number of indices
+    bound around each one.
+    """
+    match term:
+        case Application(left, right):
+            return [(left, nothing, 0), (right, nothing, 0)]
+        case Abstraction(binders, body):
+            names = frozenset(
+                name for name in map(binder_name, binders) if name is not None
+            )
+            return [(body, names, len(binders))]
+        case Forall(arguments, body):
+            result = []
+            names: set[Identifier] = set()
+            for i, (binder, _type) in enumerate(arguments):  # type:ignore
+                result.append((_type, frozenset(names), i))
+                name = binder_name(binder)
+                if name is not None:
+                    names.add(name)
+            result.append((body, frozenset(names), len(arguments)))
+            return result
+        case Let(recursive, definitions, body):
+            result = []
+            for i, (name, definition) in enumerate(definitions.items()):
+                if recursive:
+                    # They see each other
+                    result.append(
+                        (definition, frozenset(definitions), len(definitions))
+                    )
+                    continue
+                result.append((definition, frozenset(list(definitions)[:i]), i))
+            result.append((body, frozenset(definitions), len(definitions)))
+            return result
+        case Case(expression, alternatives):
+            result = [(expression, nothing, 0)]
+            for alternative in alternatives:
+                names = pattern_names(alternative.case)
+                result.append((alternative.value, frozenset(names), len(names)))
+            return result
+        case Annotation(expression, annotation):
+            return [(expression, nothing, 0), (annotation, nothing, 0)]
+    return []
+
+
+def pattern_names(pattern: Any) -> list[Identifier]:
+    # Like `Evaluator.pattern_binders` without knowing the constructors,
+    # a constructor taken for a variable only makes the key bigger.
+    if isinstance(pattern, MatchVariable):
+        return [pattern.name]
+    if isinstance(pattern, MatchConstructor):
+        return [
+            name for match in pattern.matches for name in pattern_names(match)
+        ]
+    return []
+
+
+Statement = VariableDeclaration | VariableDefinition | DataType
+
+checked_statements = (VariableDeclaration, VariableDefinition, DataType)
+
+
+@dataclass
+class DefinitionReport:
+    name: Identifier
+    seconds: float
+    hits: int
+    misses: int
+    error: Optional[TypeCheckError | EvaluationError] = None
+
+
+@dataclass
+class ModuleReport:
+    # One by declaration, data type and definition, in source order
+    definitions: list[DefinitionReport]
+    hits: int
+    misses: int
+    holes: list[tuple[Hole, Value, int]]
+    metas: MetaStore
+
+    def slowest(self, count: int = 10) -> list[DefinitionReport]:
+        return sorted(self.definitions, key=lambda d: d.seconds)[::-1][:count]
+
+
+def check_module(
+    statements: Iterable[object],
+    fuel: Optional[int] = None,
+    memoize: bool = False,
+) -> ModuleReport:
+    """
+    Checks the declarations, data types and definitions among
+    `statements` (the results of the segments of a module), the others
+    are skipped. A definition with a declaration is checked against it,
+    the type of the others is inferred.
+    """
+    statements = list(statements)
+    definitions: dict[Identifier, Term] = {}
+    constructors: list[Identifier] = []
+    for statement in statements:
+        if isinstance(statement, VariableDefinition):
+            definitions[statement.name] = statement.definition
+        elif isinstance(statement, DataType):
+            constructors.extend(c.name for c in statement.constructors)
+    checker = Checker(definitions, constructors, fuel, memoize)
+    empty = Scope()
+    reports: list[DefinitionReport] = []
+
+    def declare(name: Identifier, _type: Term) -> None:
+        checker.universe_level(_type, empty)
+        checker.global_types[name] = checker.evaluate(_type, empty)
+
+    def define(name: Identifier, term: Term) -> None:
+        expected = checker.global_types.get(name)
+        if expected is None:
+            checker.global_types[name] = checker.infer(term, empty)
+        else:
+            checker.check(term, expected, empty)
+
+    def check_statement(statement: Statement) -> None:
+        if isinstance(statement, VariableDeclaration):
+            declare(statement.name, statement.declaration)
+        elif isinstance(statement, VariableDefinition):
+            define(statement.name, statement.definition)
+        else:
+            declare(statement.name, statement.argument)
+            for constructor in statement.constructors:
+                declare(constructor.name, constructor.arguments)
+
+    # The first metavariable made by each statement checked
+    starts: list[int] = []
+    for statement in statements:
+        if not isinstance(statement, checked_statements):
+            continue
+        starts.append(len(checker.metas))
+        hits, misses = checker.hits, checker.misses
+        error: Optional[TypeCheckError | EvaluationError] = None
+        start = perf_counter()
+        try:
+            check_statement(statement)
+        except TypeCheckStopped as e:
+            error = e.error
+        except EvaluationStopped as e:
+            error = e.error
+        seconds = perf_counter() - start
+        reports.append(
+            DefinitionReport(
+                statement.name,
+                seconds,
+                checker.hits - hits,
+                checker.misses - misses,
+                error,
+            )
+        )
+    report_unsolved(checker, reports, starts)
+    return ModuleReport(
+        reports, checker.hits, checker.misses, checker.holes, checker.metas
+    )
+
+
+def report_unsolved(
+    checker: Checker, reports: list[DefinitionReport], starts: list[int]
+) -> None:
+    """
+    Gives the blocked constraints and then the unsolved metavariables as
+    errors to the statements that made their metavariables, if they
+    have none yet.
+    """
+    holes = {number: hole for hole, _, number in checker.holes}
+
+    def owner(number: int) -> DefinitionReport:
+        return reports[bisect_right(starts, number) - 1]
+
+    for number, constraint in checker.metas.blocked_on():
+        report = owner(number)
+        if report.error is not None:
+            continue
+        quote = checker.evaluator.quote
+        try:
+            report.error = UnsolvedConstraint(
+                quote(constraint.left, constraint.depth),
+                quote(constraint.right, constraint.depth),
+            )
+        except EvaluationStopped as e:
+            report.error = e.error
+    for number in checker.metas.unsolved():
+        report = owner(number)
+        if report.error is None:
+            report.error = UnsolvedMeta(number, holes.get(number))
@@ -0,0 +1,438 @@
+"""
+Metavariables and their solutions by pattern unification.
+
+A metavariable stands for a term to find, like a hole of the source. It
+is created in a context and is a closed term applied to the variables of
+that context, so its solution can't use a variable out of it.
+`MetaStore` keeps them in lists indexed by their number.
+
+`Unifier.unify` tells if two values are convertible and solves the
+metavariables it meets on the way. An equation `?m x1 ... xn = t`, where
+the `xi` are distinct bound variables, is solved by
+`?m = \\x1 ... xn -> t`: `t` is read back with the `xi` renamed to the
+binders of the solution. It fails if `t` uses another bound variable or
+`?m` itself (the occurs check). When `t` is another metavariable on the
+same variables the two are merged instead, like the sets of a union
+find, and finding the solution of one compresses the path of the merged
+ones. Any other equation on an unsolved metavariable is blocked on it
+and woken when it is solved.
+
+Solutions aren't substituted in the terms or values using them,
+`Evaluator.force` looks them up when a value is used, so solving one
+doesn't walk again what was checked.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from itertools import repeat
+from typing import Hashable, Optional
+
+from Degumin.Common.File import Span
+from Degumin.Core.Core import (
+    Abstraction,
+    Case,
+    DefaultCase,
+    Forall,
+    Hole,
+    Let,
+    MetaVariable,
+    Term,
+    Variable,
+)
+from Degumin.Core.Evaluation import (
+    ApplicationFrame,
+    BoundHead,
+    CaseFrame,
+    ConstructorValue,
+    Evaluator,
+    LambdaValue,
+    LiteralValue,
+    MetaHead,
+    NeutralValue,
+    PiValue,
+    StuckCaseHead,
+    UniverseValue,
+    Value,
+    bound,
+)
+from Degumin.Core.HashCons import shallow_key
+from Degumin.Core.Traversal import children, with_children
+
+
+@dataclass
+class Constraint:
+    left: Value
+    right: Value
+    # The number of variables bound around both values
+    depth: int
+    # It may wait on more than one metavariable
+    done: bool = False
+
+
+class MetaStore:
+    def __init__(self) -> None:
+        # All indexed by the number of the metavariable. A merged one has
+        # another one as parent, the solution and the blocked constraints
+        # are the ones of the root.
+        self.parents: list[int] = []
+        self.solutions: list[Optional[Value]] = []
+        self.types: list[Value] = []
+        self.arities: list[int] = []
+        self.waiting: list[list[Constraint]] = []
+        # The metavariable of a hole by the key of the hole and the size
+        # of its context, the hole is kept so its id isn't reused.
+        self.holes: dict[tuple[Hashable, int], tuple[int, Hole]] = {}
+
+    def __len__(self) -> int:
+        return len(self.parents)
+
+    def fresh(self, _type: Value, arity: int) -> int:
+        """
+        A new metavariable of type `_type` in a context of `arity`
+        variables.
+        """
+        number = len(self.parents)
+        self.parents.append(number)
+        self.solutions.append(None)
+        self.types.append(_type)
+        self.arities.append(arity)
+        self.waiting.append([])
+        return number
+
+    def add_hole(self, hole: Hole, _type: Value, arity: int) -> int:
+        number = self.fresh(_type, arity)
+        self.holes[(hole_key(hole), arity)] = (number, hole)
+        return number
+
+    def hole_meta(self, hole: Hole, arity: int) -> Optional[int]:
+        entry = self.holes.get((hole_key(hole), arity))
+        return None if entry is None else entry[0]
+
+    def find(self, number: int) -> int:
+        parents = self.parents
+        root = number
+        while parents[root] != root:
+            root = parents[root]
+        while parents[number] != root:
+            parents[number], number = root, parents[number]
+        return root
+
+    def solve(self, number: int, solution: Value) -> list[Constraint]:
+        """
+        Returns the constraints to wake.
+        """
+        root = self.find(number)
+        assert self.solutions[root] is None
+        self.solutions[root] = solution
+        woken, self.waiting[root] = self.waiting[root], []
+        return woken
+
+    def merge(self, number: int, other: int) -> None:
+        root, other = self.find(number), self.find(other)
+        if root == other:
+            return
+        self.parents[root] = other
+        self.waiting[other].extend(self.waiting[root])
+        self.waiting[root] = []
+
+    def block(self, constraint: Constraint, number: int) -> None:
+        self.waiting[self.find(number)].append(constraint)
+
+    def unsolved(self) -> list[int]:
+        return [
+            number
+            for number, parent in enumerate(self.parents)
+            if parent == number and self.solutions[number] is None
+        ]
+
+    def blocked(self) -> list[Constraint]:
+        return [constraint for _, constraint in self.blocked_on()]
+
+    def blocked_on(self) -> list[tuple[int, Constraint]]:
+        """
+        The constraints still waiting, each one with a metavariable it
+        waits on.
+        """
+        seen: set[int] = set()
+        result = []
+        for number, constraints in enumerate(self.waiting):
+            for constraint in constraints:
+                if not constraint.done and id(constraint) not in seen:
+                    seen.add(id(constraint))
+                    result.append((number, constraint))
+        return result
+
+
+def hole_key(hole: Hole) -> Hashable:
+    """
+    A hole is its occurrence in the source, one built without a place is
+    itself.
+    """
+    if isinstance(hole.info, Span):
+        return hole.info
+    return id(hole)
+
+
+def meta_number(value: Value) -> Optional[int]:
+    if isinstance(value, NeutralValue) and isinstance(value.head, MetaHead):
+        return value.head.number
+    return None
+
+
+class Unifier:
+    def __init__(self, evaluator: Evaluator):
+        assert evaluator.metas is not None
+        self.evaluator = evaluator
+        self.metas: MetaStore = evaluator.metas
+        self.solved = 0
+        self.merged = 0
+        self.postponed = 0
+
+    def unify(self, left: Value, right: Value, depth: int) -> bool:
+        """
+        May raise `EvaluationStopped`.
+        """
+        force = self.evaluator.force
+        left, right = force(left), force(right)
+        if left is right:
+            return True
+        if meta_number(left) is not None or meta_number(right) is not None:
+            return self.unify_meta(left, right, depth)
+        if isinstance(left, LambdaValue) or isinstance(right, LambdaValue):
+            # Eta, a function is equal to its application to a variable
+            variable = bound(depth, None)
+            return self.unify(
+                self.evaluator.apply(left, variable),
+                self.evaluator.apply(right, variable),
+                depth + 1,
+            )
+        if type(left) is not type(right):
+            return False
+        if isinstance(left, PiValue):
+            assert isinstance(right, PiValue)
+            variable = bound(depth, None)
+            return self.unify(left.domain, right.domain, depth) and self.unify(
+                self.evaluator.instantiate(left.closure, variable),
+                self.evaluator.instantiate(right.closure, variable),
+                depth + 1,
+            )
+        if isinstance(left, (UniverseValue, LiteralValue)):
+            return left == right
+        if isinstance(left, ConstructorValue):
+            assert isinstance(right, ConstructorValue)
+            return (
+                left.name == right.name
+                and len(left.arguments) == len(right.arguments)
+                and all(
+                    self.unify(a, b, depth)
+                    for a, b in zip(left.arguments, right.arguments)
+                )
+            )
+        assert isinstance(left, NeutralValue)
+        assert isinstance(right, NeutralValue)
+        return self.unify_heads(left, right, depth) and self.unify_spines(
+            left, right, depth
+        )
+
+    def unify_heads(
+        self, left: NeutralValue, right: NeutralValue, depth: int
+    ) -> bool:
+        a, b = left.head, right.head
+        if not isinstance(a, StuckCaseHead) or not isinstance(b, StuckCaseHead):
+            return a == b
+        # The same `case` on convertible scrutinees
+        return self.unify(
+            a.scrutinee, b.scrutinee, depth
+        ) and self.unify_alternatives(
+            CaseFrame(a.alternatives, a.environment),
+            CaseFrame(b.alternatives, b.environment),
+            depth,
+        )
+
+    def unify_spines(
+        self, left: NeutralValue, right: NeutralValue, depth: int
+    ) -> bool:
+        if len(left.spine) != len(right.spine):
+            return False
+        for a, b in zip(left.spine, right.spine):
+            if isinstance(a, ApplicationFrame):
+                if not isinstance(b, ApplicationFrame):
+                    return False
+                if not self.unify(a.argument, b.argument, depth):
+                    return False
+                continue
+            if not isinstance(b, CaseFrame):
+                return False
+            if not self.unify_alternatives(a, b, depth):
+                return False
+        return True
+
+    def unify_alternatives(
+        self, left: CaseFrame, right: CaseFrame, depth: int
+    ) -> bool:
+        if len(left.alternatives) != len(right.alternatives):
+            return False
+        for a, b in zip(left.alternatives, right.alternatives):
+            if shallow_key(a.case) != shallow_key(b.case):  # type:ignore
+                return False
+            left_environment = left.environment
+            right_environment = right.environment
+            names = self.evaluator.pattern_binders(a.case)
+            for i, name in enumerate(names):
+                variable = bound(depth + i, name)
+                left_environment = left_environment.bind(name, variable)
+                right_environment = right_environment.bind(name, variable)
+            if not self.unify(
+                self.evaluator.evaluate(a.value, left_environment),
+                self.evaluator.evaluate(b.value, right_environment),
+                depth + len(names),
+            ):
+                return False
+        return True
+
+    def unify_meta(self, left: Value, right: Value, depth: int) -> bool:
+        left_number, right_number = meta_number(left), meta_number(right)
+        if left_number is not None and right_number is not None:
+            if self.metas.find(left_number) == self.metas.find(right_number):
+                return self.unify_spines(left, right, depth)
+        for meta, other in [(left, right), (right, left)]:
+            if meta_number(meta) is None:
+                continue
+            levels = self.pattern(meta)
+            if levels is not None:
+                return self.solve(meta, levels, other, depth)
+        constraint = Constraint(left, right, depth)
+        for number in [left_number, right_number]:
+            if number is not None:
+                self.metas.block(constraint, number)
+        self.postponed += 1
+        return True
+
+    def pattern(self, value: NeutralValue) -> Optional[list[int]]:
+        """
+        The levels of the variables `value` applies its metavariable to,
+        if they are distinct bound variables.
+        """
+        levels: list[int] = []
+        for frame in value.spine:
+            if not isinstance(frame, ApplicationFrame):
+                return None
+            argument = self.evaluator.force(frame.argument)
+            if (
+                not isinstance(argument, NeutralValue)
+                or not isinstance(argument.head, BoundHead)
+                or argument.spine
+            ):
+                return None
+            levels.append(argument.head.level)
+        if len(set(levels)) != len(levels):
+            return None
+        return levels
+
+    def solve(
+        self, meta: NeutralValue, levels: list[int], value: Value, depth: int
+    ) -> bool:
+        number = meta_number(meta)
+        assert number is not None
+        other = meta_number(value)
+        if other is not None and self.pattern(value) == levels:  # type:ignore
+            self.metas.merge(number, other)
+            self.merged += 1
+            return True
+        body = self.rename(number, levels, value, depth)
+        if body is None:
+            return False
+        term: Term[None] = body
+        if levels:
+            binders = [DefaultCase(None) for _ in levels]
+            term = Abstraction(binders, body, None)  # type:ignore
+        woken = self.metas.solve(number, self.evaluator.evaluate(term))
+        self.solved += 1
+        for constraint in woken:
+            if constraint.done:
+                continue
+            constraint.done = True
+            if not self.unify(
+                constraint.left, constraint.right, constraint.depth
+            ):
+                return False
+        return True
+
+    def rename(
+        self, number: int, levels: list[int], value: Value, depth: int
+    ) -> Optional[Term[None]]:
+        """
+        `value` read back under the binders of a solution for the
+        metavariable `number` on the variables `levels`, None if it uses
+        another variable or the metavariable itself.
+        """
+        read = self.evaluator.read_metas
+        term = self.evaluator.quote(value, depth)
+        arity = len(levels)
+        if (
+            self.evaluator.read_metas == read
+            and arity == depth
+            and all(level == i for i, level in enumerate(levels))
+        ):
+            # The variables keep their indices and there is no
+            # metavariable to check.
+            return term
+        renaming = dict(zip(levels, range(arity)))
+        # Results of the nodes done, a node and the binders around it,
+        # with its subterms once they were pushed.
+        results: list[Term[None]] = []
+        stack: list[tuple[Term[None], int, Optional[tuple]]] = [(term, 0, None)]
+        while stack:
+            node, inner, old = stack.pop()
+            if old is None:
+                if isinstance(node, Variable):
+                    if node.number >= inner:
+                        level = renaming.get(depth - 1 - node.number + inner)
+                        if level is None:
+                            return None
+                        node = Variable(
+                            arity - 1 - level + inner, node.original_name, None
+                        )
+                    results.append(node)
+                    continue
+                if isinstance(node, MetaVariable):
+                    if self.metas.find(node.number) == number:
+                        return None
+                    results.append(node)
+                    continue
+                old = children(node)
+                if not old:
+                    results.append(node)
+                    continue
+                stack.append((node, inner, old))
+                binders = [inner + i for i in self.binder_counts(node)]
+                stack.extend(
+                    zip(reversed(old), reversed(binders), repeat(None))
+                )
+                continue
+            start = len(results) - len(old)
+            new = results[start:]
+            del results[start:]
+            if any(a is not b for a, b in zip(old, new)):
+                node = with_children(node, new)
+            results.append(node)
+        return results[0]
+
+    def binder_counts(self, term: Term) -> list[int]:
+        """
+        The number of variables bound around every subterm of `term`, in
+        the order of `children`.
+        """
+        if isinstance(term, Abstraction):
+            return [len(term.original_arguments)]
+        if isinstance(term, (Forall, Let)):
+            count = len(
+                term.arguments if isinstance(term, Forall) else term.definitions
+            )
+            return list(range(count + 1))
+        if isinstance(term, Case):
+            return [0] + [
+                len(self.evaluator.pattern_binders(a.case))
+                for a in term.alternatives
+            ]
+        return [0] * len(children(term))
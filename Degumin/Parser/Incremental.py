@@ -0,0 +1,293 @@
+"""
+Reparses a text after an edit without starting from scratch.
+
+The text is split in regions by the segmenter (see `split_region`), a
+region only depends on the text after its start. After an edit we run
+the segmenter again from the last region that starts before the edit
+until we find a region start after the edit that we already had, from
+there the old segments are still right.
+
+Segments after the edit don't need to be updated either: the ones
+before the last edit keep positions relative to the start of the text
+and the ones after it relative to the end, like a gap buffer. The trees
+are moved to their real positions only when they are asked for.
+"""
+from dataclasses import dataclass, replace
+from typing import Optional
+
+from lark import Lark, Tree
+
+from Degumin.Common.File import FileInfo, Range
+from Degumin.Parser.Lexer import (
+    MissedBlockCommentClose,
+    SegmenterError,
+    SegmenterErrorVisitor,
+    State,
+    UnexpectedCharacterAtIndentationZero,
+    WordStart,
+    region_start_lookahead,
+    split_region,
+)
+from Degumin.Parser.Parser import (
+    ParseError,
+    SegmentationError,
+    parse_segment,
+    shift_parse_error,
+    shift_tree,
+)
+from Degumin.Parser.Token import Token
+
+
+@dataclass
+class ShiftSegmenterError(SegmenterErrorVisitor[SegmenterError]):
+    lines: int
+    positions: int
+
+    def visit_unexpected_character(
+        self, e: UnexpectedCharacterAtIndentationZero
+    ) -> SegmenterError:
+        return replace(e, line=e.line + self.lines)
+
+    def visit_missed_block_coment_close(
+        self, e: MissedBlockCommentClose
+    ) -> SegmenterError:
+        return replace(
+            e, line=e.line + self.lines, position=e.position + self.positions
+        )
+
+
+def shift_range(_range: Range, lines: int, positions: int) -> Range:
+    return _range._replace(
+        line_start=_range.line_start + lines,
+        line_end=_range.line_end + lines,
+        position_start=_range.position_start + positions,
+        position_end=_range.position_end + positions,
+    )
+
+
+@dataclass
+class Segment:
+    """
+    A segment or an error found by the segmenter in the region that
+    starts at `position`, with the result of parsing the segment.
+    """
+
+    # Start of the region and its line, relative to the end of the text
+    # for the segments after the last edit.
+    position: int
+    line: int
+    item: WordStart | SegmenterError
+    result: Optional[Tree[Token] | ParseError]
+    # The region start `item` and `result` were computed for
+    shifted_position: int
+    shifted_line: int
+
+    def shift_to(self, position: int, line: int) -> None:
+        lines = line - self.shifted_line
+        positions = position - self.shifted_position
+        if lines == 0 and positions == 0:
+            return
+        if isinstance(self.item, WordStart):
+            self.item = WordStart(
+                self.item.chunk,
+                _range=shift_range(self.item._range, lines, positions),
+            )
+        else:
+            self.item = self.item.visit(ShiftSegmenterError(lines, positions))
+        if isinstance(self.result, Tree):
+            shift_tree(self.result, lines, positions)
+        elif self.result is not None:
+            self.result = shift_parse_error(self.result, lines, positions)
+        self.shifted_position = position
+        self.shifted_line = line
+
+
+class IncrementalParser:
+    """
+    Keeps the segments of `text` and their trees between edits.
+
+    `results` returns the same as `parse_string(lark, info, text)`, the
+    trees are shared with the parser and later edits move them.
+    """
+
+    def __init__(self, lark: Lark, info: FileInfo, text: str = ""):
+        self.lark = lark
+        self.info = info
+        self.text = ""
+        self.lines = 0
+        # In source order
+        self._before: list[Segment] = []
+        # In reverse source order
+        self._after: list[Segment] = []
+        # Number of unclosed block comments in `_before`
+        self._unclosed_before = 0
+        # Number of segments parsed by the last edit
+        self.reparsed = 0
+        self.edit(0, 0, text)
+
+    def _to_before(self, segment: Segment) -> Segment:
+        segment.position += len(self.text)
+        segment.line += self.lines
+        return segment
+
+    def _to_after(self, segment: Segment) -> Segment:
+        segment.position -= len(self.text)
+        segment.line -= self.lines
+        return segment
+
+    def _push_before(self, segment: Segment) -> None:
+        if isinstance(segment.item, MissedBlockCommentClose):
+            self._unclosed_before += 1
+        self._before.append(segment)
+
+    def _pop_before(self) -> Segment:
+        segment = self._before.pop()
+        if isinstance(segment.item, MissedBlockCommentClose):
+            self._unclosed_before -= 1
+        return segment
+
+    def _move_gap(self, start: int) -> None:
+        """
+        Leaves in `_before` the regions that start far enough before
+        `start` to not be changed by an edit at `start`.
+
+        The search for the end of an unclosed block comment went until
+        the end of the text, any edit after it may close it.
+        """
+        limit = start - region_start_lookahead
+        while (
+            self._after and self._after[-1].position + len(self.text) <= limit
+        ):
+            self._push_before(self._to_before(self._after.pop()))
+        while self._before and (
+            limit < self._before[-1].position or self._unclosed_before > 0
+        ):
+            self._after.append(self._to_after(self._pop_before()))
+
+    def edit(self, start: int, end: int, replacement: str) -> None:
+        """
+        Replaces the characters from `start` to `end` by `replacement`.
+        """
+        if not 0 <= start <= end <= len(self.text):
+            raise ValueError(
+                f"invalid edit range {start}-{end} for {len(self.text)}"
+            )
+        self._move_gap(start)
+        # Segments found again are parsed again only if their text changed
+        reusable: dict[str, list[Segment]] = {}
+
+        def discard(segment: Segment) -> None:
+            if isinstance(segment.item, WordStart):
+                reusable.setdefault(segment.item.chunk, []).append(segment)
+
+        position, line = 0, 0
+        if self._before:
+            restart = self._pop_before()
+            discard(restart)
+            position, line = restart.position, restart.line
+        elif self._after and self._after[-1].position + len(self.text) == 0:
+            # The first region is split in another way, see `split_region`
+            discard(self._after.pop())
+        removed_lines = self.text.count("\n", start, end)
+        self.text = self.text[:start] + replacement + self.text[end:]
+        self.lines += replacement.count("\n") - removed_lines
+        new_end = start + len(replacement)
+        # The old segments that started before the end of the edit
+        while (
+            self._after and self._after[-1].position + len(self.text) < new_end
+        ):
+            discard(self._after.pop())
+        column = position - self.text.rfind("\n", 0, position) - 1
+        state = State(self.text, position, line, column)
+        self.reparsed = 0
+        while not state.is_at_end():
+            position, line = state.position, state.line
+            if 0 < position and new_end <= position:
+                while (
+                    self._after
+                    and self._after[-1].position + len(self.text) < position
+                ):
+                    discard(self._after.pop())
+                if (
+                    self._after
+                    and self._after[-1].position + len(self.text) == position
+                ):
+                    return
+            for item in split_region(state, position == 0):
+                if isinstance(item, (WordStart, SegmenterError)):
+                    self._push_before(
+                        self._new_segment(position, line, item, reusable)
+                    )
+        while self._after:
+            discard(self._after.pop())
+
+    def _new_segment(
+        self,
+        position: int,
+        line: int,
+        item: WordStart | SegmenterError,
+        reusable: dict[str, list[Segment]],
+    ) -> Segment:
+        if isinstance(item, SegmenterError):
+            return Segment(position, line, item, None, position, line)
+        old = reusable.get(item.chunk)
+        if not old:
+            self.reparsed += 1
+            result = parse_segment(self.lark, self.info, item)
+            return Segment(position, line, item, result, position, line)
+        segment = old.pop()
+        segment.shift_to(
+            segment.shifted_position
+            + item._range.position_start
+            - segment.item._range.position_start,
+            segment.shifted_line
+            + item._range.line_start
+            - segment.item._range.line_start,
+        )
+        return Segment(position, line, item, segment.result, position, line)
+
+    def _segments(self) -> list[Segment]:
+        """
+        All the segments in source order with their positions updated.
+        """
+        for segment in self._before:
+            segment.shift_to(segment.position, segment.line)
+        for segment in reversed(self._after):
+            segment.shift_to(
+                segment.position + len(self.text), segment.line + self.lines
+            )
+        return self._before + self._after[::-1]
+
+    def results(self) -> list[Tree[Token] | ParseError]:
+        out: list[Tree[Token] | ParseError] = []
+        for segment in self._segments():
+            if isinstance(segment.item, SegmenterError):
+                out.append(SegmentationError(self.info, segment.item))
+            else:
+                assert segment.result is not None
+                out.append(segment.result)
+        return out
+
+    def errors(self) -> list[ParseError]:
+        """
+        Like the errors in `results` but without moving the trees.
+        """
+        out: list[ParseError] = []
+        for segment in self._before:
+            if not isinstance(segment.result, Tree):
+                segment.shift_to(segment.position, segment.line)
+                out.append(self._error(segment))
+        for segment in reversed(self._after):
+            if not isinstance(segment.result, Tree):
+                segment.shift_to(
+                    segment.position + len(self.text),
+                    segment.line + self.lines,
+                )
+                out.append(self._error(segment))
+        return out
+
+    def _error(self, segment: Segment) -> ParseError:
+        if isinstance(segment.item, SegmenterError):
+            return SegmentationError(self.info, segment.item)
+        assert isinstance(segment.result, ParseError)
+        return segment.result
@@ -1,8 +1,50 @@
+"""
+The "Indentation Token Injection" stage of design/Parser.md.
+
+`Layout.process` reads the tokens of a segment and adds virtual tokens
+where the indentation opens, separates and closes blocks, like the
+layout algorithm of Haskell and Purescript. The contexts are kept in an
+explicit stack instead of the calling stack, so the pass is a single
+loop over the tokens and deep nesting can't overflow the stack.
+
+A layout keyword (`let`, `of`) opens a block at the column of the next
+token. Then, for the first token of every line:
+
+- A column smaller than the one of the innermost block closes it, and
+  we check again with the next block.
+- A column equal to the one of the innermost block separates two items
+  of the block.
+- A bigger column continues the current item.
+
+`in` closes the block of its `let` and a closing parenthesis or brace
+closes the blocks opened after the opening one. Inside parentheses and
+braces the indentation is ignored until a new block is opened.
+
+The `where` of the module header isn't a layout keyword, the segmenter
+already splits the top level.
+
+A `Layout` is also a lark postlexer (see `default_parser_options`), the
+errors of the last segment are in `errors`.
+"""
 from dataclasses import dataclass
-from typing import Iterable, Optional
+from enum import Enum, auto
+from typing import Iterable, Iterator, Optional
+
+from lark import Token
 
 from Degumin.Common.Error import DeguminError
-from Degumin.Parser.Token import Token
+
+LAYOUT_OPEN = "LAYOUT_OPEN"
+LAYOUT_SEPARATOR = "LAYOUT_SEPARATOR"
+LAYOUT_CLOSE = "LAYOUT_CLOSE"
+
+layout_keywords = frozenset(["LET", "OF"])
+delimiters = {"LPAREN": "RPAREN", "LBRACE": "RBRACE", "LBRACKET": "RBRACKET"}
+closing_delimiters = frozenset(delimiters.values())
+
+# Segments start at column 1 (lark columns start at 1), everything else
+# in the segment must be to the right of it.
+segment_column = 1
 
 
 class IndenterError(DeguminError):
@@ -16,34 +58,164 @@ class MissIndented(IndenterError):
     maybe_previous_indentation_token: Optional[Token]
 
 
-def make_token_error_at(token: Token, err: IndenterError):
-    pass
+class ContextKind(Enum):
+    BLOCK = auto()
+    LET_BLOCK = auto()
+    # A `let` block closed by the indentation, still waiting for its `in`
+    PENDING_IN = auto()
+    DELIMITER = auto()
 
 
-def handle_let(
-    let: Token,
-    tokens: list[Token],
-    last_identation_level: int,
-    maybe_previous_indentation_token: Optional[Token],
-) -> list[Token]:
-    if let.column <= last_identation_level:
-        raise MissIndented(
-            let, last_identation_level, maybe_previous_indentation_token
-        )
-    if len(tokens) == 0:
-        # this is a parsing error, we should just return the let token
-        return [let]
+@dataclass
+class Context:
+    kind: ContextKind
+    # The column of the first token of a block, of the `let` for
+    # PENDING_IN and of the opening token for DELIMITER.
+    column: int
+    token: Token
+
+
+def virtual_token(_type: str, token: Token, at_end: bool = False) -> Token:
+    """
+    An empty token at the start of `token`, or at its end.
+    """
+    if at_end:
+        position, line, column = token.end_pos, token.end_line, token.end_column
     else:
-        first_token = tokens[0]
-        # We have last_identation_level < let.column
-        if first_token.column <= let.column:
-            raise MissIndented(first_token, let.column, let)
-        else:
-            # take tokens until we find another speciall token and delegate the task to them or we found the `in` token.
-            pass
+        position, line, column = token.start_pos, token.line, token.column
+    return Token(_type, "", position, line, column, line, column, position)
 
-    return []
 
+class Layout:
+    # The contextual lexer reads a token in the parser state before the
+    # virtual tokens we add in front of it, so the tokens that can follow
+    # a virtual one must be accepted in every state: the start of a block
+    # item and the tokens that close blocks.
+    always_accept: tuple[str, ...] = (
+        "IDENTIFIER",
+        "DEFAULT",
+        "HOLE",
+        "SEMI_COLON",
+        "IN",
+        "RPAREN",
+        "RBRACE",
+        "RBRACKET",
+    )
 
-def segment_file(text: str) -> Iterable[Token]:
-    pass
+    def __init__(self, keywords: frozenset[str] = layout_keywords):
+        self.keywords = keywords
+        self.errors: list[IndenterError] = []
+
+    def __repr__(self) -> str:
+        # Part of the key of the parser cache, it must not change between
+        # runs.
+        return f"Layout({sorted(self.keywords)!r})"
+
+    def process(self, tokens: Iterable[Token]) -> Iterator[Token]:
+        """
+        The tokens of one segment with the layout tokens added, the
+        errors are in `self.errors`.
+        """
+        self.errors = []
+        stack: list[Context] = []
+        # The layout keyword whose block starts at the next token
+        opening: Optional[Token] = None
+        last: Optional[Token] = None
+        for token in tokens:
+            if opening is not None:
+                yield from self.open_block(stack, opening, token)
+                opening = None
+            elif last is not None and token.line != last.end_line:
+                yield from self.new_line(stack, token)
+            if token.type == "IN":
+                yield from self.close_let(stack, token)
+            elif token.type in delimiters:
+                stack.append(
+                    Context(ContextKind.DELIMITER, token.column, token)
+                )
+            elif token.type in closing_delimiters:
+                yield from self.close_delimiter(stack, token)
+            yield token
+            if token.type in self.keywords:
+                opening = token
+            last = token
+        if last is None:
+            return
+        if opening is not None:
+            # An empty block
+            yield virtual_token(LAYOUT_OPEN, last, True)
+            yield virtual_token(LAYOUT_CLOSE, last, True)
+        while stack:
+            context = stack.pop()
+            if context.kind in (ContextKind.BLOCK, ContextKind.LET_BLOCK):
+                yield virtual_token(LAYOUT_CLOSE, last, True)
+
+    def open_block(
+        self, stack: list[Context], keyword: Token, token: Token
+    ) -> Iterator[Token]:
+        level = segment_column
+        for context in reversed(stack):
+            if context.kind in (ContextKind.BLOCK, ContextKind.LET_BLOCK):
+                level = context.column
+                break
+        if token.column <= level:
+            self.errors.append(MissIndented(token, level + 1, keyword))
+        kind = (
+            ContextKind.LET_BLOCK
+            if keyword.type == "LET"
+            else ContextKind.BLOCK
+        )
+        stack.append(Context(kind, token.column, keyword))
+        yield virtual_token(LAYOUT_OPEN, token)
+
+    def new_line(self, stack: list[Context], token: Token) -> Iterator[Token]:
+        while stack and stack[-1].kind != ContextKind.DELIMITER:
+            context = stack[-1]
+            if context.column < token.column:
+                return
+            if context.column == token.column:
+                if (
+                    context.kind != ContextKind.PENDING_IN
+                    and token.type != "IN"
+                ):
+                    yield virtual_token(LAYOUT_SEPARATOR, token)
+                return
+            stack.pop()
+            if context.kind == ContextKind.PENDING_IN:
+                continue
+            yield virtual_token(LAYOUT_CLOSE, token)
+            if context.kind == ContextKind.LET_BLOCK:
+                let = context.token
+                stack.append(Context(ContextKind.PENDING_IN, let.column, let))
+
+    def close_let(self, stack: list[Context], token: Token) -> Iterator[Token]:
+        """
+        Closes the blocks up to the `let` of `token`. If there is no
+        such `let` the parser will report the `in`.
+        """
+        for depth in range(len(stack) - 1, -1, -1):
+            kind = stack[depth].kind
+            if kind == ContextKind.DELIMITER:
+                return
+            if kind in (ContextKind.LET_BLOCK, ContextKind.PENDING_IN):
+                break
+        else:
+            return
+        while len(stack) > depth:
+            context = stack.pop()
+            if context.kind != ContextKind.PENDING_IN:
+                yield virtual_token(LAYOUT_CLOSE, token)
+
+    def close_delimiter(
+        self, stack: list[Context], token: Token
+    ) -> Iterator[Token]:
+        for depth in range(len(stack) - 1, -1, -1):
+            if stack[depth].kind == ContextKind.DELIMITER:
+                break
+        else:
+            # Unbalanced, the parser will report it
+            return
+        while len(stack) > depth:
+            context = stack.pop()
+            if context.kind in (ContextKind.BLOCK, ContextKind.LET_BLOCK):
+                yield virtual_token(LAYOUT_CLOSE, token)
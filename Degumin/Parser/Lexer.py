@@ -2,8 +2,9 @@ from __future__ import annotations
 
 import re
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
-from typing import Generic, Optional, Type, TypeVar, Union
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from typing import Generic, Iterator, Optional, TextIO, Type, TypeVar, Union
 
 from Degumin.Common.Error import DeguminError
 from Degumin.Common.File import Range
@@ -50,70 +51,160 @@ class MissedBlockCommentClose(SegmenterError):
         return visitor.visit_missed_block_coment_close(self)
 
 
+class NeedMoreText(Exception):
+    """
+    Raised by `State` when `final` is False and we can't decide what to
+    do without looking past the end of `text`.
+    """
+
+
 @dataclass
 class State:
+    """
+    A cursor over `text`.
+
+    The cursor only moves forward and never copies the text, every
+    match is done in place with `pattern.match(text, position)` and the
+    line and column are updated from the newlines between the old and
+    the new position.
+
+    `text` may be only a window of the source, `offset` is the position
+    of its first character in the source and `final` tells if the source
+    ends with `text`.
+    """
+
     text: str
     position: int
     line: int
     column: int
+    offset: int = 0
+    final: bool = True
+    # Start of every "\n-+}" in `text` by number of hyphens. It is only
+    # built once we fail to find the end of a block comment, so a
+    # sequence of unclosed comments doesn't scan the rest of the text
+    # once per comment.
+    closers: Optional[dict[int, list[int]]] = field(
+        default=None, repr=False, compare=False
+    )
 
-    def advance_assuming_text(self, text: str) -> Range:
+    def advance_to(self, position: int) -> Range:
         old_position = self.position
         old_line = self.line
         old_column = self.column
-        self.position = old_position + len(text)
-        self.line = old_line + text.count("\n")
-        self.column = len(text[::-1].split("\n", maxsplit=1)[0])
+        new_lines = self.text.count("\n", old_position, position)
+        if new_lines == 0:
+            self.column = old_column + position - old_position
+        else:
+            self.line = old_line + new_lines
+            last_line_break = self.text.rfind("\n", old_position, position)
+            self.column = position - last_line_break - 1
+        self.position = position
         return Range(
             line_start=old_line,
             line_end=self.line,
             column_start=old_column,
             column_end=self.column,
-            position_start=old_position,
-            position_end=self.position,
+            position_start=self.offset + old_position,
+            position_end=self.offset + self.position,
         )
 
+    def require_text_after(self, position: int) -> None:
+        if not self.final and len(self.text) <= position:
+            raise NeedMoreText()
+
+    def discard_consumed(self) -> None:
+        """
+        Drops the text before the cursor.
+        """
+        self.text = self.text[self.position :]
+        self.offset += self.position
+        self.position = 0
+        self.closers = None
+
     def match(self, pattern: re.Pattern) -> Optional[tuple[str, Range]]:
-        result = pattern.match(self.text[self.position :])
+        result = pattern.match(self.text, self.position)
         if result is None:
             return None
-        matched = self.text[self.position : self.position + result.end()]
-        _range = self.advance_assuming_text(matched)
-        return (matched, _range)
+        _range = self.advance_to(result.end())
+        return (result.group(), _range)
+
+    def take_until(self, position: int) -> tuple[str, Range]:
+        text = self.text[self.position : position]
+        return (text, self.advance_to(position))
 
-    def start_match(self, pattern=str) -> Optional[Range]:
+    def start_match(self, pattern: re.Pattern) -> Optional[Range]:
         """
-        Pattern shouldn't contain "\n"
+        Pattern must start with a "\n", if it matches we only consume
+        the "\n".
         """
-        if pattern.count("\n") > 0:
+        if pattern.match(self.text, self.position) is None:
             return None
-        text = self.get_remaining_text()
-        real_pattern = r"\n" + pattern
-        print(
-            "starts with",
-            real_pattern.replace("\n", "\\n"),
-            "?",
-            text.replace("\n", "\\n"),
-            text.startswith(real_pattern),
-        )
-        if re.match(real_pattern, (text)):
-            print("matched")
-            _range = self.advance_assuming_text("\n")
-            return _range
-        return None
-
-    def get_remaining_text(self) -> str:
-        return self.text[self.position :]
+        return self.advance_to(self.position + 1)
 
     def advance_to_next_control_point(self) -> None:
-        text = self.get_remaining_text()
-        match_result = indented_line_start_regex.search(text)
-        print("SEARCH result = ", match_result)
+        """
+        Moves the cursor to the "\n" before the next character at
+        indentation 0 or to the end of the text.
+        """
+        match_result = indented_line_start_regex.search(
+            self.text, self.position
+        )
         if match_result is None:
-            self.advance_assuming_text(text)
+            self.require_text_after(len(self.text))
+            self.advance_to(len(self.text))
         else:
-            new_text = text[match_result.end() :]
-            self.advance_assuming_text(new_text)
+            self.advance_to(match_result.start())
+
+    def find_line_end(self) -> int:
+        end = self.text.find("\n", self.position)
+        if end == -1:
+            self.require_text_after(len(self.text))
+            return len(self.text)
+        return end
+
+    def find_word_end(self) -> int:
+        """
+        A word segment ends at the first "\n" that is followed by the
+        start of a new segment.
+        """
+        match_result = world_end_regex.search(self.text, self.position)
+        if match_result is None:
+            self.require_text_after(len(self.text))
+            return len(self.text)
+        # It may be a "\n" at the end of the window instead of the source
+        self.require_text_after(match_result.end())
+        return match_result.start()
+
+    def find_multi_line_comment_end(
+        self, number_of_hyphens: int
+    ) -> Optional[int]:
+        """
+        Returns the position after the "-}" that closes the block comment
+        at the cursor.
+        """
+        body_start = self.position + number_of_hyphens + 1
+        if self.closers is None:
+            closing = "\n" + number_of_hyphens * "-" + "}"
+            closing_start = self.text.find(closing, body_start)
+            if closing_start != -1:
+                return closing_start + len(closing)
+            self.require_text_after(len(self.text))
+            self.closers = {}
+            for closer in multi_line_comment_end_regex.finditer(
+                self.text, body_start
+            ):
+                self.closers.setdefault(len(closer.group(1)), []).append(
+                    closer.start()
+                )
+            return None
+        candidates = self.closers.get(number_of_hyphens, [])
+        index = bisect_left(candidates, body_start)
+        if index == len(candidates):
+            return None
+        return candidates[index] + number_of_hyphens + 2
+
+    def current_character(self) -> str:
+        return self.text[self.position]
 
     def is_at_end(self) -> bool:
         return len(self.text) <= self.position
@@ -196,67 +287,72 @@ class WordStart(CodeChunk):
         return visitor.visit_WordStart(self)
 
 
-line_comment_inner = r"--.*"
-line_comment_inner_regex = re.compile(line_comment_inner)
-line_comment_regex = re.compile(r"\n" + line_comment_inner)
 line_break_regex = re.compile(r" *\n *")
+spaces_regex = re.compile(r" *")
 indented_line_start_regex = re.compile(r"\n[^ \n]")
 
+line_comment_start = r"\n--"
+line_comment_start_regex = re.compile(line_comment_start)
+
 multi_line_comment_start_inner = r"{-+"
 multi_line_comment_start_inner_regex = re.compile(
     multi_line_comment_start_inner
 )
 multi_line_comment_start = r"\n" + multi_line_comment_start_inner
 multi_line_comment_start_regex = re.compile(multi_line_comment_start)
+multi_line_comment_end_regex = re.compile(r"\n(-+)}")
 
-
-world_start_inner = r"\w(.|\n)*(?=\n\w|\n--|\n\(|\n\{-|$)"
-world_start_inner_regex = re.compile(world_start_inner)
+world_start_inner_regex = re.compile(r"\w")
+world_start_regex = re.compile(r"\n\w")
+# Every alternative has a fixed length, the search never backtracks.
+world_end_regex = re.compile(r"\n(?=\w|--|\(|\{-|\Z)")
 
 
 def match_line_comment_inner(state: State) -> Optional[LineComment]:
-    matched = state.match(line_comment_inner_regex)
-    if matched is None:
+    if not state.text.startswith("--", state.position):
         return None
-    text, _range = matched
+    text, _range = state.take_until(state.find_line_end())
     # we must trim the -- of the comment
     return LineComment(NonLineBreakString(text[2:]), _range=_range)
 
 
 def match_line_comment(state: State) -> Optional[LineComment]:
-    start_range = state.start_match("--")
+    start_range = state.start_match(line_comment_start_regex)
     if start_range is None:
         return None
     return match_line_comment_inner(state)
 
 
 def match_line_break(state: State) -> Optional[LineBreak]:
-    matched = state.match(line_break_regex)
-    if matched is None:
+    result = line_break_regex.match(state.text, state.position)
+    if result is None:
+        spaces = spaces_regex.match(state.text, state.position)
+        state.require_text_after(spaces.end())  # type:ignore
         return None
-    _, _range = matched
-    return LineBreak(_range=_range)
+    state.require_text_after(result.end())
+    return LineBreak(_range=state.advance_to(result.end()))
 
 
 def match_multi_line_comment_inner(
     state: State,
 ) -> Optional[MultiLineComment | MissedBlockCommentClose]:
-    text = state.get_remaining_text()
-    matched = re.match("{-+", text)
+    matched = multi_line_comment_start_inner_regex.match(
+        state.text, state.position
+    )
     if matched is None:
         return None
-    number_of_hyphens = matched.end() - 1
-    repated_hyphens = number_of_hyphens * r"-"
-    new_regex = re.compile(
-        r"{" + repated_hyphens + r"(.|\n)*\n" + repated_hyphens + r"}"
-    )
-    real_matched = state.match(new_regex)
-    if real_matched is None:
-        return MissedBlockCommentClose(state.line, state.column, state.position)
-    match_result, match_range = real_matched
+    state.require_text_after(matched.end())
+    opening_length = matched.end() - matched.start()
+    number_of_hyphens = opening_length - 1
+    end = state.find_multi_line_comment_end(number_of_hyphens)
+    if end is None:
+        return MissedBlockCommentClose(
+            state.line, state.column, state.offset + state.position
+        )
+    match_result, match_range = state.take_until(end)
     line_counter = 0
     result: list[LineBreak | NonLineBreakString] = []
-    for item in match_result[matched.end() : -matched.end() - 1].split("\n"):
+    for item in match_result[opening_length : -opening_length - 1].split("\n"):
         if item:
             if item.lstrip():
                 result.append(NonLineBreakString(item.rstrip()))
@@ -273,41 +369,42 @@ def match_multi_line_comment_inner(
 def match_multi_line_comment(
     state: State,
 ) -> Optional[MultiLineComment | MissedBlockCommentClose]:
-    start_range = state.start_match("{-+")
+    start_range = state.start_match(multi_line_comment_start_regex)
     if start_range is None:
         return None
     return match_multi_line_comment_inner(state)
 
 
 def match_word_inner(state: State) -> Optional[WordStart]:
-    matched = state.match(world_start_inner_regex)
-    if matched is None:
+    if world_start_inner_regex.match(state.text, state.position) is None:
         return None
-    text, _range = matched
+    text, _range = state.take_until(state.find_word_end())
     return WordStart(text, _range=_range)
 
 
 def match_word(state: State) -> Optional[WordStart]:
-    start_range = state.start_match(r"\w")
+    start_range = state.start_match(world_start_regex)
     if start_range is None:
         return None
     return match_word_inner(state)
 
 
-def split_by_indentation(
-    text: str,
-) -> tuple[list[Chunk_Type], list[SegmenterError]]:
-    """Every time we find text at the begining of a line, we know
-    we found a new region of things to parse, this function
-    split a text in all of this regions.
-    """
-    if len(text) == 0:
-        return ([], [])
-    state = State(text, 0, 0, 0)
+# Enough text to know what kind of region starts at the cursor
+region_start_lookahead = len("\n{-")
 
-    out: list[Chunk_Type] = []
-    errors: list[SegmenterError] = []
-    if text[0] != "\n":
+
+def split_region(
+    state: State, is_first: bool
+) -> list[Chunk_Type | SegmenterError]:
+    """
+    Consumes the region at the cursor and returns its chunks and errors
+    in the order they appear.
+    If `state.final` is False this may raise `NeedMoreText`, the
+    cursor is left in an unspecified position in that case.
+    """
+    state.require_text_after(state.position + region_start_lookahead - 1)
+    out: list[Chunk_Type | SegmenterError] = []
+    if is_first and state.current_character() != "\n":
         for f in [
             match_line_comment_inner,
             match_word_inner,
@@ -316,78 +413,126 @@ def split_by_indentation(
         ]:
             match_result = f(state)
             if match_result is not None:
-                if isinstance(match_result, CodeChunk):
-                    print(
-                        "FOUND: ",
-                        match_result,
-                        f,
-                        state.get_remaining_text().replace("\n", "\\n"),
-                    )
-                    out.append(match_result)
-                    break
-                else:
-                    print("matched {- but not matched -}")
-                    errors.append(match_result)
+                out.append(match_result)
+                if not isinstance(match_result, CodeChunk):
                     state.advance_to_next_control_point()
-        if len(out) == 0:
-            errors.append(
-                UnexpectedCharacterAtIndentationZero(state.text[0], state.line)
+                return out
+        out.append(
+            UnexpectedCharacterAtIndentationZero(
+                state.current_character(), state.line
             )
-            state.advance_to_next_control_point()
-    while not state.is_at_end():
-        found_one = False
-        for f in [
-            match_line_comment,
-            match_word,
-            match_multi_line_comment,
-            match_line_break,
-        ]:
-            match_result = f(state)
-            if match_result is not None:
-                if isinstance(match_result, CodeChunk):
-                    print(
-                        "FOUND: ",
-                        match_result,
-                        f,
-                        state.get_remaining_text().replace("\n", "\\n"),
-                    )
-                    if not isinstance(match_result, LineBreak):
-                        r = match_result._range
-                        _range = Range(
-                            r.line_end,
-                            r.line_end,
-                            0,
-                            0,
-                            r.position_end,
-                            r.position_end,
-                        )
-                        new_line_break = LineBreak(_range=_range)
-                        # print("injecting line break")
-                        out.append(new_line_break)
-                    out.append(match_result)
-                    found_one = True
-                    break
-                else:
+        )
+        state.advance_to_next_control_point()
+        return out
+    for f in [
+        match_line_comment,
+        match_word,
+        match_multi_line_comment,
+        match_line_break,
+    ]:
+        match_result = f(state)
+        if match_result is not None:
+            if isinstance(match_result, CodeChunk):
+                if not isinstance(match_result, LineBreak):
+                    r = match_result._range
                     _range = Range(
-                        match_result.line,
-                        match_result.line,
+                        r.line_end,
+                        r.line_end,
                         0,
                         0,
-                        match_result.position,
-                        match_result.position,
+                        r.position_end,
+                        r.position_end,
                     )
                     new_line_break = LineBreak(_range=_range)
-                    # print("injecting line break")
                     out.append(new_line_break)
-                    errors.append(match_result)
-                    state.advance_to_next_control_point()
-                    found_one = True
-                    break
+                out.append(match_result)
+            else:
+                _range = Range(
+                    match_result.line,
+                    match_result.line,
+                    0,
+                    0,
+                    match_result.position,
+                    match_result.position,
+                )
+                new_line_break = LineBreak(_range=_range)
+                out.append(new_line_break)
+                out.append(match_result)
+                state.advance_to_next_control_point()
+            return out
+    out.append(
+        UnexpectedCharacterAtIndentationZero(
+            state.current_character(), state.line
+        )
+    )
+    state.advance_to_next_control_point()
+    return out
 
-        if not found_one:
-            print("NOT FOUND, advancing")
-            errors.append(
-                UnexpectedCharacterAtIndentationZero(state.text[0], state.line)
-            )
-            state.advance_to_next_control_point()
+
+def split_by_indentation(
+    text: str,
+) -> tuple[list[Chunk_Type], list[SegmenterError]]:
+    """Every time we find text at the begining of a line, we know
+    we found a new region of things to parse, this function
+    split a text in all of this regions.
+
+    This is done in a single forward pass over `text`, the end of every
+    region is found searching for the "\n" that starts the next one,
+    see `State`.
+    """
+    state = State(text, 0, 0, 0)
+    out: list[Chunk_Type] = []
+    errors: list[SegmenterError] = []
+    is_first = True
+    while not state.is_at_end():
+        for item in split_region(state, is_first):
+            if isinstance(item, CodeChunk):
+                out.append(item)
+            else:
+                errors.append(item)
+        is_first = False
     return (out, errors)
+
+
+default_block_size = 64 * 1024
+
+
+def iter_segments(
+    stream: TextIO, block_size: int = default_block_size
+) -> Iterator[Chunk_Type | SegmenterError]:
+    """
+    Like `split_by_indentation` but reads `stream` in blocks and yields
+    the chunks and errors of a region as soon as we find where the
+    region ends.
+
+    Only the unfinished region is kept in memory, so the memory we
+    use depends on the biggest region, not on the size of the stream.
+    """
+    state = State("", 0, 0, 0, final=False)
+    is_first = True
+    while True:
+        if state.is_at_end():
+            if state.final:
+                return
+            read_more(state, stream, block_size)
+            continue
+        position, line, column = state.position, state.line, state.column
+        try:
+            items = split_region(state, is_first)
+        except NeedMoreText:
+            state.position, state.line, state.column = position, line, column
+            read_more(state, stream, block_size)
+            continue
+        is_first = False
+        yield from items
+
+
+def read_more(state: State, stream: TextIO, block_size: int) -> None:
+    state.discard_consumed()
+    # Reading at least what we already have keeps the retries of a long
+    # region linear on its size.
+    more = stream.read(max(block_size, len(state.text)))
+    if more:
+        state.text += more
+    else:
+        state.final = True
@@ -1,19 +1,36 @@
-from dataclasses import dataclass
+import hashlib
+import importlib
+import io
+import os
+import pickle
+import tempfile
+from collections import OrderedDict
+from dataclasses import dataclass, replace
 from pathlib import Path
-from typing import Iterable, Optional
+from typing import Any, Iterable, Iterator, Optional, TextIO
 
+import lark as lark_module
 from lark import (
     GrammarError,
     Lark,
+    Transformer,
     Tree,
     UnexpectedCharacters,
     UnexpectedInput,
     UnexpectedToken,
 )
+from lark import Token as LarkToken
 
 from Degumin.Common.Error import DeguminError
-from Degumin.Common.File import FileInfo
-from Degumin.Parser.Token import Token
+from Degumin.Common.File import FileInfo, Range
+from Degumin.Common.Source import MappedSource
+from Degumin.Parser.Indentation import Layout, MissIndented
+from Degumin.Parser.Lexer import SegmenterError, WordStart, iter_segments
+from Degumin.Parser.Token import Token, TokenStream
+
+grammar_path = Path(__file__).parent / "Grammar.lark"
+generated_parser_module = "Degumin.Parser.GeneratedParser"
+generated_parser_path = Path(__file__).parent / "GeneratedParser.py"
 
 
 class ParseError(DeguminError):
@@ -36,63 +53,567 @@ class FileLoadError(ParseError):
     info: FileInfo
 
 
+@dataclass
+class SegmentationError(ParseError):
+    info: FileInfo
+    error: SegmenterError
+
+
+# Lark couldn't parse a segment, positions follow the lark convention
+# (lines and columns start at 1) and are absolute in the file.
+@dataclass
+class LarkParseError(ParseError):
+    info: FileInfo
+    line: int
+    column: int
+    position: int
+    context: str
+
+
+# The layout pass found a block that doesn't start to the right of the
+# enclosing one, positions are like the ones of LarkParseError.
+@dataclass
+class LayoutParseError(ParseError):
+    info: FileInfo
+    line: int
+    column: int
+    position: int
+    expected_column: int
+
+
+def default_cache_directory() -> Path:
+    directory = os.environ.get("DEGUMIN_CACHE_DIR")
+    if directory:
+        return Path(directory)
+    xdg_cache = os.environ.get("XDG_CACHE_HOME")
+    if xdg_cache:
+        return Path(xdg_cache) / "degumin"
+    return Path.home() / ".cache" / "degumin"
+
+
+def parser_cache_enabled() -> bool:
+    return not os.environ.get("DEGUMIN_NO_PARSER_CACHE")
+
+
+def parser_cache_key(grammar: str, options: dict[str, Any]) -> str:
+    content = repr((lark_module.__version__, grammar, sorted(options.items())))
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def load_parser_data(
+    data: dict[str, Any],
+    memo: dict[str, Any],
+    transformer: Optional[Transformer] = None,
+) -> Lark:
+    """
+    The postlexer and the transformer aren't saved with the parser (see
+    `save_cached_parser`), every parser loaded gets its own.
+    """
+    return Lark._load_from_dict(
+        data, memo, postlex=Layout(), transformer=transformer
+    )
+
+
+def load_cached_parser(
+    path: Path, transformer: Optional[Transformer] = None
+) -> Optional[Lark]:
+    try:
+        with open(path, "rb") as file:
+            saved = pickle.load(file)
+        return load_parser_data(saved["data"], saved["memo"], transformer)
+    except Exception:
+        # Missing, truncated or written by another version of lark.
+        return None
+
+
+def write_atomically(path: Path, data: bytes) -> None:
+    """
+    Writes to a temporary file and renames it, so concurrent readers
+    see either the old file or the complete new one.
+    """
+    temporary: Optional[str] = None
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            "wb", dir=path.parent, prefix=path.name, delete=False
+        ) as file:
+            temporary = file.name
+            file.write(data)
+        os.replace(temporary, path)
+    except OSError:
+        # The caches are only an optimization, we can live without them.
+        if temporary is not None:
+            try:
+                os.unlink(temporary)
+            except OSError:
+                pass
+
+
+def save_cached_parser(parser: Lark, path: Path) -> None:
+    data = io.BytesIO()
+    parser.save(data, exclude_options=["postlex", "transformer"])
+    write_atomically(path, data.getvalue())
+
+
+def default_parser_options(
+    debug: bool = False,
+    start_symbols: list[str] = ["module", "segment"],
+) -> dict[str, Any]:
+    return {
+        "start": start_symbols,
+        "debug": debug,
+        "propagate_positions": False,
+        "maybe_placeholders": True,
+        "keep_all_tokens": True,
+        "parser": "lalr",
+        # Only the terminals the parser accepts in the current state (and
+        # the ones of `Layout.always_accept`) are tried.
+        "lexer": "contextual",
+        "postlex": Layout(),
+    }
+
+
+def load_standalone_parser(
+    key: str, transformer: Optional[Transformer] = None
+) -> Optional[Lark]:
+    """
+    Loads the parser generated by `Degumin.Parser.Standalone` if it was
+    generated with the same grammar and options.
+    """
+    try:
+        module = importlib.import_module(generated_parser_module)
+    except ImportError:
+        return None
+    if getattr(module, "GRAMMAR_KEY", None) != key:
+        return None
+    try:
+        return load_parser_data(module.DATA, module.MEMO, transformer)
+    except Exception:
+        return None
+
+
+def read_grammar() -> Optional[str]:
+    try:
+        with open(grammar_path, "r") as grammarFile:
+            return grammarFile.read()
+    except OSError:
+        return None
+
+
 def load_grammar(
-    debug: Optional[bool] = None, start_symbols: Optional[list[str]] = ["start"]
+    debug: Optional[bool] = None,
+    start_symbols: Optional[list[str]] = ["module", "segment"],
+    use_cache: Optional[bool] = None,
+    cache_directory: Optional[Path] = None,
+    use_standalone: bool = True,
+    transformer: Optional[Transformer] = None,
 ) -> LoadGrammarError | LarkLoadError | Lark:
+    """
+    Builds the parser from Grammar.lark.
+
+    With a `transformer` the parser calls it on every rule as soon as
+    the rule is parsed (lark's `transformer` option of LALR), `parse`
+    returns its result and no tree is built. The tables don't depend on
+    it, every parser shares the same caches.
+
+    Building the LALR tables is the slow part of the startup. We first
+    try the tables generated at build time by `Degumin.Parser.Standalone`
+    and then the ones stored in `cache_directory` under a hash of the
+    grammar, the options and the lark version. `use_cache` defaults to
+    True unless the DEGUMIN_NO_PARSER_CACHE environment variable is set.
+    """
     if debug is None:
         debug = False
-    grammarPath = "Degumin/Grammar.lark"
     if start_symbols is None:
-        start_symbols = ["start"]
-    try:
-        with open(grammarPath, "r") as grammarFile:
-            grammar = grammarFile.read()
-            try:
-                parser = Lark(
-                    grammar,
-                    start=start_symbols,
-                    debug=debug,
-                    cache=None,
-                    propagate_positions=False,
-                    maybe_placeholders=True,
-                    keep_all_tokens=True,
-                    parser="lalr",
-                    lexer="basic",
-                    # postlex=Indenter(),
-                )
-            except Exception as e:
-                return LarkLoadError(str(e))
-    except OSError:
+        start_symbols = ["module", "segment"]
+    if use_cache is None:
+        use_cache = parser_cache_enabled()
+    if cache_directory is None:
+        cache_directory = default_cache_directory()
+    options = default_parser_options(debug, start_symbols)
+    grammar = read_grammar()
+    if grammar is None:
         return LoadGrammarError()
+    key = parser_cache_key(grammar, options)
+    if use_standalone:
+        parser = load_standalone_parser(key, transformer)
+        if parser is not None:
+            return parser
+    cache_path = cache_directory / ("parser-" + key + ".pickle")
+    if use_cache:
+        parser = load_cached_parser(cache_path, transformer)
+        if parser is not None:
+            return parser
+    try:
+        parser = Lark(grammar, cache=None, transformer=transformer, **options)
+    except Exception as e:
+        return LarkLoadError(str(e))
+    if use_cache:
+        save_cached_parser(parser, cache_path)
     return parser
 
 
-def parse_string(
-    lark: Lark, info: FileInfo, text: str
-) -> list[Tree[Token] | ParseError]:
-    results: list[Tree[Token] | ParseError] = []
-    # TODO: refactor this to return the list
+def shift_tree(tree: Tree[LarkToken], lines: int, positions: int) -> None:
+    """
+    Moves the tokens of `tree` `lines` lines and `positions` characters
+    forward, columns don't change.
+    """
+    for subtree in tree.iter_subtrees():
+        for child in subtree.children:
+            if isinstance(child, LarkToken):
+                child.line += lines  # type:ignore
+                child.end_line += lines  # type:ignore
+                child.start_pos += positions  # type:ignore
+                child.end_pos += positions  # type:ignore
+
+
+def shift_positions(tree: Tree[LarkToken], _range: Range) -> None:
+    """
+    Lark positions are relative to the parsed text, this moves them to
+    the place the segment at `_range` has in the file.
+    Segments start at column 0, so only lines and positions change.
+    """
+    shift_tree(tree, _range.line_start, _range.position_start)
+
+
+def shift_parse_error(
+    error: ParseError, lines: int, positions: int
+) -> ParseError:
+    if isinstance(error, (LarkParseError, LayoutParseError)):
+        return replace(
+            error, line=error.line + lines, position=error.position + positions
+        )
+    return error
+
+
+# A tree as nested lists [data, *children] and its tokens as tuples.
+# Pickling lark tokens loses their end positions.
+EncodedTree = list
+
+
+def encode_tree(tree: Tree[LarkToken]) -> EncodedTree:
+    encoded: EncodedTree = [tree.data]
+    for child in tree.children:
+        if isinstance(child, Tree):
+            encoded.append(encode_tree(child))
+        elif isinstance(child, LarkToken):
+            encoded.append(
+                (
+                    child.type,
+                    str(child),
+                    child.start_pos,
+                    child.line,
+                    child.column,
+                    child.end_line,
+                    child.end_column,
+                    child.end_pos,
+                )
+            )
+        else:
+            # The None of `maybe_placeholders`
+            encoded.append(child)
+    return encoded
+
+
+def decode_tree(
+    encoded: EncodedTree, lines: int, positions: int
+) -> Tree[LarkToken]:
+    """
+    The inverse of `encode_tree`, with the tokens moved like `shift_tree`
+    does.
+    """
+    children: list = []
+    for child in encoded[1:]:
+        if isinstance(child, list):
+            children.append(decode_tree(child, lines, positions))
+        elif isinstance(child, tuple):
+            _type, value, start, line, column, end_line, end_column, end = child
+            children.append(
+                LarkToken(
+                    _type,
+                    value,
+                    start + positions,
+                    line + lines,
+                    column,
+                    end_line + lines,
+                    end_column,
+                    end + positions,
+                )
+            )
+        else:
+            children.append(child)
+    return Tree(encoded[0], children)
+
+
+default_segment_cache_capacity = 16 * 1024
+
+
+class SegmentCache:
+    """
+    The result of parsing a segment by the hash of its text.
+
+    Results are stored with the positions lark gives them, relative to
+    the start of the segment, and moved to the place of the segment
+    every time we find it. The last `capacity` results used are kept in
+    memory, if `directory` is given every result is also written there
+    so later builds can use them.
+
+    `namespace` must change when the parser changes, see
+    `default_segment_cache`.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        capacity: int = default_segment_cache_capacity,
+        directory: Optional[Path] = None,
+    ):
+        self.namespace = namespace
+        self.capacity = capacity
+        self.directory = directory
+        # Pickled results, the ones at the end were used last
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def key(self, text: str) -> str:
+        content = self.namespace + "\0" + text
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def path(self, key: str) -> Path:
+        assert self.directory is not None
+        return self.directory / key[:2] / (key + ".pickle")
+
+    def _remember(self, key: str, data: bytes) -> None:
+        self._entries[key] = data
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+    def _read(self, key: str) -> Optional[bytes]:
+        if self.directory is None:
+            return None
+        try:
+            with open(self.path(key), "rb") as file:
+                return file.read()
+        except OSError:
+            return None
+
+    def get(
+        self, text: str, info: FileInfo, _range: Range
+    ) -> Optional[Tree[LarkToken] | ParseError]:
+        """
+        A new copy of the result of a segment with this text, moved to
+        `_range` in the file of `info`.
+        """
+        key = self.key(text)
+        data = self._entries.get(key)
+        if data is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+        else:
+            data = self._read(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._remember(key, data)
+            self.disk_hits += 1
+        try:
+            result = pickle.loads(data)
+        except Exception:
+            # Truncated or written by another version of Degumin.
+            del self._entries[key]
+            return None
+        if isinstance(result, list):
+            return decode_tree(result, _range.line_start, _range.position_start)
+        if isinstance(result, (LarkParseError, LayoutParseError)):
+            result = replace(result, info=info)
+        return shift_parse_error(
+            result, _range.line_start, _range.position_start
+        )
+
+    def put(self, text: str, result: Tree[LarkToken] | ParseError) -> None:
+        """
+        `result` must have the positions relative to the segment.
+        """
+        key = self.key(text)
+        encoded = encode_tree(result) if isinstance(result, Tree) else result
+        data = pickle.dumps(encoded, pickle.HIGHEST_PROTOCOL)
+        self._remember(key, data)
+        if self.directory is not None:
+            write_atomically(self.path(key), data)
+
+
+def default_segment_cache(
+    use_disk: Optional[bool] = None, cache_directory: Optional[Path] = None
+) -> SegmentCache:
+    """
+    A cache for the segments parsed with `load_grammar()`, stored in the
+    "segments" directory of the parser cache if `use_disk` is True.
+    `use_disk` defaults to `parser_cache_enabled()`.
+    """
+    if use_disk is None:
+        use_disk = parser_cache_enabled()
+    if cache_directory is None:
+        cache_directory = default_cache_directory()
+    namespace = parser_cache_key(read_grammar() or "", default_parser_options())
+    return SegmentCache(
+        namespace,
+        directory=cache_directory / "segments" if use_disk else None,
+    )
+
+
+def parse_chunk(lark: Lark, info: FileInfo, chunk: str) -> Any | ParseError:
+    """
+    Parses the text of a segment, the positions of the result and of the
+    errors are relative to it. The result is a tree unless `lark` was
+    loaded with a transformer.
+    """
+    result: Any = None
+    error: Optional[ParseError] = None
     try:
-        result = lark.parse(text)
-        return result  # type:ignore
+        result = lark.parse(chunk, start="segment")
     except UnexpectedInput as uinput:
-        return make_parse_error_from_lark_error(uinput, text, info)
+        error = make_parse_error_from_lark_error(uinput, chunk, info)
+    # A miss indented block is usually the reason lark failed
+    layout_error = get_layout_error(lark, info)
+    if layout_error is not None:
+        return layout_error
+    if error is not None:
+        return error
+    return result
+
+
+def parse_segment(
+    lark: Lark,
+    info: FileInfo,
+    segment: WordStart,
+    cache: Optional[SegmentCache] = None,
+) -> Tree[Token] | ParseError:
+    _range = segment._range
+    if cache is not None:
+        cached = cache.get(segment.chunk, info, _range)
+        if cached is not None:
+            return cached  # type:ignore
+    tree = parse_chunk(lark, info, segment.chunk)
+    if isinstance(tree, ParseError):
+        if cache is not None:
+            cache.put(segment.chunk, tree)
+        return shift_parse_error(tree, _range.line_start, _range.position_start)
+    if cache is not None:
+        cache.put(segment.chunk, tree)
+    shift_positions(tree, _range)
+    return tree  # type:ignore
+
+
+def get_layout_error(lark: Lark, info: FileInfo) -> Optional[ParseError]:
+    """
+    The first error found by the postlexer in the last segment parsed.
+    """
+    layout = lark.options.postlex
+    if not isinstance(layout, Layout) or not layout.errors:
+        return None
+    error = layout.errors[0]
+    assert isinstance(error, MissIndented)
+    token = error.token
+    return LayoutParseError(
+        info,
+        token.line,  # type:ignore
+        token.column,  # type:ignore
+        token.start_pos,  # type:ignore
+        error.expected_indentation_level,
+    )
+
+
+def iter_parse(
+    lark: Lark,
+    info: FileInfo,
+    stream: TextIO | MappedSource,
+    cache: Optional[SegmentCache] = None,
+) -> Iterator[Tree[Token] | ParseError]:
+    """
+    Parses the segments of `stream` as soon as the segmenter finds them,
+    the text of a segment is only kept while we parse it.
+    """
+    for item in iter_segments(stream):
+        if isinstance(item, WordStart):
+            yield parse_segment(lark, info, item, cache)
+        elif isinstance(item, SegmenterError):
+            yield SegmentationError(info, item)
+
+
+def parse_stream(
+    lark: Lark,
+    info: FileInfo,
+    stream: TextIO | MappedSource,
+    cache: Optional[SegmentCache] = None,
+) -> list[Tree[Token] | ParseError]:
+    return list(iter_parse(lark, info, stream, cache))
+
+
+def parse_string(
+    lark: Lark,
+    info: FileInfo,
+    text: str,
+    cache: Optional[SegmentCache] = None,
+) -> list[Tree[Token] | ParseError]:
+    return parse_stream(lark, info, io.StringIO(text), cache)
 
 
 def parse_file(
-    path: Path, lark: Lark, debug: bool
-) -> FileLoadError | tuple[FileInfo, ParseError | Tree[Token]]:
+    path: Path,
+    lark: Lark,
+    debug: bool,
+    cache: Optional[SegmentCache] = None,
+) -> FileLoadError | tuple[FileInfo, list[Tree[Token] | ParseError]]:
     info = FileInfo(path.name, path)
     try:
-        with open(path, "r") as file:
-            content = file.read()
-            maybe_tree = parse_string(lark, info, content)
-            return (info, maybe_tree)
-    except OSError:
+        with MappedSource(path) as source:
+            return (info, parse_stream(lark, info, source, cache))
+    except (OSError, UnicodeDecodeError):
         return FileLoadError(info)
 
 
+def lex_string(
+    lark: Lark, info: FileInfo, text: str
+) -> tuple[TokenStream, list[ParseError]]:
+    """
+    The tokens of every segment of `text`, without the ignored ones.
+    A segment with an error keeps the tokens before it.
+    """
+    stream = TokenStream(text)
+    errors: list[ParseError] = []
+    for item in iter_segments(io.StringIO(text)):
+        if isinstance(item, WordStart):
+            try:
+                stream.extend(lark.lex(item.chunk), item._range.position_start)
+            except UnexpectedInput as uinput:
+                errors.append(
+                    make_parse_error_from_lark_error(
+                        uinput, item.chunk, info, item._range
+                    )
+                )
+        elif isinstance(item, SegmenterError):
+            errors.append(SegmentationError(info, item))
+    return (stream, errors)
+
+
 def make_parse_error_from_lark_error(
-    err: UnexpectedInput, text: str, info: FileInfo
+    err: UnexpectedInput,
+    text: str,
+    info: FileInfo,
+    _range: Optional[Range] = None,
 ) -> ParseError:
-    pass
+    line = err.line
+    column = err.column
+    position = err.pos_in_stream
+    # UnexpectedEOF doesn't know where the text ends
+    if position is None or position < 0:
+        line = text.count("\n") + 1
+        column = len(text) - text.rfind("\n")
+        position = len(text)
+    if _range is not None:
+        line += _range.line_start
+        position += _range.position_start
+    return LarkParseError(info, line, column, position, err.get_context(text))
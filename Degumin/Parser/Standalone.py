@@ -0,0 +1,82 @@
+"""
+Generates GeneratedParser.py, a module with the tables of the parser
+built from Grammar.lark, so `load_grammar` doesn't need to load the
+grammar or build the tables.
+
+Run it with `python -m Degumin.Parser.Standalone` (or `make parser`)
+every time the grammar changes, `load_grammar` ignores the module if it
+was generated from another grammar.
+"""
+import os
+import tempfile
+from pathlib import Path
+from pprint import pformat
+
+from lark import Lark
+from lark import __version__ as lark_version
+from lark.grammar import Rule
+from lark.lexer import TerminalDef
+
+from Degumin.Parser.Parser import (
+    LarkLoadError,
+    LoadGrammarError,
+    default_parser_options,
+    generated_parser_path,
+    grammar_path,
+    load_grammar,
+    parser_cache_key,
+)
+
+header = '''"""
+Generated by `python -m Degumin.Parser.Standalone` from Grammar.lark
+with lark {lark_version}, don't edit it.
+"""
+from lark import Token
+
+GRAMMAR_KEY = {key!r}
+
+'''
+
+
+def generate_standalone_parser(
+    output: Path = generated_parser_path,
+) -> LoadGrammarError | LarkLoadError | Path:
+    parser = load_grammar(use_cache=False, use_standalone=False)
+    if not isinstance(parser, Lark):
+        return parser
+    with open(grammar_path, "r") as grammar_file:
+        key = parser_cache_key(grammar_file.read(), default_parser_options())
+    data, memo = parser.memo_serialize([TerminalDef, Rule])
+    # `load_standalone_parser` gives it a new postlexer
+    data["options"] = {
+        name: value
+        for name, value in data["options"].items()
+        if name != "postlex"
+    }
+    code = (
+        header.format(lark_version=lark_version, key=key)
+        + "DATA = "
+        + pformat(data, width=80)
+        + "\n\nMEMO = "
+        + pformat(memo, width=80)
+        + "\n"
+    )
+    with tempfile.NamedTemporaryFile(
+        "w", dir=output.parent, prefix=output.name, delete=False
+    ) as file:
+        file.write(code)
+    os.replace(file.name, output)
+    return output
+
+
+def main() -> None:
+    result = generate_standalone_parser()
+    if isinstance(result, Path):
+        print(f"Parser written to {result}")
+    else:
+        print(f"Couldn't build the parser: {result}")
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,10 @@
+from array import array
 from dataclasses import dataclass
+from typing import Iterable, Iterator, Optional
 
-from Degumin.Common.File import Range
+from lark import Token as LarkToken
+
+from Degumin.Common.File import LineIndex, Range
 
 
 @dataclass
@@ -8,3 +12,82 @@ class Token:
     _type: str
     value: str
     _range: Range
+
+
+class TokenStream:
+    """
+    The tokens of `text` stored by columns instead of one object by
+    token: the id of its type in `type_names` and the positions where
+    it starts and ends. Values are sliced from `text` and lines and
+    columns are found from the positions with a `LineIndex`, both only
+    when a `Token` is asked for.
+
+    Positions must fit in 32 bits. Lines and columns follow the lark
+    convention (starting at 1), so `stream[i]` has the same `Range` as
+    `token2Range` of the lark token it came from.
+    """
+
+    def __init__(self, text: str, line_index: Optional[LineIndex] = None):
+        self.text = text
+        self.type_names: list[str] = []
+        self._type_ids: dict[str, int] = {}
+        self.types = array("H")
+        self.starts = array("I")
+        self.ends = array("I")
+        # Built the first time we need a line, unless it is shared
+        self.line_index = line_index
+
+    def extend(self, tokens: Iterable[LarkToken], offset: int = 0) -> None:
+        """
+        Adds lark tokens found in the text that starts at `offset`.
+        """
+        for token in tokens:
+            self.append(
+                token.type,
+                token.start_pos + offset,  # type: ignore
+                token.end_pos + offset,  # type: ignore
+            )
+
+    def type_id(self, _type: str) -> int:
+        type_id = self._type_ids.get(_type)
+        if type_id is None:
+            type_id = len(self.type_names)
+            self.type_names.append(_type)
+            self._type_ids[_type] = type_id
+        return type_id
+
+    def append(self, _type: str, start: int, end: int) -> None:
+        self.types.append(self.type_id(_type))
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def __len__(self) -> int:
+        return len(self.types)
+
+    def type_of(self, index: int) -> str:
+        return self.type_names[self.types[index]]
+
+    def value(self, index: int) -> str:
+        return self.text[self.starts[index] : self.ends[index]]
+
+    def range(self, index: int) -> Range:
+        if self.line_index is None:
+            self.line_index = LineIndex(self.text)
+        _range = self.line_index.range(self.starts[index], self.ends[index])
+        return _range._replace(
+            line_start=_range.line_start + 1,
+            line_end=_range.line_end + 1,
+            column_start=_range.column_start + 1,
+            column_end=_range.column_end + 1,
+        )
+
+    def __getitem__(self, index: int) -> Token:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("token index out of range")
+        return Token(self.type_of(index), self.value(index), self.range(index))
+
+    def __iter__(self) -> Iterator[Token]:
+        for index in range(len(self)):
+            yield self[index]
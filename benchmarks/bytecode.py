@@ -0,0 +1,159 @@
+"""
+Measures the bytecode machine of `Degumin.Backend` against the tree
+walking evaluator of `Degumin.Core.Evaluation` on numeric programs.
+
+Run it with `python -m benchmarks.bytecode`. The programs compute on
+Peano numbers, `Z` and `S n`, and Church numerals: sums and products of
+growing numbers, Fibonacci numbers and powers of Church numerals applied
+to `S` and `Z`. Both run the same module, the evaluator walks the Core
+dataclasses of the definitions and the machine runs the code lowered
+once from them, both results are read back and compared. For every
+program it prints both times and how many times the machine is faster.
+The time to lower the module is printed apart. Every time is the best
+of `--repeat` runs.
+"""
+import io
+import sys
+from argparse import ArgumentParser
+from pathlib import Path
+from time import perf_counter
+from typing import Callable
+
+from lark import Lark
+
+from Degumin.Backend.Bytecode import Program, compile_program
+from Degumin.Backend.Machine import Machine
+from Degumin.Common.File import FileInfo
+from Degumin.Core.Core import FreeVariable, Identifier, VariableDefinition
+from Degumin.Core.Evaluation import Evaluator
+from Degumin.Core.Transformation import ToCore, parse_to_core
+from Degumin.Parser.Lexer import WordStart, iter_segments
+from Degumin.Parser.Parser import load_grammar
+
+prelude = """data Nat : Type =
+  Z : Nat;
+  S : forall (n : Nat) . Nat;
+  ;
+
+add : forall (m : Nat) (n : Nat) . Nat;
+add m n =
+  case m of
+    Z -> n;
+    S k -> S (add k n);
+  ;
+
+mul : forall (m : Nat) (n : Nat) . Nat;
+mul m n =
+  case m of
+    Z -> Z;
+    S k -> add n (mul k n);
+  ;
+
+fib : forall (m : Nat) . Nat;
+fib m =
+  case m of
+    Z -> Z;
+    S Z -> S Z;
+    S S k -> add (fib (S k)) (fib k);
+  ;
+
+church_exp m n = n m;
+
+church_two f x = f (f x);
+
+"""
+
+
+def best_time(f: Callable[[], object], repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        f()
+        times.append(perf_counter() - start)
+    return min(times)
+
+
+def peano(n: int) -> str:
+    return "S (" * n + "Z" + ")" * n
+
+
+def church(n: int) -> str:
+    body = "x"
+    for _ in range(n):
+        body = f"f ({body})"
+    return f"\\ f x -> {body}"
+
+
+def programs() -> list[tuple[str, str]]:
+    return (
+        [(f"add {n}", f"add ({peano(n)}) ({peano(n)})") for n in [100, 400]]
+        + [(f"mul {n}", f"mul ({peano(n)}) ({peano(n)})") for n in [10, 30]]
+        + [(f"fib {n}", f"fib ({peano(n)})") for n in [10, 15]]
+        + [
+            (f"2^{n} church", f"church_exp church_two ({church(n)}) S Z")
+            for n in [6, 9]
+        ]
+    )
+
+
+def statements(lark: Lark, text: str) -> list[object]:
+    info = FileInfo("Numeric.dgm", Path("Numeric.dgm"))
+    return [
+        parse_to_core(lark, info, item)
+        for item in iter_segments(io.StringIO(text))
+        if isinstance(item, WordStart)
+    ]
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    # The evaluator recurses on the Peano numbers it builds
+    sys.setrecursionlimit(100_000)
+    lark = load_grammar(transformer=ToCore())
+    assert isinstance(lark, Lark)
+
+    workloads = programs()
+    text = prelude + "".join(
+        f"main{i} = {source};\n\n" for i, (_, source) in enumerate(workloads)
+    )
+    parsed = statements(lark, text)
+    definitions = {
+        s.name: s.definition
+        for s in parsed
+        if isinstance(s, VariableDefinition)
+    }
+    seconds = best_time(lambda: compile_program(parsed), args.repeat)
+    program = compile_program(parsed)
+    assert isinstance(program, Program)
+    size = sum(len(f.code) for f in program.functions) // 2
+    print(f"lowered {size} instructions in {seconds * 1000:.2f} ms")
+
+    print(f"{'program':>14} {'evaluator':>12} {'machine':>12} {'speedup':>8}")
+    for i, (name, _) in enumerate(workloads):
+        main_name = Identifier(f"main{i}")
+
+        def evaluate() -> object:
+            # A new evaluator forgets the definitions it computed
+            evaluator = Evaluator(definitions, constructors=["S", "Z"])
+            return evaluator.quote(
+                evaluator.evaluate(FreeVariable(main_name, None))
+            )
+
+        def run() -> object:
+            machine = Machine(program)
+            return machine.read_back(machine.evaluate(main_name))
+
+        assert evaluate() == run()
+        evaluator_time = best_time(evaluate, args.repeat)
+        machine_time = best_time(run, args.repeat)
+        print(
+            f"{name:>14} {evaluator_time * 1000:>9.2f} ms"
+            f" {machine_time * 1000:>9.2f} ms"
+            f" {evaluator_time / machine_time:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
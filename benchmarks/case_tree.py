@@ -0,0 +1,203 @@
+"""
+Measures the decision trees of `Degumin.Core.CaseTree` against matching
+the alternatives of a `case` one after the other.
+
+Run it with `python -m benchmarks.case_tree`. For a growing number of
+alternatives it evaluates `--calls` times a `case` whose last
+alternative matches: one on integer literals, one on as many
+constructors and one on the nested patterns `Z`, `S Z`, `S (S Z)`...
+The sequential matching tries every alternative before the last one, and
+with nested patterns tests again the parts the previous ones tested,
+the tree tests every part once. It prints both times by `case`. Every
+time is the best of `--repeat` runs.
+"""
+from argparse import ArgumentParser
+from time import perf_counter
+from typing import Any, Callable
+
+from Degumin.Core.Core import (
+    Alternative,
+    Application,
+    Case,
+    DefaultCase,
+    FreeVariable,
+    Hole,
+    IntValue,
+    MatchConstructor,
+    MatchLiteralBool,
+    MatchLiteralInt,
+    MatchVariable,
+    Term,
+)
+from Degumin.Core.Evaluation import (
+    CaseFrame,
+    ConstructorValue,
+    Environment,
+    EvaluationStopped,
+    Evaluator,
+    LiteralValue,
+    NeutralValue,
+    NoMatchingAlternative,
+    Value,
+)
+
+# `SequentialEvaluator.bind_pattern` found a pattern that needs a neutral
+# value to be known
+STUCK = object()
+
+
+class SequentialEvaluator(Evaluator):
+    """
+    Tries the alternatives of a `case` in order, like the evaluator did
+    before the decision trees.
+    """
+
+    def select(
+        self,
+        scrutinee: Value,
+        alternatives: list[Alternative],
+        environment: Environment,
+    ) -> Value:
+        scrutinee = self.force(scrutinee)
+        for alternative in alternatives:
+            matched = self.bind_pattern(
+                alternative.case, scrutinee, environment
+            )
+            if matched is STUCK:
+                assert isinstance(scrutinee, NeutralValue)
+                frame = CaseFrame(alternatives, environment)
+                return NeutralValue(
+                    scrutinee.head, scrutinee.spine.append(frame)
+                )
+            if matched is not None:
+                self.step()
+                return self.evaluate(alternative.value, matched)  # type:ignore
+        raise EvaluationStopped(NoMatchingAlternative(scrutinee))
+
+    def bind_pattern(
+        self, pattern: Any, value: Value, environment: Environment
+    ) -> Environment | None | object:
+        if isinstance(pattern, (DefaultCase, Hole)):
+            return environment
+        if isinstance(pattern, MatchVariable):
+            if pattern.name not in self.constructors:
+                return environment.bind(pattern.name, value)
+            if isinstance(value, NeutralValue):
+                return STUCK
+            if (
+                isinstance(value, ConstructorValue)
+                and value.name == pattern.name
+                and not value.arguments
+            ):
+                return environment
+            return None
+        if isinstance(pattern, (MatchLiteralInt, MatchLiteralBool)):
+            if isinstance(value, NeutralValue):
+                return STUCK
+            if (
+                isinstance(value, LiteralValue)
+                and value.value == pattern.literal
+            ):
+                return environment
+            return None
+        if isinstance(pattern, MatchConstructor):
+            if isinstance(value, NeutralValue):
+                return STUCK
+            if (
+                not isinstance(value, ConstructorValue)
+                or value.name != pattern.name
+                or len(value.arguments) != len(pattern.matches)
+            ):
+                return None
+            for match, argument in zip(pattern.matches, value.arguments):
+                result = self.bind_pattern(match, argument, environment)
+                if result is None or result is STUCK:
+                    return result
+                environment = result  # type:ignore
+            return environment
+        return None
+
+
+def best_time(f: Callable[[], object], repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        f()
+        times.append(perf_counter() - start)
+    return min(times)
+
+
+def var(name: str) -> Term[None]:
+    return FreeVariable(name, None)
+
+
+def literals(size: int) -> tuple[Term[None], list[str]]:
+    alternatives = [
+        Alternative(MatchLiteralInt(n, None), IntValue(n, None), None)
+        for n in range(size)
+    ]
+    return Case(IntValue(size - 1, None), alternatives, None), []
+
+
+def constructors(size: int) -> tuple[Term[None], list[str]]:
+    names = [f"C{n}" for n in range(size)]
+    alternatives = [
+        Alternative(
+            MatchConstructor(name, [MatchVariable("x", None)], None),
+            var("x"),
+            None,
+        )
+        for name in names
+    ]
+    scrutinee = Application(var(names[-1]), IntValue(0, None), None)
+    return Case(scrutinee, alternatives, None), names
+
+
+def nested(size: int) -> tuple[Term[None], list[str]]:
+    alternatives = []
+    pattern: Any = MatchVariable("Z", None)
+    scrutinee: Term[None] = var("Z")
+    for n in range(size):
+        alternatives.append(Alternative(pattern, IntValue(n, None), None))
+        pattern = MatchConstructor("S", [pattern], None)
+        if n < size - 1:
+            scrutinee = Application(var("S"), scrutinee, None)
+    return Case(scrutinee, alternatives, None), ["S", "Z"]
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'workload':>14} {'sequential':>14} {'tree':>14} {'speedup':>8}")
+    for name, build in [
+        ("literals", literals),
+        ("constructors", constructors),
+        ("nested", nested),
+    ]:
+        for size in [4, 16, 64, 256]:
+            term, names = build(size)
+            times = []
+            for evaluator in [
+                SequentialEvaluator(constructors=names),
+                Evaluator(constructors=names),
+            ]:
+                expected = evaluator.evaluate(term)
+
+                def run(evaluator: Evaluator = evaluator) -> None:
+                    for _ in range(args.calls):
+                        assert evaluator.evaluate(term) == expected
+
+                times.append(best_time(run, args.repeat) / args.calls)
+            sequential, tree = times
+            print(
+                f"{name + ' ' + str(size):>14}"
+                f" {sequential * 1e6:>11.2f} us {tree * 1e6:>11.2f} us"
+                f" {sequential / tree:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Compares the persistent `Context` of Core against the linked list of
+dicts it replaced, where every binder added a dict and a lookup walked
+the parents.
+
+Run it with `python -m benchmarks.context`. For every depth it times
+binding that many variables, then `--lookups` lookups of the outermost
+bound variable and of a name defined before the binders. The linked
+list is walked with a loop, the recursion of the old lookup overflows
+the stack at the biggest depth. Every time is the best of `--repeat`
+runs.
+"""
+from argparse import ArgumentParser
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Callable, Optional
+
+from Degumin.Core.Core import Context, Identifier, IntValue, Universe
+
+
+def best_time(f: Callable[[], object], repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        f()
+        times.append(perf_counter() - start)
+    return min(times)
+
+
+@dataclass
+class LinkedContext:
+    parent: Optional["LinkedContext"]
+    local: dict
+
+    def lookup(self, name: object) -> object:
+        context: Optional[LinkedContext] = self
+        while context is not None:
+            result = context.local.get(name)
+            if result is not None:
+                return result
+            context = context.parent
+        return None
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--lookups", type=int, default=1_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    entry = (IntValue(0, None), Universe(0, None))
+    name = Identifier("Nat")
+    print(f"{'depth':>8} {'':>10} {'bind':>10} {'index':>10} {'name':>10}")
+    for depth in [10, 100, 1_000, 10_000]:
+
+        def bind_linked() -> LinkedContext:
+            linked = LinkedContext(None, {name: entry})
+            for level in range(depth):
+                linked = LinkedContext(linked, {level: entry})
+            return linked
+
+        def bind_persistent() -> Context:
+            context: Context = Context().extend({name: entry})
+            for _ in range(depth):
+                context = context.bind(entry)
+            return context
+
+        linked, context = bind_linked(), bind_persistent()
+        assert linked.lookup(0) is context.lookup(depth - 1) is entry
+        assert linked.lookup(name) is context.lookup(name) is entry
+        for label, bind, index, named in [
+            (
+                "linked",
+                bind_linked,
+                lambda: [linked.lookup(0) for _ in range(args.lookups)],
+                lambda: [linked.lookup(name) for _ in range(args.lookups)],
+            ),
+            (
+                "persistent",
+                bind_persistent,
+                lambda: [
+                    context.lookup(depth - 1) for _ in range(args.lookups)
+                ],
+                lambda: [context.lookup(name) for _ in range(args.lookups)],
+            ),
+        ]:
+            times = [best_time(f, args.repeat) for f in (bind, index, named)]
+            print(
+                f"{depth:>8} {label:>10}"
+                + "".join(f" {t * 1000:>7.2f} ms" for t in times)
+            )
+
+
+if __name__ == "__main__":
+    main()
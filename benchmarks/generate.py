@@ -0,0 +1,54 @@
+"""
+Generators of synthetic Degumin sources used by the benchmarks.
+"""
+
+definition_template = """-- Definition number {n}
+{{- Documentation for
+  f{n}
+-}}
+f{n} : forall (x:Nat) . Nat;
+f{n} x =
+  case x of
+    Z -> S Z;
+    S k -> f{n} k;
+  ;
+
+"""
+
+
+def generate_module(size: int) -> str:
+    """
+    Returns a module with as many definitions as needed to have at least
+    `size` characters.
+    """
+    chunks = ["module Generated where\n\n"]
+    total = len(chunks[0])
+    n = 0
+    while total < size:
+        chunk = definition_template.format(n=n)
+        chunks.append(chunk)
+        total += len(chunk)
+        n += 1
+    return "".join(chunks)
+
+
+def generate_nested_comment_openers(size: int) -> str:
+    """
+    Block comment openers at indentation 0 that are never closed.
+    """
+    return "{-\n" * (size // 3)
+
+
+def generate_unclosed_comments(size: int) -> str:
+    """
+    Unclosed block comments, every one with a different number of hyphens.
+    """
+    chunks = []
+    total = 0
+    hyphens = 1
+    while total < size:
+        chunk = "{" + "-" * hyphens + "\n"
+        chunks.append(chunk)
+        total += len(chunk)
+        hyphens += 1
+    return "".join(chunks)
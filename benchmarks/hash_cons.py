@@ -0,0 +1,158 @@
+"""
+Measures what hash-consing (`Degumin.Core.HashCons`) saves on the Core
+of a generated module.
+
+Run it with `python -m benchmarks.hash_cons`. It reports:
+
+- For the declared types and for the definitions of the module: the
+  number of nodes against the number of distinct ones kept by the
+  table, and the memory held by the terms with and without interning
+  (with `tracemalloc`, the table included).
+- The time to intern the module.
+- The time to compare every term with the one from a second parse of
+  the module, with `==` on the plain terms and with `is` on the interned
+  ones, and the same on a bigger type (`--width` nested arrows).
+
+Every time is the best of `--repeat` runs.
+"""
+import io
+import tracemalloc
+from argparse import ArgumentParser
+from pathlib import Path
+from time import perf_counter
+from typing import Callable
+
+from lark import Lark
+
+from benchmarks.generate import generate_module
+from Degumin.Common.File import FileInfo
+from Degumin.Core.Core import (
+    Forall,
+    FreeVariable,
+    Identifier,
+    Term,
+    VariableDeclaration,
+    VariableDefinition,
+)
+from Degumin.Core.HashCons import HashConsTable
+from Degumin.Core.Transformation import ToCore, parse_to_core
+from Degumin.Core.Traversal import fold
+from Degumin.Parser.Lexer import WordStart, iter_segments
+from Degumin.Parser.Parser import load_grammar
+
+KB = 1024
+MB = 1024 * KB
+
+
+def best_time(f: Callable[[], object], repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        f()
+        times.append(perf_counter() - start)
+    return min(times)
+
+
+def module_terms(
+    lark: Lark, text: str, types: bool = True, definitions: bool = True
+) -> list[Term]:
+    info = FileInfo("Generated.dgm", Path("Generated.dgm"))
+    terms: list[Term] = []
+    for item in iter_segments(io.StringIO(text)):
+        if not isinstance(item, WordStart):
+            continue
+        core = parse_to_core(lark, info, item)
+        if types and isinstance(core, VariableDeclaration):
+            terms.append(core.declaration)
+        elif definitions and isinstance(core, VariableDefinition):
+            terms.append(core.definition)
+    return terms
+
+
+def arrows(width: int) -> Term[None]:
+    # forall (_ : Nat) . forall (_ : Nat) . ... Nat
+    term: Term[None] = FreeVariable(Identifier("Nat"), None)
+    for _ in range(width):
+        _type = FreeVariable(Identifier("Nat"), None)
+        binder = FreeVariable(Identifier("_"), None)
+        term = Forall([(binder, _type)], term, None)  # type:ignore
+    return term
+
+
+def retained(build: Callable[[], object]) -> tuple[object, int]:
+    tracemalloc.start()
+    result = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=256 * KB)
+    parser.add_argument("--width", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    lark = load_grammar(transformer=ToCore())
+    assert isinstance(lark, Lark)
+    text = generate_module(args.size)
+    # lark builds its lexer on the first parse, it must not be counted
+    module_terms(lark, generate_module(1))
+
+    print(f"{len(text) / KB:.0f} KB")
+    for name, types in [("types", True), ("definitions", False)]:
+        plain, plain_size = retained(
+            lambda: module_terms(lark, text, types, not types)
+        )
+        table: HashConsTable = HashConsTable()
+        # The entries of the table are allocated while tracing
+        _, interned_size = retained(
+            lambda: [
+                table.intern(term)
+                for term in module_terms(lark, text, types, not types)
+            ]
+        )
+        assert isinstance(plain, list)
+        nodes = sum(
+            fold(term, lambda _, values: 1 + sum(values)) for term in plain
+        )
+        print(
+            f"{name:>12} {nodes:>8} nodes {len(table):>8} distinct"
+            f" {plain_size / KB:>8.0f} KB plain"
+            f" {interned_size / KB:>8.0f} KB interned"
+        )
+
+    plain = module_terms(lark, text)
+    table = HashConsTable()
+    interned = [table.intern(term) for term in plain]
+
+    seconds = best_time(
+        lambda: [HashConsTable().intern(term) for term in plain], args.repeat
+    )
+    print(f"{'intern':>12} {seconds * 1000:>10.2f} ms")
+
+    others = module_terms(lark, text)
+    again = [table.intern(term) for term in others]
+    big, other_big = arrows(args.width), arrows(args.width)
+    big_interned = table.intern(big)
+    other_big_interned = table.intern(other_big)
+    assert all(a == b for a, b in zip(plain, others))
+    assert all(a is b for a, b in zip(interned, again))
+    assert big_interned is other_big_interned
+    for name, f in [
+        ("module ==", lambda: all(a == b for a, b in zip(plain, others))),
+        ("module is", lambda: all(a is b for a, b in zip(interned, again))),
+        ("type ==", lambda: all(big == other_big for _ in range(1000))),
+        (
+            "type is",
+            lambda: all(
+                big_interned is other_big_interned for _ in range(1000)
+            ),
+        ),
+    ]:
+        seconds = best_time(f, args.repeat)
+        print(f"{name:>12} {seconds * 1000:>10.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Measures the time from an edit to the list of errors with
+`IncrementalParser`, against parsing the whole text again.
+
+Run it with `python -m benchmarks.incremental`. Every edit types a
+character in a random definition of a generated module and the next one
+deletes it, like a user typing and fixing a typo.
+"""
+import random
+from argparse import ArgumentParser
+from pathlib import Path
+from statistics import median
+from time import perf_counter
+
+from benchmarks.generate import generate_module
+from Degumin.Common.File import FileInfo
+from Degumin.Parser.Incremental import IncrementalParser
+from Degumin.Parser.Parser import load_grammar, parse_string
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, default=100_000)
+    parser.add_argument("--edits", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    lark = load_grammar()
+    assert not isinstance(lark, Exception)
+    info = FileInfo("Generated.dgm", Path("Generated.dgm"))
+    sample = generate_module(100_000)
+    characters_by_line = len(sample) / sample.count("\n")
+    text = generate_module(int(args.lines * characters_by_line))
+    print(f"{text.count(chr(10))} lines, {len(text)} characters")
+
+    start = perf_counter()
+    parse_string(lark, info, text)
+    full = perf_counter() - start
+    print(f"{'full parse':>20} {full * 1000:>10.2f} ms")
+
+    start = perf_counter()
+    incremental = IncrementalParser(lark, info, text)
+    print(f"{'first parse':>20} {(perf_counter() - start) * 1000:>10.2f} ms")
+
+    rng = random.Random(args.seed)
+    times: list[float] = []
+    reparsed = 0
+    for _ in range(args.edits // 2):
+        # In the middle of a case alternative
+        position = text.find(" -> ", rng.randrange(len(text)))
+        if position == -1:
+            position = text.find(" -> ")
+        for edit in [(position, position, "x"), (position, position + 1, "")]:
+            start = perf_counter()
+            incremental.edit(*edit)
+            incremental.errors()
+            times.append(perf_counter() - start)
+            reparsed += incremental.reparsed
+    print(f"{'edit median':>20} {median(times) * 1000:>10.2f} ms")
+    print(f"{'edit max':>20} {max(times) * 1000:>10.2f} ms")
+    print(f"{'segments by edit':>20} {reparsed / len(times):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
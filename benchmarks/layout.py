@@ -0,0 +1,77 @@
+"""
+Measures the throughput of the layout pass (`Layout.process`) against
+the lark lexer alone.
+
+Run it with `python -m benchmarks.layout`. Both read the segments of a
+generated module, joined so lark builds its lexer only once. The layout
+pass reads the tokens while lark makes them, like it does as a
+postlexer. The layout pass is also measured alone on a list of tokens.
+Every time is the best of `--repeat` runs.
+"""
+import io
+from argparse import ArgumentParser
+from time import perf_counter
+from typing import Callable
+
+from lark import Lark
+
+from benchmarks.generate import generate_module
+from Degumin.Parser.Indentation import Layout
+from Degumin.Parser.Lexer import WordStart, iter_segments
+from Degumin.Parser.Parser import default_parser_options, read_grammar
+
+KB = 1024
+MB = 1024 * KB
+
+
+def best_time(f: Callable[[], object], repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        f()
+        times.append(perf_counter() - start)
+    return min(times)
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=4 * MB)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    # Without the postlexer, `lark.lex` would already run the layout pass
+    options = default_parser_options()
+    options["postlex"] = None
+    lark = Lark(read_grammar(), **options)
+    text = generate_module(args.size)
+    segments = "".join(
+        item.chunk
+        for item in iter_segments(io.StringIO(text))
+        if isinstance(item, WordStart)
+    )
+    lexed = list(lark.lex(segments))
+    tokens = len(lexed)
+    layout = Layout()
+    with_layout = sum(1 for _ in layout.process(lexed))
+    assert layout.errors == []
+
+    lexer = best_time(lambda: sum(1 for _ in lark.lex(segments)), args.repeat)
+    both = best_time(
+        lambda: sum(1 for _ in layout.process(lark.lex(segments))),
+        args.repeat,
+    )
+    alone = best_time(
+        lambda: sum(1 for _ in layout.process(lexed)), args.repeat
+    )
+
+    print(f"{len(text) / MB:.2f} MB, {tokens} tokens")
+    print(f"{with_layout - tokens} layout tokens")
+    for name, seconds in [
+        ("lark lexer", lexer),
+        ("lexer + layout", both),
+        ("layout only", alone),
+    ]:
+        print(f"{name:>16} {tokens / seconds / 1000:>10.0f} ktokens/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Compares the parser with the basic lexer against the contextual lexer
+of `default_parser_options`, both with the layout postlexer.
+
+Run it with `python -m benchmarks.lexer [FILE ...]`. The corpus is the
+given Degumin modules, or a generated module if there is none. Every
+segment is parsed like `parse_string` does, the throughput counts the
+tokens of the segments, virtual ones included. Every time is the best
+of `--repeat` runs.
+"""
+import io
+from argparse import ArgumentParser
+from pathlib import Path
+from time import perf_counter
+
+from lark import Lark
+
+from benchmarks.generate import generate_module
+from Degumin.Parser.Lexer import WordStart, iter_segments
+from Degumin.Parser.Parser import default_parser_options, read_grammar
+
+KB = 1024
+MB = 1024 * KB
+
+
+def parse_all(lark: Lark, chunks: list[str]) -> float:
+    start = perf_counter()
+    for chunk in chunks:
+        lark.parse(chunk, start="segment")
+    return perf_counter() - start
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("paths", type=Path, nargs="*")
+    parser.add_argument("--size", type=int, default=1 * MB)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    if args.paths:
+        texts = [path.read_text() for path in args.paths]
+    else:
+        texts = [generate_module(args.size)]
+    chunks = [
+        item.chunk
+        for text in texts
+        for item in iter_segments(io.StringIO(text))
+        if isinstance(item, WordStart)
+    ]
+    grammar = read_grammar()
+    parsers = {}
+    for lexer in ["basic", "contextual"]:
+        options = default_parser_options()
+        options["lexer"] = lexer
+        parsers[lexer] = Lark(grammar, **options)
+    lark = parsers["contextual"]
+    tokens = sum(1 for chunk in chunks for _ in lark.lex(chunk))
+    print(f"{sum(map(len, texts)) / MB:.2f} MB, {tokens} tokens")
+    for lexer, lark in parsers.items():
+        seconds = min(parse_all(lark, chunks) for _ in range(args.repeat))
+        print(f"{lexer:>12} {tokens / seconds / 1000:>10.0f} ktokens/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Measures normalization by evaluation (`Degumin.Core.Evaluation`) on
+Church numeral arithmetic.
+
+Run it with `python -m benchmarks.normalize`. Big numbers are computed
+from small literal numerals, the evaluation recurses on the nesting of
+the literal terms but the read back of the results, whose nesting is the
+number itself, doesn't. For every workload it prints the number, the
+steps (beta reductions and unfoldings), the time to normalize and the
+steps by second. Then it runs a term that doesn't terminate with a
+fuel. Every time is the best of `--repeat` runs.
+"""
+from argparse import ArgumentParser
+from time import perf_counter
+from typing import Callable
+
+from Degumin.Core.Core import (
+    Abstraction,
+    Application,
+    FreeVariable,
+    Identifier,
+    Term,
+)
+from Degumin.Core.Evaluation import Evaluator, OutOfFuel
+
+
+def best_time(f: Callable[[], object], repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        f()
+        times.append(perf_counter() - start)
+    return min(times)
+
+
+def var(name: str) -> Term[None]:
+    return FreeVariable(Identifier(name), None)
+
+
+def lam(names: str, body: Term[None]) -> Term[None]:
+    return Abstraction([var(name) for name in names.split()], body, None)
+
+
+def app(function: Term[None], *arguments: Term[None]) -> Term[None]:
+    for argument in arguments:
+        function = Application(function, argument, None)
+    return function
+
+
+def numeral(n: int) -> Term[None]:
+    body = var("x")
+    for _ in range(n):
+        body = app(var("f"), body)
+    return lam("f x", body)
+
+
+church: dict[Identifier, Term[None]] = {
+    Identifier("add"): lam(
+        "m n f x", app(var("m"), var("f"), app(var("n"), var("f"), var("x")))
+    ),
+    Identifier("mult"): lam("m n f", app(var("m"), app(var("n"), var("f")))),
+    Identifier("exp"): lam("m n", app(var("n"), var("m"))),
+}
+
+
+def read_numeral(term: object) -> int:
+    assert isinstance(term, Abstraction)
+    assert isinstance(term.term, Abstraction)
+    body = term.term.term
+    n = 0
+    while isinstance(body, Application):
+        body = body.right
+        n += 1
+    return n
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    exp = var("exp")
+    workloads = [
+        ("exp 2 10", app(exp, numeral(2), numeral(10)), 2**10),
+        ("exp 2 14", app(exp, numeral(2), numeral(14)), 2**14),
+        ("exp 2 17", app(exp, numeral(2), numeral(17)), 2**17),
+        ("exp 3 9", app(exp, numeral(3), numeral(9)), 3**9),
+        (
+            "mult (exp 2 8) (exp 2 8)",
+            app(
+                var("mult"),
+                app(exp, numeral(2), numeral(8)),
+                app(exp, numeral(2), numeral(8)),
+            ),
+            2**16,
+        ),
+        (
+            "add (exp 2 16) 100",
+            app(var("add"), app(exp, numeral(2), numeral(16)), numeral(100)),
+            2**16 + 100,
+        ),
+    ]
+    print(f"{'workload':>26} {'number':>8} {'steps':>8} {'time':>10}")
+    for name, term, expected in workloads:
+        evaluator = Evaluator(church)
+        assert read_numeral(evaluator.normalize(term)) == expected
+        steps = evaluator.steps
+        seconds = best_time(
+            lambda: Evaluator(church).normalize(term), args.repeat
+        )
+        print(
+            f"{name:>26} {expected:>8} {steps:>8} {seconds * 1000:>7.2f} ms"
+            f" {steps / seconds / 1e6:>6.2f} Msteps/s"
+        )
+    omega = lam("x", app(var("x"), var("x")))
+    evaluator = Evaluator(fuel=100)
+    result = evaluator.normalize(app(omega, omega))
+    assert result == OutOfFuel(100)
+    print(f"omega with fuel 100: {result} after {evaluator.steps} steps")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Compares building the parser from the grammar (cold) against loading
+it from the parser cache (warm) and from the module generated by
+`Degumin.Parser.Standalone` (standalone).
+
+Run it with `python -m benchmarks.parser_startup`. The first table is
+the time of `load_grammar` alone, the second one the wall time of a
+whole python process that loads the parser, as the `degumin` command
+would.
+"""
+import subprocess
+import sys
+from argparse import ArgumentParser
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Callable
+
+from Degumin.Parser.Parser import load_grammar
+from Degumin.Parser.Standalone import generate_standalone_parser
+
+process_code = (
+    "from pathlib import Path;"
+    "from Degumin.Parser.Parser import load_grammar;"
+    "load_grammar(use_cache={use_cache}, use_standalone={use_standalone},"
+    " cache_directory=Path({cache!r}))"
+)
+
+
+def best_of(repetitions: int, f: Callable[[], object]) -> float:
+    best = float("inf")
+    for _ in range(repetitions):
+        start = perf_counter()
+        f()
+        best = min(best, perf_counter() - start)
+    return best
+
+
+def run_process(use_cache: bool, use_standalone: bool, cache: str) -> None:
+    code = process_code.format(
+        use_cache=use_cache, use_standalone=use_standalone, cache=cache
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--repetitions", type=int, default=10)
+    args = parser.parse_args()
+    generate_standalone_parser()
+    with TemporaryDirectory() as directory:
+        cache = Path(directory)
+        load_grammar(
+            use_cache=True, use_standalone=False, cache_directory=cache
+        )
+        variants = {
+            "cold": (False, False),
+            "warm": (True, False),
+            "standalone": (False, True),
+        }
+        print("load_grammar")
+        for name, (use_cache, use_standalone) in variants.items():
+            seconds = best_of(
+                args.repetitions,
+                lambda: load_grammar(
+                    use_cache=use_cache,
+                    use_standalone=use_standalone,
+                    cache_directory=cache,
+                ),
+            )
+            print(f"{name:>10} {seconds * 1000:>10.2f} ms")
+        print("process")
+        for name, (use_cache, use_standalone) in variants.items():
+            seconds = best_of(
+                args.repetitions,
+                lambda: run_process(use_cache, use_standalone, directory),
+            )
+            print(f"{name:>10} {seconds * 1000:>10.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Measures the Python modules generated by `Degumin.Backend.PythonCode`
+against the bytecode machine and against Python written by hand.
+
+Run it with `python -m benchmarks.python_code`. The programs are the
+ones of `benchmarks.bytecode`, on Peano numbers and Church numerals. The
+generated module computes the natural numbers with Python ints, a
+program runs the function computing its definition in the module, the
+machine evaluates the same definition and the Python written by hand
+uses `+`, `*` and recursive functions. The results are compared. It
+prints the time of each one and how many times the generated module is
+faster than the machine.
+
+Then it prints the time to generate and write the module, to find it up
+to date by its source hash and to import it. Every time is the best of
+`--repeat` runs.
+"""
+import sys
+import tempfile
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import Any, Callable
+
+from lark import Lark
+
+from Degumin.Backend.Bytecode import Program, compile_program
+from Degumin.Backend.Machine import Machine
+from Degumin.Backend.PythonCode import (
+    generate_module,
+    load_module,
+    write_module,
+)
+from Degumin.Core.Core import Identifier
+from Degumin.Core.Transformation import ToCore
+from Degumin.Parser.Parser import load_grammar
+from benchmarks.bytecode import best_time, prelude, programs, statements
+
+
+def fib(n: int) -> int:
+    return n if n < 2 else fib(n - 1) + fib(n - 2)
+
+
+def by_hand() -> list[Callable[[], int]]:
+    two: Callable[[Any], Any] = lambda f: lambda x: f(f(x))
+
+    def church(n: int) -> Callable[[Any], Any]:
+        def numeral(f: Callable[[Any], Any]) -> Callable[[Any], Any]:
+            def apply(x: Any) -> Any:
+                for _ in range(n):
+                    x = f(x)
+                return x
+
+            return apply
+
+        return numeral
+
+    return (
+        [lambda n=n: n + n for n in [100, 400]]
+        + [lambda n=n: n * n for n in [10, 30]]
+        + [lambda n=n: fib(n) for n in [10, 15]]
+        + [lambda n=n: church(n)(two)(lambda x: x + 1)(0) for n in [6, 9]]
+    )
+
+
+def natural(value: tuple) -> int:
+    n = 0
+    while value[0] == 1:
+        value = value[1]
+        n += 1
+    return n
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    # The machine reads back the Peano numbers it builds
+    sys.setrecursionlimit(100_000)
+    lark = load_grammar(transformer=ToCore())
+    assert isinstance(lark, Lark)
+
+    workloads = programs()
+    text = prelude + "".join(
+        f"main{i} = {source};\n\n" for i, (_, source) in enumerate(workloads)
+    )
+    source = text.encode()
+    parsed = statements(lark, text)
+    program = compile_program(parsed)
+    assert isinstance(program, Program)
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / "numeric.py"
+        generation = best_time(
+            lambda: generate_module(parsed, "Numeric.dgm", source), args.repeat
+        )
+        assert write_module(parsed, "Numeric.dgm", source, path) is True
+        hit = best_time(
+            lambda: write_module(parsed, "Numeric.dgm", source, path),
+            args.repeat,
+        )
+        module = load_module(path)
+        loading = best_time(lambda: load_module(path), args.repeat)
+
+    print(
+        f"{'program':>14} {'machine':>12} {'generated':>12}"
+        f" {'by hand':>12} {'speedup':>8}"
+    )
+    for i, ((name, _), hand) in enumerate(zip(workloads, by_hand())):
+        main_name = Identifier(f"main{i}")
+        generated = getattr(module, f"_define_main{i}")
+
+        def run() -> int:
+            return natural(Machine(program).evaluate(main_name))
+
+        assert run() == generated() == hand()
+        machine_time = best_time(run, args.repeat)
+        generated_time = best_time(generated, args.repeat)
+        hand_time = best_time(hand, args.repeat)
+        print(
+            f"{name:>14} {machine_time * 1000:>9.3f} ms"
+            f" {generated_time * 1000:>9.3f} ms"
+            f" {hand_time * 1000:>9.3f} ms"
+            f" {machine_time / generated_time:>7.1f}x"
+        )
+    print(f"generated the module in {generation * 1000:.2f} ms")
+    print(f"found it up to date in {hit * 1000:.3f} ms")
+    print(f"imported it in {loading * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
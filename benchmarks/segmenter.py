@@ -0,0 +1,112 @@
+"""
+Measures how `split_by_indentation` scales with the size of its input.
+
+Run it with `python -m benchmarks.segmenter`, the time per MB must stay
+roughly constant from the smallest to the biggest input.
+With `--stream` the input is read from a file with `iter_segments` and
+the peak of memory allocated while segmenting is also reported, it must
+stay flat.
+"""
+import tracemalloc
+from argparse import ArgumentParser
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from benchmarks.generate import (
+    generate_module,
+    generate_nested_comment_openers,
+    generate_unclosed_comments,
+)
+from Degumin.Parser.Lexer import iter_segments, split_by_indentation
+
+KB = 1024
+MB = 1024 * KB
+
+default_sizes = [1 * KB, 10 * KB, 100 * KB, 1 * MB, 10 * MB, 50 * MB]
+
+generators = {
+    "module": generate_module,
+    "nested-openers": generate_nested_comment_openers,
+    "unclosed-comments": generate_unclosed_comments,
+}
+
+
+def measure(text: str, repetitions: int) -> float:
+    best = float("inf")
+    for _ in range(repetitions):
+        start = perf_counter()
+        split_by_indentation(text)
+        best = min(best, perf_counter() - start)
+    return best
+
+
+def stream(path: Path) -> None:
+    with open(path, "r") as file:
+        for _ in iter_segments(file):
+            pass
+
+
+def measure_stream(path: Path, repetitions: int) -> tuple[float, int]:
+    best = float("inf")
+    for _ in range(repetitions):
+        start = perf_counter()
+        stream(path)
+        best = min(best, perf_counter() - start)
+    tracemalloc.start()
+    stream(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (best, peak)
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--sizes",
+        nargs="*",
+        type=int,
+        default=default_sizes,
+        metavar="BYTES",
+        help="Sizes of the generated inputs",
+    )
+    parser.add_argument(
+        "--input",
+        choices=list(generators),
+        default="module",
+        help="Kind of generated input",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Read the input from a file using iter_segments",
+    )
+    parser.add_argument("--repetitions", type=int, default=3)
+    args = parser.parse_args()
+    if args.stream:
+        print(f"{'size':>12} {'seconds':>10} {'s/MB':>10} {'peak MB':>10}")
+    else:
+        print(f"{'size':>12} {'seconds':>10} {'s/MB':>10}")
+    for size in args.sizes:
+        text = generators[args.input](size)
+        if args.stream:
+            with TemporaryDirectory() as directory:
+                path = Path(directory) / "input.dgm"
+                path.write_text(text)
+                length = len(text)
+                del text
+                seconds, peak = measure_stream(path, args.repetitions)
+            print(
+                f"{length:>12} {seconds:>10.4f}"
+                f" {seconds / length * MB:>10.4f} {peak / MB:>10.2f}"
+            )
+        else:
+            seconds = measure(text, args.repetitions)
+            print(
+                f"{len(text):>12} {seconds:>10.4f}"
+                f" {seconds / len(text) * MB:>10.4f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Compares building the Core of a module from the trees of its segments
+(`parse_segment` then `to_core`) against building it while parsing
+(`parse_to_core`).
+
+Run it with `python -m benchmarks.to_core`. The segment cache isn't
+used. Every time is the best of `--repeat` runs.
+"""
+import io
+from argparse import ArgumentParser
+from pathlib import Path
+from time import perf_counter
+from typing import Callable
+
+from benchmarks.generate import generate_module
+from Degumin.Common.File import FileInfo
+from Degumin.Core.Transformation import ToCore, parse_to_core, to_core
+from Degumin.Parser.Lexer import WordStart, iter_segments
+from Degumin.Parser.Parser import load_grammar, parse_segment
+
+KB = 1024
+MB = 1024 * KB
+
+
+def best_time(f: Callable[[], object], repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        f()
+        times.append(perf_counter() - start)
+    return min(times)
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=1 * MB)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    trees = load_grammar()
+    inline = load_grammar(transformer=ToCore())
+    assert not isinstance(trees, Exception)
+    assert not isinstance(inline, Exception)
+    info = FileInfo("Generated.dgm", Path("Generated.dgm"))
+    text = generate_module(args.size)
+    segments = [
+        item
+        for item in iter_segments(io.StringIO(text))
+        if isinstance(item, WordStart)
+    ]
+    print(f"{len(text) / MB:.2f} MB, {len(segments)} segments")
+
+    def from_trees() -> list:
+        return [
+            to_core(parse_segment(trees, info, segment), info)
+            for segment in segments
+        ]
+
+    def while_parsing() -> list:
+        return [parse_to_core(inline, info, segment) for segment in segments]
+
+    assert from_trees() == while_parsing()
+    for name, f in [("from trees", from_trees), ("inline", while_parsing)]:
+        seconds = best_time(f, args.repeat)
+        print(f"{name:>12} {seconds * 1000:>10.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
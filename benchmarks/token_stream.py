@@ -0,0 +1,65 @@
+"""
+Compares the memory used to keep the tokens of a module as a list of
+`Token` objects against a `TokenStream`.
+
+Run it with `python -m benchmarks.token_stream`. The text of the module
+is not counted, the stream keeps a reference to it and the tokens copy
+their values.
+"""
+import io
+import tracemalloc
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import Callable
+
+from benchmarks.generate import generate_module
+from Degumin.Common.File import FileInfo, token2Range
+from Degumin.Parser.Lexer import WordStart, iter_segments
+from Degumin.Parser.Parser import lex_string, load_grammar
+from Degumin.Parser.Token import Token
+
+KB = 1024
+MB = 1024 * KB
+
+
+def allocated(f: Callable[[], object]) -> int:
+    tracemalloc.start()
+    result = f()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=1 * MB)
+    args = parser.parse_args()
+    lark = load_grammar()
+    assert not isinstance(lark, Exception)
+    info = FileInfo("Generated.dgm", Path("Generated.dgm"))
+    text = generate_module(args.size)
+    stream, errors = lex_string(lark, info, text)
+    assert errors == []
+    lark_tokens = [
+        token
+        for item in iter_segments(io.StringIO(text))
+        if isinstance(item, WordStart)
+        for token in lark.lex(item.chunk)
+    ]
+    print(f"{len(lark_tokens)} tokens")
+    objects = allocated(
+        lambda: [
+            Token(t.type, str(t), token2Range(t))  # type: ignore
+            for t in lark_tokens
+        ]
+    )
+    del stream
+    stream = allocated(lambda: lex_string(lark, info, text))
+    for name, size in [("Token list", objects), ("TokenStream", stream)]:
+        print(f"{name:>12} {size / MB:>10.2f} MB")
+        print(f"{'':>12} {size / len(lark_tokens):>10.2f} bytes by token")
+
+
+if __name__ == "__main__":
+    main()
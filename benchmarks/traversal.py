@@ -0,0 +1,98 @@
+"""
+Measures the traversals of `Degumin.Core.Traversal` on terms far deeper
+than the recursion limit: an application spine (`f x x ... x`, nested on
+the left like the parser builds it) and a chain of `let`.
+
+Run it with `python -m benchmarks.traversal`. `--depth` is the number of
+nested nodes. For each term it times counting the nodes with `fold`,
+walking them with `iter_terms`, a transform that changes nothing (it
+must give back the same object) and one that renames the innermost
+variable, which rebuilds every node above it. Every time is the best of
+`--repeat` runs.
+"""
+from argparse import ArgumentParser
+from time import perf_counter
+from typing import Callable
+
+from Degumin.Core.Core import (
+    Application,
+    FreeVariable,
+    Identifier,
+    IntValue,
+    Let,
+    Term,
+)
+from Degumin.Core.Traversal import CoreTransformer, fold, iter_terms
+
+
+def best_time(f: Callable[[], object], repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        f()
+        times.append(perf_counter() - start)
+    return min(times)
+
+
+def application_spine(depth: int) -> Term[None]:
+    term: Term[None] = FreeVariable(Identifier("f"), None)
+    argument = FreeVariable(Identifier("x"), None)
+    for _ in range(depth):
+        term = Application(term, argument, None)
+    return term
+
+
+def let_chain(depth: int) -> Term[None]:
+    term: Term[None] = FreeVariable(Identifier("f"), None)
+    for i in range(depth):
+        term = Let(False, {Identifier("x"): IntValue(i, None)}, term, None)
+    return term
+
+
+class Rename(CoreTransformer[None]):
+    def post(self, term: Term[None]) -> Term[None]:
+        if isinstance(term, FreeVariable) and term.name == "f":
+            return FreeVariable(Identifier("g"), None)
+        return term
+
+
+def innermost(term: Term[None]) -> Term[None]:
+    while isinstance(term, (Application, Let)):
+        term = term.left if isinstance(term, Application) else term.term
+    return term
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--depth", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    for name, term in [
+        ("application spine", application_spine(args.depth)),
+        ("let chain", let_chain(args.depth)),
+    ]:
+        nodes = fold(term, lambda _, values: 1 + sum(values))
+        print(f"{name}: depth {args.depth}, {nodes} nodes")
+        assert CoreTransformer[None]().transform(term) is term
+        renamed = Rename().transform(term)
+        assert renamed is not term
+        assert innermost(renamed) == FreeVariable(Identifier("g"), None)
+
+        def count() -> int:
+            return sum(1 for _ in iter_terms(term))
+
+        for label, f in [
+            ("fold", lambda: fold(term, lambda _, values: 1 + sum(values))),
+            ("iter_terms", count),
+            ("identity", lambda: CoreTransformer[None]().transform(term)),
+            ("rename", lambda: Rename().transform(term)),
+        ]:
+            seconds = best_time(f, args.repeat)
+            print(
+                f"{label:>12} {seconds * 1000:>10.2f} ms"
+                f" {nodes / seconds / 1e6:>8.2f} Mnodes/s"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Measures the type checker (`Degumin.Core.TypeCheck`) with and without
+its memoization, on the plain Core terms and on the hash-consed ones
+(`Degumin.Core.HashCons`).
+
+Run it with `python -m benchmarks.typecheck`. There are two modules: the
+generated one of the other benchmarks, where few terms are shared, and
+`--count` definitions with the same type of `--width` arguments. For
+every configuration it prints the cache hits and misses and the time to
+check the module, the best of `--repeat` runs. Then the slowest
+definitions of the last configuration.
+"""
+import io
+from argparse import ArgumentParser
+from dataclasses import replace
+from pathlib import Path
+from time import perf_counter
+from typing import Callable
+
+from lark import Lark
+
+from benchmarks.generate import generate_module
+from Degumin.Common.File import FileInfo
+from Degumin.Core.Core import (
+    Constructor,
+    DataType,
+    VariableDeclaration,
+    VariableDefinition,
+)
+from Degumin.Core.HashCons import HashConsTable
+from Degumin.Core.Transformation import ToCore, parse_to_core
+from Degumin.Core.TypeCheck import check_module
+from Degumin.Parser.Lexer import WordStart, iter_segments
+from Degumin.Parser.Parser import load_grammar
+
+KB = 1024
+
+prelude = """data Nat : Type =
+  Z : Nat;
+  S : forall (n : Nat) . Nat;
+  ;
+
+"""
+
+
+def shared_module(count: int, width: int) -> str:
+    """
+    `count` definitions with the same type of `width` arguments.
+    """
+    arguments = " ".join(f"a{i}" for i in range(width))
+    binders = " ".join(f"(a{i} : Nat)" for i in range(width))
+    return prelude + "".join(
+        f"g{n} : forall {binders} . Nat;\ng{n} {arguments} = S a0;\n\n"
+        for n in range(count)
+    )
+
+
+def best_time(f: Callable[[], object], repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        f()
+        times.append(perf_counter() - start)
+    return min(times)
+
+
+def module_statements(lark: Lark, text: str) -> list[object]:
+    info = FileInfo("Generated.dgm", Path("Generated.dgm"))
+    return [
+        parse_to_core(lark, info, item)
+        for item in iter_segments(io.StringIO(text))
+        if isinstance(item, WordStart)
+    ]
+
+
+def intern_statement(table: HashConsTable, statement: object) -> object:
+    if isinstance(statement, VariableDeclaration):
+        return replace(
+            statement, declaration=table.intern(statement.declaration)
+        )
+    if isinstance(statement, VariableDefinition):
+        return replace(statement, definition=table.intern(statement.definition))
+    if isinstance(statement, DataType):
+        constructors: list[Constructor] = [
+            replace(c, arguments=table.intern(c.arguments))
+            for c in statement.constructors
+        ]
+        return replace(
+            statement,
+            argument=table.intern(statement.argument),
+            constructors=constructors,
+        )
+    return statement
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=64 * KB)
+    parser.add_argument("--count", type=int, default=200)
+    parser.add_argument("--width", type=int, default=40)
+    parser.add_argument("--slowest", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    lark = load_grammar(transformer=ToCore())
+    assert isinstance(lark, Lark)
+    generated = prelude + generate_module(args.size)
+    shared = shared_module(args.count, args.width)
+    print(
+        f"{'module':>10} {'terms':>10} {'memo':>6} {'hits':>8} {'misses':>8} {'time':>10}"
+    )
+    for module, text in [("generated", generated), ("shared", shared)]:
+        plain = module_statements(lark, text)
+        table: HashConsTable = HashConsTable()
+        interned = [intern_statement(table, statement) for statement in plain]
+        for name, statements in [("plain", plain), ("interned", interned)]:
+            for memoize in [False, True]:
+                report = check_module(statements, memoize=memoize)
+                assert all(d.error is None for d in report.definitions)
+                seconds = best_time(
+                    lambda: check_module(statements, memoize=memoize),
+                    args.repeat,
+                )
+                print(
+                    f"{module:>10} {name:>10} {'on' if memoize else 'off':>6}"
+                    f" {report.hits:>8} {report.misses:>8}"
+                    f" {seconds * 1000:>7.2f} ms"
+                )
+    for definition in report.slowest(args.slowest):
+        print(
+            f"{definition.name:>10} {definition.seconds * 1e6:>8.0f} us"
+            f" {definition.hits:>4} hits {definition.misses:>4} misses"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Measures the metavariables of `Degumin.Core.Unification`.
+
+Run it with `python -m benchmarks.unification`. First it type checks
+modules of growing size where every definition has two holes solved by
+unification, and prints the time by hole, which stays flat as nothing
+is walked again when a hole is solved. Then it merges `--chain`
+metavariables in a line and times finding the root of every one: twice
+with the path compression of `MetaStore.find`, the second pass finds
+flat paths, and once walking the parents without compressing them.
+Every time is the best of `--repeat` runs, with the garbage collector
+off.
+"""
+import gc
+import io
+from argparse import ArgumentParser
+from pathlib import Path
+from time import perf_counter
+from typing import Callable
+
+from lark import Lark
+
+from Degumin.Common.File import FileInfo
+from Degumin.Core.Evaluation import UniverseValue
+from Degumin.Core.Transformation import ToCore, parse_to_core
+from Degumin.Core.TypeCheck import check_module
+from Degumin.Core.Unification import MetaStore
+from Degumin.Parser.Lexer import WordStart, iter_segments
+from Degumin.Parser.Parser import load_grammar
+
+prelude = """data Nat : Type =
+  Z : Nat;
+  S : forall (n : Nat) . Nat;
+  ;
+
+id : forall (a : Type) (x : a) . a;
+id a x = x;
+
+"""
+
+definition_template = """h{n} : Nat;
+h{n} = id ?a (S (id ?b Z));
+
+"""
+
+
+def best_time(f: Callable[[], object], repeat: int) -> float:
+    # Like `timeit`, without the garbage collector whose full collections
+    # grow with the objects kept by the checker.
+    times = []
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = perf_counter()
+            f()
+            times.append(perf_counter() - start)
+    finally:
+        gc.enable()
+    return min(times)
+
+
+def module_statements(lark: Lark, text: str) -> list[object]:
+    info = FileInfo("Holes.dgm", Path("Holes.dgm"))
+    return [
+        parse_to_core(lark, info, item)
+        for item in iter_segments(io.StringIO(text))
+        if isinstance(item, WordStart)
+    ]
+
+
+def chain(size: int) -> MetaStore:
+    metas = MetaStore()
+    for _ in range(size):
+        metas.fresh(UniverseValue(0), 0)
+    for number in range(size - 1):
+        metas.merge(number, number + 1)
+    return metas
+
+
+def find_without_compression(metas: MetaStore, number: int) -> int:
+    while metas.parents[number] != number:
+        number = metas.parents[number]
+    return number
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--chain", type=int, default=3_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    lark = load_grammar(transformer=ToCore())
+    assert isinstance(lark, Lark)
+
+    print(f"{'holes':>8} {'solved':>8} {'time':>10} {'by hole':>10}")
+    for count in [500, 1_000, 2_000, 4_000]:
+        text = prelude + "".join(
+            definition_template.format(n=n) for n in range(count)
+        )
+        statements = module_statements(lark, text)
+        report = check_module(statements)
+        assert all(d.error is None for d in report.definitions)
+        holes = len(report.holes)
+        solved = holes - len(report.metas.unsolved())
+        seconds = best_time(lambda: check_module(statements), args.repeat)
+        print(
+            f"{holes:>8} {solved:>8} {seconds * 1000:>7.2f} ms"
+            f" {seconds / holes * 1e6:>7.2f} us"
+        )
+
+    size = args.chain
+    print(f"chain of {size} merged metavariables")
+    for name, f in [
+        (
+            "compressing",
+            lambda metas: [metas.find(n) for n in range(size)],
+        ),
+        (
+            "compressed",
+            lambda metas: [metas.find(n) for n in range(size)],
+        ),
+        (
+            "walking",
+            lambda metas: [
+                find_without_compression(metas, n) for n in range(size)
+            ],
+        ),
+    ]:
+        stores = [chain(size) for _ in range(args.repeat)]
+        if name == "compressed":
+            for metas in stores:
+                metas.find(0)
+        roots = iter(stores)
+        seconds = best_time(lambda: f(next(roots)), args.repeat)
+        print(f"{name:>12} {seconds * 1000:>10.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
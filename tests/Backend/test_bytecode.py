@@ -0,0 +1,90 @@
+import io
+from pathlib import Path
+
+from Degumin.Backend.Bytecode import (
+    CALL,
+    DATA,
+    SWITCH,
+    TAIL_CALL,
+    PatternArity,
+    Program,
+    UnboundName,
+    UnsupportedTerm,
+    compile_program,
+    read_program,
+    write_program,
+)
+from Degumin.Common.File import FileInfo
+from Degumin.Core.Transformation import ToCore, parse_to_core
+from Degumin.Parser.Lexer import WordStart, iter_segments
+from Degumin.Parser.Parser import load_grammar
+
+text = """data Nat : Type =
+  Z : Nat;
+  S : forall (n : Nat) . Nat;
+  ;
+
+add : forall (m : Nat) (n : Nat) . Nat;
+add m n =
+  case m of
+    Z -> n;
+    S k -> add k (S n);
+  ;
+
+two = S (S Z);
+"""
+
+
+def statements(source: str) -> list[object]:
+    lark = load_grammar(transformer=ToCore())
+    info = FileInfo("test", Path("test"))
+    return [
+        parse_to_core(lark, info, item)  # type:ignore
+        for item in iter_segments(io.StringIO(source))
+        if isinstance(item, WordStart)
+    ]
+
+
+def opcodes(program: Program, name: str) -> list[int]:
+    code = next(f.code for f in program.functions if f.name == name)
+    return list(code[::2])
+
+
+def test_lowering():
+    program = compile_program(statements(text))
+    assert isinstance(program, Program)
+    assert program.constructors == [("Z", 0), ("S", 1)]
+    assert [d.name for d in program.definitions] == ["add", "two"]
+    body = opcodes(program, "add.lambda")
+    # The recursive call replaces the frame, the constructors are built
+    # without calls and the case jumps through a table.
+    assert TAIL_CALL in body and CALL not in body
+    assert SWITCH in body and DATA in body
+    # Z and S both have an alternative, nothing falls to a default
+    table = program.tables[0]
+    assert len(table.targets) == 2 and min(table.targets) >= 0
+    assert table.default == -1
+    assert CALL not in opcodes(program, "two")
+
+
+def test_bytes_round_trip(tmp_path):
+    program = compile_program(statements(text))
+    assert isinstance(program, Program)
+    assert Program.from_bytes(program.to_bytes()) == program
+    path = tmp_path / "out" / "Test.dgb"
+    write_program(program, path)
+    assert read_program(path) == program
+
+
+def test_errors():
+    assert compile_program(statements("f = g Z;\n")) == UnboundName("g")
+    error = compile_program(statements("f = ?h;\n"))
+    assert isinstance(error, UnsupportedTerm)
+    # `S a b` is `S (a b)`, and `a` isn't a constructor
+    for pattern, expected in [
+        ("Foo k", UnboundName("Foo")),
+        ("S a b", UnboundName("a")),
+        ("Z k", PatternArity("Z", 0, 1)),
+    ]:
+        source = text + f"\nf m =\n  case m of\n    {pattern} -> m;\n  ;\n"
+        assert compile_program(statements(source)) == expected
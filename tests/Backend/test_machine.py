@@ -0,0 +1,200 @@
+import io
+from pathlib import Path
+
+from Degumin.Backend.Bytecode import Program, compile_program
+from Degumin.Backend.Machine import (
+    CyclicDefinition,
+    Machine,
+    NoMatchingAlternative,
+    NotAFunction,
+    UndefinedName,
+)
+from Degumin.Backend.PythonCode import load_module, write_module
+from Degumin.Common.File import FileInfo
+from Degumin.Core.Core import (
+    Abstraction,
+    Alternative,
+    Application,
+    Case,
+    FreeVariable,
+    IntValue,
+    Let,
+    MatchLiteralInt,
+    MatchVariable,
+    VariableDefinition,
+)
+from Degumin.Core.Evaluation import Evaluator
+from Degumin.Core.Transformation import ToCore, parse_to_core
+from Degumin.Parser.Lexer import WordStart, iter_segments
+from Degumin.Parser.Parser import load_grammar
+
+text = """data Nat : Type =
+  Z : Nat;
+  S : forall (n : Nat) . Nat;
+  ;
+
+add : forall (m : Nat) (n : Nat) . Nat;
+add m n =
+  case m of
+    Z -> n;
+    S k -> S (add k n);
+  ;
+
+mul m n =
+  case m of
+    Z -> Z;
+    S k -> add n (mul k n);
+  ;
+
+fib m =
+  case m of
+    Z -> Z;
+    S Z -> S Z;
+    S S k -> add (fib (S k)) (fib k);
+  ;
+
+count m acc =
+  case m of
+    Z -> acc;
+    S k -> count k (S acc);
+  ;
+
+id : forall (a : Type) (x : a) . a;
+id a x = x;
+
+twice f x = f (f x);
+
+three = S (S (S Z));
+ten = add (mul three three) (S Z);
+main = fib (id Nat ten);
+six = twice (add three) Z;
+over = id (forall (n : Nat) . Nat) (add three) three;
+loop = loop;
+bad = three Z;
+five = 5;
+"""
+
+
+def statements(source: str) -> list[object]:
+    lark = load_grammar(transformer=ToCore())
+    info = FileInfo("test", Path("test"))
+    return [
+        parse_to_core(lark, info, item)  # type:ignore
+        for item in iter_segments(io.StringIO(source))
+        if isinstance(item, WordStart)
+    ]
+
+
+def var(name: str) -> FreeVariable[None]:
+    return FreeVariable(name, None)
+
+
+def machine(source: str = text) -> Machine:
+    program = compile_program(statements(source))
+    assert isinstance(program, Program)
+    return Machine(program)
+
+
+def natural(value) -> int:
+    n = 0
+    while value[0] == 1:
+        value = value[1]
+        n += 1
+    return n
+
+
+def test_programs():
+    m = machine()
+    assert natural(m.run("ten")) == 10
+    assert natural(m.run("main")) == 55
+    # Partial and over application
+    assert natural(m.run("six")) == 6
+    assert natural(m.run("over")) == 6
+    assert m.calls > 0
+
+
+def test_same_results_as_the_evaluator(tmp_path: Path):
+    parsed = statements(text)
+    definitions = {
+        s.name: s.definition
+        for s in parsed
+        if isinstance(s, VariableDefinition)
+    }
+    evaluator = Evaluator(definitions, constructors=["S", "Z"])
+    m = machine()
+    for name in ["ten", "main", "six", "over", "five"]:
+        expected = evaluator.quote(evaluator.evaluate(var(name)))
+        assert m.read_back(m.run(name)) == expected
+    # Literals are ints from the transformation on, in every backend
+    path = tmp_path / "program.py"
+    errors = ["loop", "bad"]
+    kept = [s for s in parsed if getattr(s, "name", None) not in errors]
+    assert write_module(kept, "test", text.encode(), path) is True
+    assert load_module(path).five == m.run("five") == 5
+
+
+def test_deep_recursion():
+    # Deeper than the recursion limit of Python
+    m = machine()
+    big = (0,)
+    for _ in range(50_000):
+        big = (1, big)
+    count = m.evaluate("count")
+    assert natural(m.apply(count, [big, (0,)])) == 50_000
+    result = m.apply(m.evaluate("add"), [big, big])
+    assert natural(result) == 100_000
+    term = m.read_back(big)
+    depth = 0
+    while isinstance(term, Application):
+        term = term.right
+        depth += 1
+    assert depth == 50_000 and term == var("Z")
+
+
+def test_errors():
+    m = machine()
+    assert m.run("loop") == CyclicDefinition("loop")
+    assert m.run("loop") == CyclicDefinition("loop")
+    # A definition that failed isn't left half computed
+    assert isinstance(m.run("bad"), NotAFunction)
+    assert isinstance(m.run("bad"), NotAFunction)
+    assert natural(m.run("three")) == 3
+    assert m.run("missing") == UndefinedName("missing")
+    partial = machine(
+        "data Nat : Type =\n  Z : Nat;\n  S : forall (n : Nat) . Nat;\n  ;\n"
+        "\npred m =\n  case m of\n    S k -> k;\n  ;\n\nno = pred Z;\n"
+    )
+    assert partial.run("no") == NoMatchingAlternative((0,))
+
+
+def test_literals_and_recursive_let():
+    # let rec even = \n -> case n of 0 -> 1; _ -> odd n
+    #         odd = \n -> 0
+    #     in even 0, with a table on literals
+    even = Abstraction(
+        [var("n")],
+        Case(
+            var("n"),
+            [
+                Alternative(MatchLiteralInt(0, None), IntValue(1, None), None),
+                Alternative(
+                    MatchVariable("_m", None),
+                    Application(var("odd"), var("n"), None),
+                    None,
+                ),
+            ],
+            None,
+        ),
+        None,
+    )
+    odd = Abstraction([var("n")], IntValue(0, None), None)
+    for argument, expected in [(0, 1), (5, 0)]:
+        term = Let(
+            True,
+            {"even": even, "odd": odd},
+            Application(var("even"), IntValue(argument, None), None),
+            None,
+        )
+        program = compile_program([VariableDefinition("main", term, None)])
+        assert isinstance(program, Program)
+        assert Machine(program).run("main") == expected
@@ -0,0 +1,225 @@
+import io
+from pathlib import Path
+
+from Degumin.Backend.Bytecode import (
+    PatternArity,
+    UnboundName,
+    UnsupportedTerm,
+)
+from Degumin.Backend.PythonCode import (
+    CyclicDefinitions,
+    cached_hash,
+    generate_module,
+    load_module,
+    write_module,
+)
+from Degumin.Common.File import FileInfo
+from Degumin.Core.Core import (
+    Abstraction,
+    Alternative,
+    Application,
+    Case,
+    FreeVariable,
+    IntValue,
+    Let,
+    MatchLiteralInt,
+    MatchVariable,
+    VariableDefinition,
+)
+from Degumin.Core.Transformation import ToCore, parse_to_core
+from Degumin.Parser.Lexer import WordStart, iter_segments
+from Degumin.Parser.Parser import load_grammar
+
+text = """data Nat : Type =
+  Z : Nat;
+  S : forall (n : Nat) . Nat;
+  ;
+
+data Option : Type =
+  None : Option;
+  Some : forall (n : Nat) . Option;
+  ;
+
+add : forall (m : Nat) (n : Nat) . Nat;
+add m n =
+  case m of
+    Z -> n;
+    S k -> S (add k n);
+  ;
+
+mul m n =
+  case m of
+    Z -> Z;
+    S k -> add n (mul k n);
+  ;
+
+fib m =
+  case m of
+    Z -> Z;
+    S Z -> S Z;
+    S S k -> add (fib (S k)) (fib k);
+  ;
+
+count m acc =
+  case m of
+    Z -> acc;
+    S k -> count k (S acc);
+  ;
+
+get o =
+  case o of
+    None -> Z;
+    Some n -> n;
+  ;
+
+id : forall (a : Type) (x : a) . a;
+id a x = x;
+
+twice f x = f (f x);
+
+three = S (S (S Z));
+ten = add (mul three three) (S Z);
+main = fib (id Nat ten);
+six = twice (add three) Z;
+over = id (forall (n : Nat) . Nat) (add three) three;
+some = Some ten;
+got = get some;
+identity = id;
+"""
+
+
+def statements(source: str) -> list[object]:
+    lark = load_grammar(transformer=ToCore())
+    info = FileInfo("test", Path("test"))
+    return [
+        parse_to_core(lark, info, item)  # type:ignore
+        for item in iter_segments(io.StringIO(source))
+        if isinstance(item, WordStart)
+    ]
+
+
+def var(name: str) -> FreeVariable[None]:
+    return FreeVariable(name, None)
+
+
+def load(tmp_path: Path, source: str = text):
+    path = tmp_path / "program.py"
+    written = write_module(statements(source), "test", source.encode(), path)
+    assert written is True
+    return load_module(path)
+
+
+def test_programs(tmp_path: Path):
+    module = load(tmp_path)
+    # Nat is computed with Python ints
+    assert module.three == 3 and module.ten == 10
+    assert module.main == 55
+    assert module.fib(20) == 6765
+    # Other data types are tuples of the tag and the arguments
+    assert module.some == (1, 10)
+    assert module.got == 10
+    assert module.None_ == (0,)
+
+
+def test_partial_over_application_and_erasure(tmp_path: Path):
+    module = load(tmp_path)
+    assert module.six == 6
+    assert module.over == 6
+    # The type argument of `id` is erased from its calls, not from its value
+    assert module.id_(7) == 7
+    assert module.identity(None, 7) == 7
+    assert module._apply(module.identity, None)(8) == 8
+    assert module._apply(module.add, 2)(3) == 5
+
+
+def test_erasure_of_functions_returning_closures(tmp_path: Path):
+    source = (
+        text
+        + "\nconstant : forall (a : Type) (x : a) (y : a) . a;"
+        + "\nconstant a x = \\y -> x;\n"
+        + "\nuseconstant = constant Nat Z (S Z);\n"
+    )
+    module = load(tmp_path, source)
+    assert module.useconstant == 0
+
+
+def test_tail_calls_loop(tmp_path: Path):
+    module = load(tmp_path)
+    # Deeper than the recursion limit of Python
+    assert module.count(50_000, 0) == 50_000
+    # The call under a successor too
+    assert module.add(50_000, 2) == 50_002
+    assert "offset += 1" in (tmp_path / "program.py").read_text()
+
+
+def test_literals_and_recursive_let(tmp_path: Path):
+    # let rec even = \n -> case n of 0 -> 1; _ -> odd n
+    #         odd = \n -> 0
+    #     in even, with a match on literals
+    even = Abstraction(
+        [var("n")],
+        Case(
+            var("n"),
+            [
+                Alternative(MatchLiteralInt(0, None), IntValue(1, None), None),
+                Alternative(
+                    MatchVariable("_m", None),
+                    Application(var("odd"), var("n"), None),
+                    None,
+                ),
+            ],
+            None,
+        ),
+        None,
+    )
+    odd = Abstraction([var("n")], IntValue(0, None), None)
+    term = Let(True, {"even": even, "odd": odd}, var("even"), None)
+    path = tmp_path / "literals.py"
+    assert write_module(
+        [VariableDefinition("main", term, None)], "test", b"literals", path
+    )
+    module = load_module(path)
+    assert module.main(0) == 1
+    assert module.main(5) == 0
+    assert "match n:" in path.read_text()
+
+
+def test_cache(tmp_path: Path):
+    path = tmp_path / "program.py"
+    parsed = statements(text)
+    assert write_module(parsed, "test", text.encode(), path) is True
+    hash = cached_hash(path)
+    assert hash is not None
+    path.write_text(path.read_text() + "marker = 1\n")
+    # The same source isn't generated again
+    assert write_module(parsed, "test", text.encode(), path) is False
+    assert load_module(path).marker == 1
+    changed = text + "four = S three;\n"
+    assert write_module(statements(changed), "test", changed.encode(), path)
+    assert cached_hash(path) != hash
+    module = load_module(path)
+    assert module.four == 4 and not hasattr(module, "marker")
+
+
+def test_errors():
+    assert generate_module(
+        [VariableDefinition("main", var("missing"), None)], "test", b""
+    ) == UnboundName("missing")
+    error = generate_module(statements("a = b;\n\nb = a;\n"), "test", b"")
+    assert isinstance(error, CyclicDefinitions)
+    assert sorted(error.names) == ["a", "b"]
+    recursive = Let(True, {"x": IntValue(1, None)}, var("x"), None)
+    assert isinstance(
+        generate_module(
+            [VariableDefinition("main", recursive, None)], "test", b""
+        ),
+        UnsupportedTerm,
+    )
+    # `S a b` is `S (a b)`, and `a` isn't a constructor
+    for pattern, expected in [
+        ("Foo k", UnboundName("Foo")),
+        ("S a b", UnboundName("a")),
+        ("Z k", PatternArity("Z", 0, 1)),
+    ]:
+        source = text + f"\nf m =\n  case m of\n    {pattern} -> m;\n  ;\n"
+        assert generate_module(statements(source), "test", b"") == expected
@@ -0,0 +1,75 @@
+import random
+
+from Degumin.Common.File import (
+    LineIndex,
+    Range,
+    Span,
+    mergeManyRanges,
+    mergeRanges,
+)
+from Degumin.Parser.Lexer import State
+
+
+def test_line_index_positions():
+    text = "ab\n\ncd\n"
+    index = LineIndex(text)
+    assert len(index) == 4
+    assert [index.line_column(p) for p in range(len(text) + 1)] == [
+        (0, 0),
+        (0, 1),
+        (0, 2),
+        (1, 0),
+        (2, 0),
+        (2, 1),
+        (2, 2),
+        (3, 0),
+    ]
+    assert index.position(2, 1) == 5
+    assert index.range(1, 5) == Range(0, 2, 1, 1, 1, 5)
+
+
+def test_line_index_same_as_segmenter():
+    rng = random.Random(0)
+    text = "".join(rng.choice(["a", " ", "\n", "λ"]) for _ in range(500))
+    index = LineIndex(text)
+    state = State(text, 0, 0, 0)
+    for position in sorted(rng.sample(range(len(text) + 1), 50)):
+        _range = state.advance_to(position)
+        assert index.range(_range.position_start, position) == _range
+
+
+def test_line_index_by_blocks():
+    text = "a\nbc\n\nd\n\n\nef"
+    index = LineIndex()
+    for start in range(0, len(text), 3):
+        index.extend(text[start : start + 3])
+    assert index.line_starts == LineIndex(text).line_starts
+    assert index.length == len(text)
+
+
+def test_merge_ranges():
+    a = Range(0, 0, 2, 5, 2, 5)
+    b = Range(1, 1, 0, 3, 7, 10)
+    assert mergeRanges(a, b) == Range(0, 1, 2, 3, 2, 10)
+    assert mergeRanges(b, a) == Range(0, 1, 2, 3, 2, 10)
+    whole = mergeRanges(a, b)
+    assert mergeRanges(whole, a) is whole
+    assert mergeManyRanges([b, whole, a]) is whole
+    assert mergeManyRanges([b, a]) == whole
+
+
+def test_span_merge():
+    a = Span(1, 2, 5)
+    b = Span(1, 7, 10)
+    assert a.merge(b) == b.merge(a) == Span(1, 2, 10)
+    assert Span(1, 2, 10).merge(a) == Span(1, 2, 10)
+    assert a.merge(Span(1, 2, 10)) == Span(1, 2, 10)
+    assert Span.merge_many([b, Span(1, 3, 4), a]) == Span(1, 2, 10)
+    assert Span.merge_many([a]) is a
+    assert sorted([b, a]) == [a, b]
+    assert len({a, Span(1, 2, 5)}) == 1
+
+
+def test_span_to_range():
+    index = LineIndex("ab\ncd")
+    assert Span(0, 1, 4).to_range(index) == Range(0, 1, 1, 1, 1, 4)
@@ -0,0 +1,30 @@
+import logging
+from pathlib import Path
+
+import pytest
+
+from Degumin.Common.Loggers import (
+    LogFileHandler,
+    get_logger,
+    log_directory_variable,
+)
+
+
+def test_log_files_are_opened_at_the_first_record(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    directory = tmp_path / "logs"
+    monkeypatch.setenv(log_directory_variable, str(directory))
+    log = get_logger("test_loggers.file")
+    assert not directory.exists()
+    log.error("first")
+    for handler in log.handlers:
+        handler.close()
+    assert "first" in (directory / "test_loggers.file.log").read_text()
+
+
+def test_loggers_write_to_stderr_by_default(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.delenv(log_directory_variable, raising=False)
+    log = get_logger("test_loggers.stderr")
+    assert not any(isinstance(h, LogFileHandler) for h in log.handlers)
+    assert any(type(h) is logging.StreamHandler for h in log.handlers)
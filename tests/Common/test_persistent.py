@@ -0,0 +1,84 @@
+import random
+
+import pytest
+
+from Degumin.Common.Persistent import PersistentMap, PersistentVector
+
+
+def test_vector_append_and_pop():
+    vectors = [PersistentVector[int]()]
+    for i in range(40_000):
+        vectors.append(vectors[-1].append(i))
+    # The old versions are unchanged
+    for size in [0, 1, 31, 32, 33, 1024, 1056, 1057, 32 * 32 * 32 + 33]:
+        vector = vectors[size]
+        assert len(vector) == size
+        assert list(vector) == list(range(size))
+        assert [vector[i] for i in range(size)] == list(range(size))
+    vector = vectors[-1]
+    for size in range(40_000, 0, -1):
+        assert vector[size - 1] == size - 1
+        vector = vector.pop()
+        assert len(vector) == size - 1
+    assert list(vector) == []
+    with pytest.raises(IndexError):
+        vector.pop()
+
+
+def test_vector_random_operations():
+    rng = random.Random(0)
+    vector = PersistentVector[int]()
+    expected: list[int] = []
+    for _ in range(20_000):
+        if expected and rng.random() < 0.4:
+            vector = vector.pop()
+            expected.pop()
+        else:
+            value = rng.randrange(1000)
+            vector = vector.append(value)
+            expected.append(value)
+    assert list(vector) == expected
+    assert [vector[i] for i in range(len(expected))] == expected
+    with pytest.raises(IndexError):
+        vector[len(expected)]
+    with pytest.raises(IndexError):
+        vector[-1]
+
+
+def test_map_random_operations():
+    rng = random.Random(0)
+    maps = [PersistentMap[str, int]()]
+    dicts: list[dict[str, int]] = [{}]
+    for i in range(5_000):
+        key = f"k{rng.randrange(2_000)}"
+        maps.append(maps[-1].set(key, i))
+        dicts.append({**dicts[-1], key: i})
+    for _map, expected in zip(maps[::500], dicts[::500]):
+        assert len(_map) == len(expected)
+        assert dict(_map.items()) == expected
+        assert all(_map.get(key) == value for key, value in expected.items())
+        assert "missing" not in _map
+        assert _map.get("missing", -1) == -1
+
+
+class Colliding:
+    def __init__(self, name: str):
+        self.name = name
+
+    def __hash__(self) -> int:
+        return 42
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Colliding) and other.name == self.name
+
+
+def test_map_collisions():
+    keys = [Colliding(str(i)) for i in range(10)]
+    _map = PersistentMap[object, int]()
+    for i, key in enumerate(keys):
+        _map = _map.set(key, i)
+    _map = _map.set(keys[3], 30).set(10, 100).set(42, 420)
+    assert len(_map) == 12
+    assert [_map.get(key) for key in keys] == [0, 1, 2, 30, 4, 5, 6, 7, 8, 9]
+    assert _map.get(42) == 420
+    assert _map.get(Colliding("other")) is None
@@ -0,0 +1,86 @@
+from pathlib import Path
+
+from Degumin.Common.File import LineIndex, Span
+from Degumin.Compiler.Driver import ModuleResult, compile_modules
+from Degumin.Core.Core import VariableDeclaration, VariableDefinition
+from Degumin.Parser.Parser import (
+    FileLoadError,
+    LarkParseError,
+    SegmentationError,
+)
+
+
+def write_modules(directory: Path) -> list[Path]:
+    paths = []
+    for name, definitions in [("Small", 1), ("Big", 200), ("Medium", 20)]:
+        path = directory / f"{name}.dgm"
+        text = f"module {name} where\n\n" + "".join(
+            f"f{i} : Type;\n\n" for i in range(definitions)
+        )
+        path.write_text(text)
+        paths.append(path)
+    return paths
+
+
+def test_compile_modules_keeps_input_order(tmp_path: Path):
+    paths = write_modules(tmp_path)
+    paths.insert(1, tmp_path / "Missing.dgm")
+    serial = compile_modules(paths, jobs=1, use_parser_cache=False)
+    parallel = compile_modules(paths, jobs=3, use_parser_cache=False)
+    assert serial == parallel
+    assert isinstance(parallel[1], FileLoadError)
+    modules = [r for r in parallel if isinstance(r, ModuleResult)]
+    assert [m.info.name for m in modules] == [
+        "Small.dgm",
+        "Big.dgm",
+        "Medium.dgm",
+    ]
+    assert [len(m.segments) for m in modules] == [2, 201, 21]
+    assert isinstance(modules[0].segments[1], VariableDeclaration)
+
+
+def test_compile_module_by_segments(tmp_path: Path, monkeypatch):
+    import Degumin.Compiler.Driver as Driver
+
+    # Small batches, so the module is spread over several workers
+    monkeypatch.setattr(Driver, "segment_batch_size", 64)
+    path = tmp_path / "Big.dgm"
+    text = (
+        "module Big where\n\n"
+        + "".join(f"f{i} : Type;\n\n" for i in range(100))
+        + "g : (;\n\n"
+        + "(\n\n"
+        + "".join(f"h{i} : Type;\n\n" for i in range(100))
+    )
+    path.write_text(text)
+    serial = compile_modules([path], jobs=1, use_parser_cache=False)
+    parallel = compile_modules([path], jobs=3, use_parser_cache=False)
+    assert serial == parallel
+    module = parallel[0]
+    assert isinstance(module, ModuleResult)
+    assert len(module.segments) == 203
+    assert isinstance(module.segments[101], LarkParseError)
+    assert isinstance(module.segments[102], SegmentationError)
+    last = module.segments[-1]
+    assert isinstance(last, VariableDeclaration)
+    assert LineIndex(text).line_column(last.info.start) == (404, 0)
+    assert last.info == Span(0, text.index("h99"), text.index("h99") + 3)
+
+
+def test_keep_trees_gives_the_same_core(tmp_path: Path):
+    path = tmp_path / "Terms.dgm"
+    path.write_text(
+        "module Terms where\n\n"
+        "f x =\n  case x of\n    Z -> let y = 1;\n         in y;\n"
+        "    S k -> f k;\n  ;\n\n"
+        "g = ;\n"
+    )
+    inline = compile_modules([path], jobs=1, use_parser_cache=False)
+    trees = compile_modules(
+        [path], jobs=1, use_parser_cache=False, keep_trees=True
+    )
+    assert inline == trees
+    module = inline[0]
+    assert isinstance(module, ModuleResult)
+    assert isinstance(module.segments[1], VariableDefinition)
+    assert isinstance(module.segments[2], LarkParseError)
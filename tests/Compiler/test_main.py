@@ -0,0 +1,86 @@
+import logging
+from pathlib import Path
+
+import pytest
+
+from Degumin.Backend.Bytecode import read_program
+from Degumin.Backend.Machine import Machine
+from Degumin.Backend.PythonCode import load_module
+from Degumin.Compiler.Main import main
+
+text = """data Nat : Type =
+  Z : Nat;
+  S : forall (n : Nat) . Nat;
+  ;
+
+add : forall (m : Nat) (n : Nat) . Nat;
+add m n =
+  case m of
+    Z -> n;
+    S k -> S (add k n);
+  ;
+
+two : Nat;
+two = add (S Z) (S Z);
+"""
+
+
+def natural(value) -> int:
+    n = 0
+    while value[0] == 1:
+        value = value[1]
+        n += 1
+    return n
+
+
+def test_compile_writes_the_modules(tmp_path: Path):
+    source = tmp_path / "Numbers.dgm"
+    source.write_text(text)
+    output = tmp_path / "out"
+    main(["compile", "--no-parser-cache", "-o", str(output), str(source)])
+    machine = Machine(read_program(output / "Numbers.dgb"))
+    assert natural(machine.run("two")) == 2
+    main(["compile", "-t", "python", "-o", str(output), str(source)])
+    assert load_module(output / "Numbers.py").two == 2
+
+
+def test_compile_skips_modules_with_errors(tmp_path: Path):
+    good = tmp_path / "Good.dgm"
+    good.write_text(text)
+    bad = tmp_path / "Bad.dgm"
+    bad.write_text(text + "\nwrong : Nat;\nwrong = Type;\n")
+    output = tmp_path / "out"
+    with pytest.raises(SystemExit) as stopped:
+        main(["compile", "-o", str(output), str(good), str(bad)])
+    assert stopped.value.code == 1
+    assert (output / "Good.dgb").exists()
+    assert not (output / "Bad.dgb").exists()
+
+
+def test_negative_jobs_are_rejected(tmp_path: Path):
+    with pytest.raises(SystemExit) as stopped:
+        main(["compile", "-j", "-1", str(tmp_path / "Numbers.dgm")])
+    assert stopped.value.code == 2
+
+
+def test_errors_are_logged_with_their_line(
+    tmp_path: Path, caplog: pytest.LogCaptureFixture
+):
+    source = tmp_path / "Implicit.dgm"
+    source.write_text(text + "\nf : forall {a : Type} . Type;\n")
+    with caplog.at_level(logging.ERROR), pytest.raises(SystemExit):
+        main(["compile", "-o", str(tmp_path / "out"), str(source)])
+    line = text.count("\n") + 2
+    assert f"{source}:{line}:13: UnsupportedSyntax" in caplog.text
+
+
+def test_symbol_paths_are_reported_as_ignored(
+    tmp_path: Path, caplog: pytest.LogCaptureFixture
+):
+    source = tmp_path / "Numbers.dgm"
+    source.write_text(text)
+    output = tmp_path / "out"
+    with caplog.at_level(logging.WARNING):
+        main(["compile", "-o", str(output), "-p", "lib", "--", str(source)])
+    assert "ignoring the paths lib" in caplog.text
+    assert (output / "Numbers.dgb").exists()
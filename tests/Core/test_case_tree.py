@@ -0,0 +1,178 @@
+import io
+import random
+from pathlib import Path
+
+from Degumin.Common.File import FileInfo
+from Degumin.Core.CaseTree import (
+    CaseCompiler,
+    ConstructorSwitch,
+    Leaf,
+    LiteralSwitch,
+    Signature,
+    case_reports,
+)
+from Degumin.Core.Core import (
+    Alternative,
+    Application,
+    Case,
+    DefaultCase,
+    FreeVariable,
+    IntValue,
+    MatchConstructor,
+    MatchLiteralInt,
+    MatchVariable,
+    Term,
+)
+from Degumin.Core.Evaluation import Evaluator
+from Degumin.Core.Transformation import ToCore, parse_to_core
+from Degumin.Parser.Lexer import WordStart, iter_segments
+from Degumin.Parser.Parser import load_grammar
+
+nat = Signature(
+    {"Z": ("Nat", 0), "S": ("Nat", 1)},
+    {"Nat": ["Z", "S"]},
+)
+
+
+def var(name: str) -> FreeVariable[None]:
+    return FreeVariable(name, None)
+
+
+def successor(pattern) -> MatchConstructor[None]:
+    return MatchConstructor("S", [pattern], None)
+
+
+def alternative(pattern, value: Term[None]) -> Alternative:
+    return Alternative(pattern, value, None)
+
+
+def natural(n: int) -> Term[None]:
+    term: Term[None] = var("Z")
+    for _ in range(n):
+        term = Application(var("S"), term, None)
+    return term
+
+
+def test_nested_patterns_test_every_part_once():
+    # Z -> 0; S Z -> 1; S (S k) -> k
+    zero = MatchVariable("Z", None)
+    alternatives = [
+        alternative(zero, IntValue(0, None)),
+        alternative(successor(zero), IntValue(1, None)),
+        alternative(successor(successor(MatchVariable("k", None))), var("k")),
+    ]
+    compiled = CaseCompiler(["S", "Z"], nat).compile(alternatives)
+    tree = compiled.tree
+    assert isinstance(tree, ConstructorSwitch) and tree.default is None
+    assert tree.branches["Z"] == Leaf(0)
+    inner = tree.branches["S"]
+    assert isinstance(inner, ConstructorSwitch) and inner.occurrence == (0,)
+    assert inner.branches == {"Z": Leaf(1), "S": Leaf(2)}
+    assert compiled.binders == [[], [], [("k", (0, 0))]]
+    assert compiled.redundant == [] and compiled.missing == []
+
+
+def test_redundant_and_missing_alternatives():
+    # S k -> k; S Z -> Z
+    alternatives = [
+        alternative(successor(MatchVariable("k", None)), var("k")),
+        alternative(successor(MatchVariable("Z", None)), var("Z")),
+    ]
+    compiled = CaseCompiler(["S", "Z"], nat).compile(alternatives)
+    assert compiled.redundant == [1]
+    assert compiled.missing == [MatchVariable("Z", None)]
+    # Without a signature the other constructors aren't known
+    unknown = CaseCompiler(["S", "Z"]).compile(alternatives)
+    assert unknown.redundant == [1]
+    assert unknown.missing == [DefaultCase(None)]
+
+
+def test_missing_nested_constructor():
+    # Z -> Z; S Z -> Z  misses  S (S _)
+    zero = MatchVariable("Z", None)
+    alternatives = [
+        alternative(zero, var("Z")),
+        alternative(successor(zero), var("Z")),
+    ]
+    compiled = CaseCompiler(["S", "Z"], nat).compile(alternatives)
+    assert compiled.missing == [successor(successor(DefaultCase(None)))]
+
+
+def test_literal_jump_map():
+    alternatives = [
+        alternative(MatchLiteralInt(n, None), IntValue(n * n, None))
+        for n in range(50)
+    ] + [alternative(MatchVariable("n", None), var("n"))]
+    compiled = CaseCompiler([]).compile(alternatives)
+    assert isinstance(compiled.tree, LiteralSwitch)
+    assert compiled.tree.branches[49] == Leaf(49)
+    assert compiled.tree.default == Leaf(50)
+    assert compiled.missing == []
+    evaluator = Evaluator()
+    for n in random.sample(range(100), 20):
+        expected = IntValue(n * n if n < 50 else n, None)
+        assert (
+            evaluator.normalize(Case(IntValue(n, None), alternatives, None))
+            == expected
+        )
+    assert len(evaluator.case_trees) == 1
+
+
+def test_evaluation_matches_first_alternative():
+    # Z -> 0; S Z -> 1; S (S k) -> k; _ -> 7
+    zero = MatchVariable("Z", None)
+    alternatives = [
+        alternative(zero, IntValue(0, None)),
+        alternative(successor(zero), IntValue(1, None)),
+        alternative(successor(successor(MatchVariable("k", None))), var("k")),
+        alternative(DefaultCase(None), IntValue(7, None)),
+    ]
+    evaluator = Evaluator(constructors=["S", "Z"])
+    for n in range(6):
+        expected = [IntValue(0, None), IntValue(1, None)][n] if n < 2 else None
+        result = evaluator.normalize(Case(natural(n), alternatives, None))
+        assert result == (expected or natural(n - 2))
+
+
+text = """data Nat : Type =
+  Z : Nat;
+  S : forall (n : Nat) . Nat;
+  ;
+
+pred : forall (m : Nat) . Nat;
+pred m =
+  case m of
+    Z -> Z;
+    S k -> k;
+  ;
+
+half : forall (m : Nat) . Nat;
+half m =
+  case m of
+    S S k -> S (half k);
+    Z -> Z;
+  ;
+
+first : forall (m : Nat) . Nat;
+first m =
+  case m of
+    k -> k;
+    Z -> Z;
+  ;
+"""
+
+
+def test_case_reports():
+    lark = load_grammar(transformer=ToCore())
+    info = FileInfo("test", Path("test"))
+    statements = [
+        parse_to_core(lark, info, item)  # type:ignore
+        for item in iter_segments(io.StringIO(text))
+        if isinstance(item, WordStart)
+    ]
+    reports = case_reports(statements)
+    assert [r.name for r in reports] == ["half", "first"]
+    assert reports[0].redundant == []
+    assert reports[0].missing == [successor(MatchVariable("Z", None))]
+    assert [a.case.name for a in reports[1].redundant] == ["Z"]
+    assert reports[1].missing == []
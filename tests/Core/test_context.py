@@ -0,0 +1,47 @@
+from Degumin.Core.Core import Context, FreeVariable, IntValue, Universe
+
+universe = Universe(0, None)
+
+
+def entry(n: int):
+    return (IntValue(n, None), universe)
+
+
+def test_lookup_missing_names():
+    context = Context().extend({"x": entry(0)})
+    assert context.lookup("y") is None
+    assert context.lookup(0) is None
+    assert context.bind(entry(1)).lookup(1) is None
+    assert context.bind(entry(1)).lookup(-1) is None
+
+
+def test_de_bruijn_indices():
+    context = Context()
+    for n in range(100):
+        context = context.bind(entry(n))
+    assert context.lookup(0) == entry(99)
+    assert context.lookup(99) == entry(0)
+    assert context.unbind().lookup(0) == entry(98)
+
+
+def test_extensions_share_the_context():
+    base = Context().extend({"Nat": (FreeVariable("Nat", None), universe)})
+    inner = base.bind(entry(0)).extend({"x": entry(1)})
+    other = base.bind(entry(2))
+    assert inner.lookup(0) == entry(0)
+    assert other.lookup(0) == entry(2)
+    assert inner.lookup("x") == entry(1)
+    assert other.lookup("x") is None
+    assert base.lookup(0) is None
+    assert inner.lookup("Nat") == base.lookup("Nat")
+
+
+def test_deep_binders():
+    context = Context()
+    contexts = []
+    for n in range(100_000):
+        context = context.bind(entry(n))
+        contexts.append(context)
+    assert context.lookup(99_999) == entry(0)
+    assert contexts[500].lookup(0) == entry(500)
+    assert len(contexts[500].bound) == 501
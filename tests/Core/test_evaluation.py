@@ -0,0 +1,219 @@
+from Degumin.Core.Core import (
+    Abstraction,
+    Alternative,
+    Application,
+    Case,
+    Forall,
+    FreeVariable,
+    IntValue,
+    Let,
+    MatchConstructor,
+    MatchLiteralInt,
+    MatchVariable,
+    Term,
+    Universe,
+    Variable,
+)
+from Degumin.Core.Evaluation import (
+    Evaluator,
+    OutOfFuel,
+    RecursiveValue,
+    UnboundIndex,
+)
+
+
+def var(name: str) -> FreeVariable[None]:
+    return FreeVariable(name, None)
+
+
+def lam(*names_and_body) -> Abstraction[None]:
+    *names, body = names_and_body
+    return Abstraction([var(name) for name in names], body, None)
+
+
+def app(function: Term[None], *arguments: Term[None]) -> Term[None]:
+    for argument in arguments:
+        function = Application(function, argument, None)
+    return function
+
+
+def numeral(n: int) -> Term[None]:
+    body: Term[None] = var("x")
+    for _ in range(n):
+        body = app(var("f"), body)
+    return lam("f", "x", body)
+
+
+church = {
+    "add": lam(
+        "m",
+        "n",
+        "f",
+        "x",
+        app(var("m"), var("f"), app(var("n"), var("f"), var("x"))),
+    ),
+    "mult": lam("m", "n", "f", app(var("m"), app(var("n"), var("f")))),
+    "exp": lam("m", "n", app(var("n"), var("m"))),
+}
+
+
+def read_numeral(term: Term[None]) -> int:
+    # \f -> \x -> f (f ... x), the names of the binders may change
+    assert isinstance(term, Abstraction)
+    assert isinstance(term.term, Abstraction)
+    body = term.term.term
+    n = 0
+    while isinstance(body, Application):
+        assert isinstance(body.left, Variable) and body.left.number == 1
+        body = body.right
+        n += 1
+    assert isinstance(body, Variable) and body.number == 0
+    return n
+
+
+def test_church_arithmetic():
+    evaluator = Evaluator(church)
+    for term, expected in [
+        (app(var("add"), numeral(2), numeral(3)), 5),
+        (app(var("mult"), numeral(3), numeral(4)), 12),
+        (app(var("exp"), numeral(2), numeral(5)), 32),
+    ]:
+        normal = evaluator.normalize(term)
+        assert not isinstance(normal, OutOfFuel)
+        assert read_numeral(normal) == expected  # type:ignore
+    assert evaluator.steps > 0
+
+
+def test_deep_normal_forms():
+    # 2^14, far deeper than the recursion limit
+    term = app(var("exp"), numeral(2), numeral(14))
+    assert read_numeral(Evaluator(church).normalize(term)) == 2**14
+
+
+def test_normal_forms_under_binders():
+    # \y -> (\z -> z) y  ~>  \y -> y
+    term = lam("y", app(lam("z", var("z")), var("y")))
+    assert Evaluator().normalize(term) == Abstraction(
+        [var("y")], Variable(0, "y", None), None
+    )
+    # forall (a : (\t -> t) Type) . a  ~>  forall (a : Type) . a
+    universe = Universe(0, None)
+    term = Forall(
+        [(var("a"), app(lam("t", var("t")), universe))], var("a"), None
+    )
+    assert Evaluator().normalize(term) == Forall(
+        [(var("a"), universe)], Variable(0, "a", None), None
+    )
+
+
+def test_let_and_indices():
+    term = Let(
+        False,
+        {"a": IntValue(1, None), "b": IntValue(2, None)},
+        app(var("g"), Variable(0, "b", None), Variable(1, "a", None)),
+        None,
+    )
+    evaluator = Evaluator()
+    assert evaluator.normalize(term) == app(
+        var("g"), IntValue(2, None), IntValue(1, None)
+    )
+    assert evaluator.steps == 2
+    assert Evaluator().normalize(Variable(0, "x", None)) == UnboundIndex(0)
+
+
+def test_recursive_let():
+    # let rec even = \n -> case n of Z -> T; S k -> odd k
+    #         odd = \n -> case n of Z -> F; S k -> even k
+    #     in even (S (S (S Z)))
+    def parity(zero: str, other: str) -> Term[None]:
+        alternatives = [
+            Alternative(MatchVariable("Z", None), var(zero), None),
+            Alternative(
+                MatchConstructor("S", [MatchVariable("k", None)], None),
+                app(var(other), var("k")),
+                None,
+            ),
+        ]
+        return lam("n", Case(var("n"), alternatives, None))
+
+    three = app(var("S"), app(var("S"), app(var("S"), var("Z"))))
+    term = Let(
+        True,
+        {"even": parity("T", "odd"), "odd": parity("F", "even")},
+        app(var("even"), three),
+        None,
+    )
+    evaluator = Evaluator(constructors=["S", "Z", "T", "F"])
+    assert evaluator.normalize(term) == var("F")
+    value = Let(True, {"x": IntValue(1, None)}, var("x"), None)
+    assert Evaluator().normalize(value) == RecursiveValue("x")
+
+
+def test_case_reduces_on_constructors():
+    # case S (S Z) of Z -> 0; S k -> k
+    alternatives = [
+        Alternative(MatchVariable("Z", None), IntValue(0, None), None),
+        Alternative(
+            MatchConstructor("S", [MatchVariable("k", None)], None),
+            var("k"),
+            None,
+        ),
+    ]
+    scrutinee = app(var("S"), app(var("S"), var("Z")))
+    evaluator = Evaluator(constructors=["S", "Z"])
+    assert evaluator.normalize(Case(scrutinee, alternatives, None)) == app(
+        var("S"), var("Z")
+    )
+
+
+def test_stuck_case_is_read_back():
+    # \n -> case n of 0 -> 1; m -> m
+    alternatives = [
+        Alternative(MatchLiteralInt(0, None), IntValue(1, None), None),
+        Alternative(MatchVariable("m", None), var("m"), None),
+    ]
+    term = lam("n", Case(var("n"), alternatives, None))
+    assert Evaluator().normalize(term) == lam(
+        "n",
+        Case(
+            Variable(0, "n", None),
+            [
+                Alternative(alternatives[0].case, IntValue(1, None), None),
+                Alternative(alternatives[1].case, Variable(0, "m", None), None),
+            ],
+            None,
+        ),
+    )
+
+
+def test_case_on_a_neutral_part_is_stuck():
+    # case S y of S Z -> A; _ -> B, y is free
+    alternatives = [
+        Alternative(
+            MatchConstructor("S", [MatchVariable("Z", None)], None),
+            var("A"),
+            None,
+        ),
+        Alternative(MatchVariable("_n", None), var("B"), None),
+    ]
+    scrutinee = app(var("S"), var("y"))
+    evaluator = Evaluator(constructors=["S", "Z"])
+    term = app(Case(scrutinee, alternatives, None), var("x"))
+    assert evaluator.normalize(term) == app(
+        Case(
+            scrutinee,
+            [
+                Alternative(alternatives[0].case, var("A"), None),
+                Alternative(alternatives[1].case, var("B"), None),
+            ],
+            None,
+        ),
+        var("x"),
+    )
+
+
+def test_fuel():
+    omega = lam("x", app(var("x"), var("x")))
+    evaluator = Evaluator(fuel=100)
+    assert evaluator.normalize(app(omega, omega)) == OutOfFuel(100)
+    assert evaluator.steps == 101
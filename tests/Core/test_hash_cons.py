@@ -0,0 +1,94 @@
+import gc
+
+from Degumin.Common.File import Span
+from Degumin.Core.Core import (
+    Abstraction,
+    Alternative,
+    Application,
+    Case,
+    Forall,
+    FreeVariable,
+    IntValue,
+    Let,
+    MatchConstructor,
+    MatchVariable,
+    Term,
+    Universe,
+)
+from Degumin.Core.HashCons import HashConsTable
+
+
+def var(name: str, start: int = 0) -> FreeVariable[Span]:
+    return FreeVariable(name, Span(0, start, start + len(name)))
+
+
+def sample(start: int) -> Term[Span]:
+    # let f = \x -> x in case f y of S k -> forall (a : Type) . a
+    span = Span(0, start, start + 1)
+    alternative = Alternative(
+        MatchConstructor("S", [MatchVariable("k", span)], span),
+        Forall([(var("a", start), Universe(0, span))], var("a"), span),
+        span,
+    )
+    return Let(
+        False,
+        {"f": Abstraction([var("x", start)], var("x"), span)},
+        Case(Application(var("f"), var("y"), span), [alternative], span),
+        span,
+    )
+
+
+def test_equal_terms_are_the_same_object():
+    table = HashConsTable()
+    first = table.intern(sample(0))
+    second = table.intern(sample(10))
+    assert first is second
+    assert first == sample(0)
+
+
+def test_repeated_subterms_are_stored_once():
+    table = HashConsTable()
+    x = var("x")
+    term = table.intern(
+        Application(Application(var("f"), x, None), var("x", 5), None)
+    )
+    assert term.right is term.left.right
+    assert len(table) == 4
+
+
+def test_different_terms_stay_different():
+    table = HashConsTable()
+    terms = [
+        var("x"),
+        var("y"),
+        IntValue(1, None),
+        Universe(1, None),
+        Abstraction([var("x")], var("x"), None),
+        Abstraction([var("y")], var("x"), None),
+        Forall([(var("x"), var("y"))], var("x"), None),
+        Forall([(var("y"), var("y"))], var("x"), None),
+        Let(False, {"x": var("y")}, var("x"), None),
+        Let(False, {"y": var("y")}, var("x"), None),
+        Let(True, {"x": var("y")}, var("x"), None),
+    ]
+    interned = [table.intern(term) for term in terms]
+    assert len({id(term) for term in interned}) == len(terms)
+
+
+def test_unused_terms_are_dropped():
+    table = HashConsTable()
+    term = table.intern(Application(var("f"), var("x"), None))
+    assert len(table) == 3
+    del term
+    gc.collect()
+    assert len(table) == 0
+
+
+def test_deep_terms():
+    table = HashConsTable()
+    term: Term[None] = var("f")
+    for _ in range(100_000):
+        term = Application(term, var("x"), None)
+    interned = table.intern(term)
+    assert len(table) == 100_002
+    assert table.intern(interned) is interned
@@ -0,0 +1,92 @@
+import io
+from pathlib import Path
+
+import pytest
+
+from Degumin.Common.File import FileInfo, Span
+from Degumin.Core.Core import (
+    Application,
+    Case,
+    FreeVariable,
+    Let,
+    MatchConstructor,
+    VariableDefinition,
+)
+from Degumin.Core.Transformation import (
+    ToCore,
+    UnsupportedSyntax,
+    parse_to_core,
+    to_core,
+)
+from Degumin.Parser.Lexer import WordStart, iter_segments
+from Degumin.Parser.Parser import (
+    LarkParseError,
+    load_grammar,
+    parse_segment,
+)
+
+info = FileInfo("test", Path("test"))
+
+text = """module A where
+
+f x =
+  let
+    y : T = \\ z -> z;
+    g w = (w . T);
+  in case g (f x) y of
+    Z -> forall (n:Nat) . Type;
+    S k -> forall u . u 1;
+    _ -> ?q;
+  ;
+
+h = {- ;
+
+i : forall {X : Type} . X;
+"""
+
+
+@pytest.fixture(scope="module")
+def segments() -> list[WordStart]:
+    return [
+        item
+        for item in iter_segments(io.StringIO(text))
+        if isinstance(item, WordStart)
+    ]
+
+
+def test_to_core_terms(segments):
+    lark = load_grammar(use_cache=False)
+    tree = parse_segment(lark, info, segments[1])
+    definition = to_core(tree, info, 3)
+    assert isinstance(definition, VariableDefinition)
+    let = definition.definition.term  # type:ignore
+    assert isinstance(let, Let)
+    assert list(let.definitions) == ["y", "g"]
+    case = let.term
+    assert isinstance(case, Case)
+    # g (f x) y
+    assert isinstance(case.expression, Application)
+    assert case.expression.right == FreeVariable(
+        "y", Span(3, text.index("y of"), text.index("y of") + 1)
+    )
+    assert len(case.alternatives) == 3
+    assert isinstance(case.alternatives[1].case, MatchConstructor)
+    start = text.index("case")
+    assert case.info == Span(3, start, text.index("?q;") + 3)
+
+
+def test_parse_to_core_same_as_to_core(segments):
+    tree_parser = load_grammar(use_cache=False)
+    inline_parser = load_grammar(use_cache=False, transformer=ToCore())
+    for segment in segments:
+        tree = parse_segment(tree_parser, info, segment)
+        if isinstance(tree, LarkParseError):
+            expected = tree
+        else:
+            expected = to_core(tree, info, 2)
+        assert parse_to_core(inline_parser, info, segment, 2) == expected
+    implicit = parse_to_core(inline_parser, info, segments[-1])
+    assert isinstance(implicit, UnsupportedSyntax)
+    # The span of  X : Type, the segment starts at  i
+    start = text.index("X : Type")
+    assert implicit.span == Span(0, start, start + len("X : Type"))
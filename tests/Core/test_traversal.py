@@ -0,0 +1,123 @@
+from Degumin.Common.File import Span
+from Degumin.Core.Core import (
+    Abstraction,
+    Alternative,
+    Application,
+    Case,
+    Forall,
+    FreeVariable,
+    IntValue,
+    Let,
+    MatchVariable,
+    Term,
+    Universe,
+)
+from Degumin.Core.Traversal import (
+    CoreTransformer,
+    children,
+    fold,
+    iter_terms,
+)
+
+span = Span(0, 0, 0)
+
+
+def var(name: str) -> FreeVariable[Span]:
+    return FreeVariable(name, span)
+
+
+def sample() -> Term[Span]:
+    # let f = \x -> x in case f y of z -> forall (a : Type) . a
+    alternative = Alternative(
+        MatchVariable("z", span),
+        Forall([(var("a"), Universe(0, span))], var("a"), span),
+        span,
+    )
+    return Let(
+        False,
+        {"f": Abstraction([var("x")], var("x"), span)},
+        Case(Application(var("f"), var("y"), span), [alternative], span),
+        span,
+    )
+
+
+class Rename(CoreTransformer[Span]):
+    def post(self, term: Term[Span]) -> Term[Span]:
+        if isinstance(term, FreeVariable) and term.name == "y":
+            return var("w")
+        return term
+
+
+def test_iter_terms_is_preorder():
+    names = [type(t).__name__ for t in iter_terms(sample())]
+    assert names == [
+        "Let",
+        "Abstraction",
+        "FreeVariable",
+        "Case",
+        "Application",
+        "FreeVariable",
+        "FreeVariable",
+        "Forall",
+        "Universe",
+        "FreeVariable",
+    ]
+
+
+def test_fold_counts_nodes():
+    assert fold(sample(), lambda _, values: 1 + sum(values)) == 10
+
+
+def test_transform_shares_unchanged_nodes():
+    term = sample()
+    assert CoreTransformer[Span]().transform(term) is term
+    new = Rename().transform(term)
+    assert isinstance(new, Let) and isinstance(term, Let)
+    assert new is not term
+    # Only the path to y is rebuilt
+    assert new.definitions["f"] is term.definitions["f"]
+    assert isinstance(new.term, Case) and isinstance(term.term, Case)
+    assert new.term.alternatives[0] is term.term.alternatives[0]
+    assert children(new.term.expression)[1] == var("w")
+
+
+def test_pre_and_descend():
+    class Order(CoreTransformer[Span]):
+        def __init__(self):
+            self.events: list[str] = []
+
+        def pre(self, term):
+            self.events.append("pre " + type(term).__name__)
+            return term
+
+        def descend(self, term):
+            return not isinstance(term, Abstraction)
+
+        def post(self, term):
+            self.events.append("post " + type(term).__name__)
+            return term
+
+    order = Order()
+    order.transform(
+        Let(False, {"f": Abstraction([], var("x"), span)}, var("f"), span)
+    )
+    assert order.events == [
+        "pre Let",
+        "pre Abstraction",
+        "post Abstraction",
+        "pre FreeVariable",
+        "post FreeVariable",
+        "post Let",
+    ]
+
+
+def test_deep_terms():
+    depth = 100_000
+    term: Term[Span] = var("y")
+    for _ in range(depth):
+        term = Application(term, IntValue(1, span), span)
+    assert fold(term, lambda _, values: 1 + sum(values)) == 2 * depth + 1
+    new = Rename().transform(term)
+    while isinstance(new, Application):
+        new = new.left
+    assert new == var("w")
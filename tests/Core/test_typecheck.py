@@ -0,0 +1,323 @@
+import io
+from dataclasses import replace
+from pathlib import Path
+from typing import Any
+
+import pytest
+from lark import Lark
+
+from Degumin.Common.File import FileInfo
+from Degumin.Core.Core import (
+    Abstraction,
+    Alternative,
+    Annotation,
+    Application,
+    Case,
+    Forall,
+    FreeVariable,
+    Hole,
+    Let,
+    MatchConstructor,
+    MatchVariable,
+    Universe,
+    VariableDefinition,
+)
+from Degumin.Core.Evaluation import PiValue, UniverseValue
+from Degumin.Core.HashCons import HashConsTable
+from Degumin.Core.Transformation import ToCore, parse_to_core
+from Degumin.Core.TypeCheck import (
+    CannotInfer,
+    Checker,
+    NotAFunctionType,
+    Scope,
+    TypeCheckStopped,
+    TypeMismatch,
+    UnboundName,
+    check_module,
+)
+from Degumin.Parser.Lexer import WordStart, iter_segments
+from Degumin.Parser.Parser import load_grammar
+
+info = FileInfo("test", Path("test"))
+
+text = """data Nat : Type =
+  Z : Nat;
+  S : forall (n : Nat) . Nat;
+  ;
+
+two : Nat;
+two = S (S Z);
+
+id : forall (a : Type) (x : a) . a;
+id a x = x;
+
+four : Nat;
+four = id Nat (S (S two));
+
+pred : forall (m : Nat) . Nat;
+pred m =
+  case m of
+    Z -> Z;
+    S k -> k;
+  ;
+
+three = pred four;
+
+const : forall (a : Type) (b : Type) (x : a) (y : b) . a;
+const a b x y = x;
+"""
+
+
+@pytest.fixture(scope="module")
+def lark() -> Lark:
+    result = load_grammar(transformer=ToCore())
+    assert isinstance(result, Lark)
+    return result
+
+
+def statements(lark: Lark, source: str) -> list[object]:
+    return [
+        parse_to_core(lark, info, item)
+        for item in iter_segments(io.StringIO(source))
+        if isinstance(item, WordStart)
+    ]
+
+
+def var(name: str) -> FreeVariable[None]:
+    return FreeVariable(name, None)
+
+
+def test_module_checks(lark: Lark):
+    report = check_module(statements(lark, text))
+    assert [d.error for d in report.definitions] == [None] * 12
+    assert [d.name for d in report.definitions][:3] == ["Nat", "two", "two"]
+    assert all(d.seconds >= 0 for d in report.definitions)
+    assert report.misses == sum(d.misses for d in report.definitions)
+    assert (
+        report.slowest(2)
+        == sorted(report.definitions, key=lambda d: d.seconds, reverse=True)[:2]
+    )
+
+
+def test_errors(lark: Lark):
+    source = """data Nat : Type =
+  Z : Nat;
+  ;
+
+bad : Nat;
+bad = Type;
+
+unbound = missing Z;
+
+applied = Z Z;
+"""
+    errors = [
+        d.error for d in check_module(statements(lark, source)).definitions
+    ]
+    assert errors[:2] == [None, None]
+    assert isinstance(errors[2], TypeMismatch)
+    assert errors[2].expected == var("Nat")
+    assert errors[2].found == Universe(1, None)
+    assert isinstance(errors[3], UnboundName)
+    assert isinstance(errors[4], NotAFunctionType)
+
+
+def test_case_on_a_neutral_part(lark: Lark):
+    source = """data Nat : Type =
+  Z : Nat;
+  S : forall (n : Nat) . Nat;
+  ;
+
+data P : forall (n : Nat) . Type =
+  Mk : forall (n : Nat) . P n;
+  ;
+
+f : forall (n : Nat) . Nat;
+f n =
+  case S n of
+    S Z -> Z;
+    _ -> n;
+  ;
+
+g : forall (n : Nat) (p : P (f n)) . Nat;
+g n p = n;
+
+h : forall (n : Nat) (p : P (f n)) . Nat;
+h n p = g n p;
+
+k : forall (n : Nat) (m : Nat) (p : P (f n)) . Nat;
+k n m p = g m p;
+"""
+    errors = [
+        d.error for d in check_module(statements(lark, source)).definitions
+    ]
+    # The types of `p` are stuck on `n`
+    assert errors[:-1] == [None] * (len(errors) - 1)
+    assert isinstance(errors[-1], TypeMismatch)
+
+
+def test_infer_and_check():
+    checker = Checker()
+    checker.global_types["Nat"] = UniverseValue(0)
+    universe = Universe(0, None)
+    arrow = Forall([(var("_"), var("Nat"))], var("Nat"), None)
+    assert checker.infer(arrow, Scope()) == UniverseValue(0)
+    assert checker.infer(Universe(2, None), Scope()) == UniverseValue(3)
+    # Needs the type of the binder
+    identity = Abstraction([var("x")], var("x"), None)
+    with pytest.raises(TypeCheckStopped) as error:
+        checker.infer(identity, Scope())
+    assert isinstance(error.value.error, CannotInfer)
+    expected = checker.evaluate(arrow, Scope())
+    assert isinstance(expected, PiValue)
+    checker.check(identity, expected, Scope())
+    # Holes take the type they are checked against
+    checker.check(Hole("h", None), expected, Scope())
+    assert checker.holes == [(Hole("h", None), expected, 0)]
+    # forall (a : Type) . a
+    polymorphic = Forall([(var("a"), universe)], var("a"), None)
+    assert checker.infer(polymorphic, Scope()) == UniverseValue(1)
+
+
+def test_recursive_let():
+    # let rec down : forall (_ : Nat) . Nat =
+    #   \n -> case n of Z -> Z; S k -> down k
+    # in down (S Z)
+    checker = Checker(constructors=["S", "Z"])
+    nat = var("Nat")
+    arrow = Forall([(var("_"), nat)], nat, None)
+    checker.global_types["Nat"] = UniverseValue(0)
+    checker.global_types["Z"] = checker.evaluate(nat, Scope())
+    checker.global_types["S"] = checker.evaluate(arrow, Scope())
+
+    def down(value: Any) -> Let:
+        alternatives = [
+            Alternative(MatchVariable("Z", None), var("Z"), None),
+            Alternative(
+                MatchConstructor("S", [MatchVariable("k", None)], None),
+                value,
+                None,
+            ),
+        ]
+        function = Abstraction(
+            [var("n")], Case(var("n"), alternatives, None), None
+        )
+        return Let(
+            True,
+            {"down": Annotation(function, arrow, None)},
+            Application(
+                var("down"), Application(var("S"), var("Z"), None), None
+            ),
+            None,
+        )
+
+    found = checker.infer(
+        down(Application(var("down"), var("k"), None)), Scope()
+    )
+    assert found == checker.evaluate(nat, Scope())
+    with pytest.raises(TypeCheckStopped) as error:
+        checker.infer(down(Universe(0, None)), Scope())
+    assert isinstance(error.value.error, TypeMismatch)
+
+
+def test_conversion_unfolds_definitions():
+    # n = Nat, checking  \x -> x  against  forall (_ : n) . Nat
+    checker = Checker(definitions={"n": var("Nat")})
+    checker.global_types["Nat"] = UniverseValue(0)
+    checker.global_types["n"] = UniverseValue(0)
+    _type = Forall([(var("_"), var("n"))], var("Nat"), None)
+    checker.check(
+        Abstraction([var("x")], var("x"), None),
+        checker.evaluate(_type, Scope()),
+        Scope(),
+    )
+    assert checker.evaluator.steps > 0
+
+
+def test_shared_terms_are_checked_once(lark: Lark):
+    arguments = " ".join(f"(a{i} : Nat)" for i in range(10))
+    source = "data Nat : Type =\n  Z : Nat;\n  ;\n\n" + "".join(
+        f"g{n} : forall {arguments} . Nat;\n" for n in range(20)
+    )
+    plain = statements(lark, source)
+    table: HashConsTable = HashConsTable()
+    interned = [
+        replace(s, declaration=table.intern(s.declaration))  # type:ignore
+        if hasattr(s, "declaration")
+        else s
+        for s in plain
+    ]
+    assert check_module(plain, memoize=True).hits == 0
+    report = check_module(interned, memoize=True)
+    assert report.hits == 19
+    assert all(d.error is None for d in report.definitions)
+    assert check_module(interned).hits == 0
+
+
+def test_shared_subterms_hit_without_hash_consing(lark: Lark):
+    # A subterm used by two definitions, like Core built by a pass
+    data = statements(
+        lark,
+        "data Nat : Type =\n  Z : Nat;\n  S : forall (n : Nat) . Nat;\n  ;\n",
+    )
+    shared = Application(var("S"), Application(var("S"), var("Z"), None), None)
+    module = [
+        *data,
+        VariableDefinition("a", shared, None),
+        VariableDefinition("b", Application(var("S"), shared, None), None),
+    ]
+    report = check_module(module, memoize=True)
+    assert all(d.error is None for d in report.definitions)
+    assert report.hits > 0
+    # Globals are keyed by their names, not by the string objects
+    key, _ = Checker().fingerprint(shared, Scope())
+    assert key[1:] == ("S", "Z")
+
+
+def test_memo_depends_on_context():
+    # f x  with  f : forall (_ : Nat) . Nat  and  x  bound to a Nat or a Type
+    checker = Checker(memoize=True)
+    checker.global_types["Nat"] = UniverseValue(0)
+    nat = checker.evaluate(var("Nat"), Scope())
+    arrow = Forall([(var("_"), var("Nat"))], var("Nat"), None)
+    scope = Scope().bind("f", checker.evaluate(arrow, Scope()))
+    term = Application(var("f"), var("x"), None)
+    natural = scope.bind("x", nat)
+    found = checker.infer(term, natural)
+    assert found == nat
+    with pytest.raises(TypeCheckStopped) as error:
+        checker.infer(term, scope.bind("x", UniverseValue(0)))
+    assert isinstance(error.value.error, TypeMismatch)
+    assert checker.hits == 0
+    assert checker.infer(term, natural) is found
+    assert checker.hits == 1
+
+
+def test_holes_are_their_place_in_the_source(lark: Lark):
+    source = """data Nat : Type =
+  Z : Nat;
+  ;
+
+data Bool : Type =
+  T : Bool;
+  ;
+
+a : forall (x : ?h) . Nat;
+b : forall (y : ?h) . Bool;
+
+ra = a Z;
+rb = b T;
+"""
+    plain = statements(lark, source)
+    table: HashConsTable = HashConsTable()
+    interned = [
+        replace(s, declaration=table.intern(s.declaration))  # type:ignore
+        if hasattr(s, "declaration")
+        else s
+        for s in plain
+    ]
+    # The two holes are two metavariables, interned or not
+    for module in [plain, interned]:
+        report = check_module(module)
+        assert [d.error for d in report.definitions] == [None] * 6
+        assert len(report.holes) == 2
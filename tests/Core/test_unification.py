@@ -0,0 +1,189 @@
+import io
+from pathlib import Path
+
+from Degumin.Common.File import FileInfo
+from Degumin.Core.Core import FreeVariable, MetaVariable, Universe
+from Degumin.Core.Evaluation import (
+    ConstructorValue,
+    Evaluator,
+    UniverseValue,
+    Value,
+    bound,
+)
+from Degumin.Core.Transformation import ToCore, parse_to_core
+from Degumin.Core.TypeCheck import (
+    TypeMismatch,
+    UnsolvedConstraint,
+    UnsolvedMeta,
+    check_module,
+)
+from Degumin.Core.Unification import MetaStore, Unifier
+from Degumin.Parser.Lexer import WordStart, iter_segments
+from Degumin.Parser.Parser import load_grammar
+
+universe = UniverseValue(0)
+
+
+def unifier() -> Unifier:
+    return Unifier(Evaluator(constructors=["S", "Z"], metas=MetaStore()))
+
+
+def meta(unifier: Unifier, *arguments: Value) -> Value:
+    number = unifier.metas.fresh(universe, len(arguments))
+    value = unifier.evaluator.meta(number)
+    for argument in arguments:
+        value = unifier.evaluator.apply(value, argument)
+    return value
+
+
+def successor(value: Value) -> Value:
+    return ConstructorValue("S", (value,))
+
+
+zero = ConstructorValue("Z", ())
+
+
+def test_find_compresses_paths():
+    metas = MetaStore()
+    for _ in range(1000):
+        metas.fresh(universe, 0)
+    for number in range(999):
+        metas.merge(number, number + 1)
+    assert metas.find(0) == 999
+    assert set(metas.parents) == {999}
+    assert metas.unsolved() == [999]
+
+
+def test_pattern_solution():
+    # ?m x y = S y, so ?m Z (S Z) is S (S Z)
+    u = unifier()
+    x, y = bound(0, "x"), bound(1, "y")
+    assert u.unify(meta(u, x, y), successor(y), 2)
+    assert u.solved == 1
+    evaluator = u.evaluator
+    applied = evaluator.apply(
+        evaluator.apply(evaluator.meta(0), zero), successor(zero)
+    )
+    assert evaluator.force(applied) == successor(successor(zero))
+    assert evaluator.quote(evaluator.meta(0)).term.term == (  # type:ignore
+        evaluator.quote(successor(bound(1, None)), 2)
+    )
+
+
+def test_occurs_check_and_scope():
+    u = unifier()
+    m = meta(u)
+    assert not u.unify(m, successor(m), 0)
+    # ?n x = y, y isn't a variable of ?n
+    x, y = bound(0, "x"), bound(1, "y")
+    assert not u.unify(meta(u, x), y, 2)
+    assert u.metas.unsolved() == [0, 1]
+
+
+def test_merged_metas_share_solutions():
+    u = unifier()
+    x = bound(0, "x")
+    a, b = meta(u, x), meta(u, x)
+    assert u.unify(a, b, 1)
+    assert u.merged == 1 and u.solved == 0
+    assert u.unify(b, successor(x), 1)
+    assert u.evaluator.force(a) == successor(x)
+    assert u.metas.unsolved() == []
+
+
+def test_blocked_constraints_are_woken():
+    u = unifier()
+    x = bound(0, "x")
+    # ?m Z = Z  isn't a pattern, it waits on ?m
+    m = meta(u, zero)
+    assert u.unify(m, zero, 0)
+    assert u.postponed == 1 and len(u.metas.blocked()) == 1
+    # Solving  ?m x = x  wakes it, Z = Z
+    same = u.evaluator.apply(u.evaluator.meta(0), x)
+    assert u.unify(same, x, 1)
+    assert u.metas.blocked() == []
+    # With  ?n x = S x  the woken  S Z = Z  fails
+    n = meta(u, zero)
+    assert u.unify(n, zero, 0)
+    other = u.evaluator.apply(u.evaluator.meta(1), x)
+    assert not u.unify(other, successor(x), 1)
+
+
+def test_read_back_of_unsolved_metas():
+    u = unifier()
+    m = meta(u, bound(0, "x"))
+    evaluator = u.evaluator
+    read = evaluator.read_metas
+    term = evaluator.quote(m, 1)
+    assert evaluator.read_metas == read + 1
+    assert term.left == MetaVariable(0, None)  # type:ignore
+    assert evaluator.evaluate(Universe(0, None)) == universe
+
+
+text = """data Nat : Type =
+  Z : Nat;
+  S : forall (n : Nat) . Nat;
+  ;
+
+id : forall (a : Type) (x : a) . a;
+id a x = x;
+
+two : Nat;
+two = id ?t (S (id ?u (S Z)));
+
+apply : forall (f : forall (n : ?) . Nat) (n : Nat) . Nat;
+apply f n = f n;
+
+wrong : Nat;
+wrong = id ?v Type;
+"""
+
+
+def test_holes_in_modules():
+    lark = load_grammar(transformer=ToCore())
+    info = FileInfo("test", Path("test"))
+    statements = [
+        parse_to_core(lark, info, item)  # type:ignore
+        for item in iter_segments(io.StringIO(text))
+        if isinstance(item, WordStart)
+    ]
+    report = check_module(statements)
+    errors = [d.error for d in report.definitions]
+    assert errors[:-1] == [None] * 8
+    assert isinstance(errors[-1], TypeMismatch)
+    # ?t, ?u, the hole of  apply  and ?v are solved
+    assert len(report.holes) == 4
+    assert report.metas.unsolved() == []
+
+
+def test_unsolved_metas_are_reported():
+    source = """data Nat : Type =
+  Z : Nat;
+  ;
+
+id : forall (a : Type) (x : a) . a;
+id a x = x;
+
+stuck : Nat;
+stuck =
+  let y = Z;
+  in id ?t y;
+
+loose : forall (x : ?u) . Nat;
+"""
+    lark = load_grammar(transformer=ToCore())
+    info = FileInfo("test", Path("test"))
+    statements = [
+        parse_to_core(lark, info, item)  # type:ignore
+        for item in iter_segments(io.StringIO(source))
+        if isinstance(item, WordStart)
+    ]
+    report = check_module(statements)
+    errors = [d.error for d in report.definitions]
+    assert errors[:4] == [None] * 4
+    # ?t is applied to the value of  y, Z, it isn't a pattern
+    assert isinstance(errors[4], UnsolvedConstraint)
+    assert errors[4].left == FreeVariable("Nat", None)
+    assert errors[4].right.left == MetaVariable(0, None)  # type:ignore
+    assert isinstance(errors[5], UnsolvedMeta)
+    assert errors[5].hole.name == "?u"  # type:ignore
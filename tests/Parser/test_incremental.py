@@ -0,0 +1,94 @@
+import random
+from pathlib import Path
+
+import pytest
+from lark import Token, Tree
+
+from Degumin.Common.File import FileInfo
+from Degumin.Parser.Incremental import IncrementalParser
+from Degumin.Parser.Parser import load_grammar, parse_string
+
+info = FileInfo("test", Path("test"))
+
+
+@pytest.fixture(scope="module")
+def lark():
+    return load_grammar(use_cache=False)
+
+
+def with_positions(results: list) -> list:
+    """
+    Lark tokens compare equal if their text is equal, we also want
+    their positions.
+    """
+    out = []
+    for result in results:
+        if isinstance(result, Tree):
+            tokens = [
+                (t.type, str(t), t.line, t.end_line, t.start_pos, t.end_pos)
+                for t in result.scan_values(lambda v: isinstance(v, Token))
+            ]
+            out.append((result, tokens))
+        else:
+            out.append(result)
+    return out
+
+
+def check(parser: IncrementalParser, lark) -> None:
+    expected = parse_string(lark, info, parser.text)
+    assert with_positions(parser.results()) == with_positions(expected)
+    assert parser.errors() == [r for r in expected if not isinstance(r, Tree)]
+
+
+def test_edit_reparses_changed_segment(lark):
+    text = "module A where\n\nf : Type;\n\ng = 1;\n\nh = 2;\n"
+    parser = IncrementalParser(lark, info, text)
+    assert parser.reparsed == 4
+    position = text.index("1")
+    parser.edit(position, position + 1, "10\n\n")
+    assert parser.reparsed == 1
+    check(parser, lark)
+    position = text.index("f :")
+    parser.edit(position, position, "k = 3;\n\n")
+    assert parser.reparsed == 1
+    check(parser, lark)
+
+
+def test_edit_block_comments(lark):
+    text = "module A where\n\n{- open\n\nf : Type;\n\ng = 1;\n"
+    parser = IncrementalParser(lark, info, text)
+    assert len(parser.errors()) == 1
+    position = text.index("\n\nf :")
+    # Closing the comment hides f
+    parser.edit(position, position, "\n-}")
+    check(parser, lark)
+    parser.edit(position, position + 3, "")
+    check(parser, lark)
+    # Unindenting a line starts a new segment
+    parser.edit(0, 0, "x = 1\n")
+    check(parser, lark)
+
+
+def test_random_edits(lark):
+    pieces = [
+        "module M where\n",
+        "f : Type;\n",
+        "g = 1;\n",
+        "\n",
+        "  x",
+        "-- c\n",
+        "{--\n",
+        "\n--}",
+        "(",
+        " ",
+        "h",
+    ]
+    rng = random.Random(0)
+    for _ in range(20):
+        text = "".join(rng.choice(pieces) for _ in range(20))
+        parser = IncrementalParser(lark, info, text)
+        for _ in range(20):
+            start = rng.randint(0, len(parser.text))
+            end = rng.randint(start, min(len(parser.text), start + 6))
+            parser.edit(start, end, rng.choice(pieces))
+            check(parser, lark)
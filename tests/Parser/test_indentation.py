@@ -0,0 +1,108 @@
+import pytest
+from lark import Lark
+
+from Degumin.Parser.Indentation import Layout, MissIndented
+from Degumin.Parser.Parser import default_parser_options, read_grammar
+
+
+@pytest.fixture(scope="module")
+def lark():
+    """
+    Without the postlexer, the tests run the layout pass themselves.
+    """
+    options = default_parser_options()
+    options["postlex"] = None
+    return Lark(read_grammar(), **options)
+
+
+def layout(lark, text: str) -> tuple[list[str], Layout]:
+    """
+    The tokens after the layout pass, virtual ones by their type and
+    the others by their text.
+    """
+    pass_ = Layout()
+    out = [
+        token.type if token.type.startswith("LAYOUT") else str(token)
+        for token in pass_.process(lark.lex(text))
+    ]
+    return (out, pass_)
+
+
+def test_let_block(lark):
+    text = "f = let x = 1\n        y = 2\n    in x"
+    tokens, pass_ = layout(lark, text)
+    assert pass_.errors == []
+    # fmt: off
+    assert tokens == [
+        "f", "=", "let", "LAYOUT_OPEN", "x", "=", "1",
+        "LAYOUT_SEPARATOR", "y", "=", "2", "LAYOUT_CLOSE", "in", "x",
+    ]
+    # fmt: on
+
+
+def test_in_on_the_same_line(lark):
+    tokens, _ = layout(lark, "f = let x = 1 in x")
+    # fmt: off
+    assert tokens == [
+        "f", "=", "let", "LAYOUT_OPEN", "x", "=", "1", "LAYOUT_CLOSE",
+        "in", "x",
+    ]
+    # fmt: on
+
+
+def test_nested_case(lark):
+    text = "f x = case x of\n  A -> case y of\n    B -> 1\n  C -> 2"
+    tokens, pass_ = layout(lark, text)
+    assert pass_.errors == []
+    # fmt: off
+    assert tokens == [
+        "f", "x", "=", "case", "x", "of", "LAYOUT_OPEN",
+        "A", "->", "case", "y", "of", "LAYOUT_OPEN", "B", "->", "1",
+        "LAYOUT_CLOSE", "LAYOUT_SEPARATOR", "C", "->", "2", "LAYOUT_CLOSE",
+    ]
+    # fmt: on
+
+
+def test_parenthesis_close_blocks(lark):
+    text = "f = (case x of\n  A -> 1) y"
+    tokens, _ = layout(lark, text)
+    # fmt: off
+    assert tokens == [
+        "f", "=", "(", "case", "x", "of", "LAYOUT_OPEN", "A", "->", "1",
+        "LAYOUT_CLOSE", ")", "y",
+    ]
+    # fmt: on
+
+
+def test_empty_block_at_the_end(lark):
+    tokens, _ = layout(lark, "f = case x of")
+    assert tokens == [
+        "f",
+        "=",
+        "case",
+        "x",
+        "of",
+        "LAYOUT_OPEN",
+        "LAYOUT_CLOSE",
+    ]
+
+
+def test_miss_indented(lark):
+    text = "f = case x of\nA -> 1"
+    tokens, pass_ = layout(lark, text)
+    assert len(pass_.errors) == 1
+    error = pass_.errors[0]
+    assert isinstance(error, MissIndented)
+    assert str(error.token) == "A"
+    assert error.expected_indentation_level == 2
+    assert str(error.maybe_previous_indentation_token) == "of"
+    assert tokens.count("LAYOUT_OPEN") == tokens.count("LAYOUT_CLOSE")
+
+
+def test_deep_nesting(lark):
+    depth = 5000
+    text = "f = " + "let x = " * depth + "1" + " in x" * depth
+    tokens, pass_ = layout(lark, text)
+    assert pass_.errors == []
+    assert tokens.count("LAYOUT_OPEN") == depth
+    assert tokens.count("LAYOUT_CLOSE") == depth
@@ -1,17 +1,23 @@
+import io
 import re
 
 import pytest
 
 from Degumin.Parser.Lexer import (
     Chunk_Type,
+    CodeChunk,
     CodeChunkVisitor,
     LineBreak,
     LineComment,
+    MissedBlockCommentClose,
     MultiLineComment,
     NonLineBreakString,
+    UnexpectedCharacterAtIndentationZero,
     WordStart,
+    iter_segments,
     split_by_indentation,
 )
+from Degumin.Common.File import Range
 
 
 def pretty_NonLineBreakString(line: NonLineBreakString) -> str:
@@ -69,6 +75,60 @@ def test_single_line_comment_at_start(text):
     assert errors == []
 
 
+def test_chunk_ranges():
+    result, errors = split_by_indentation("-- a\nfoo")
+    assert result == [
+        LineComment(NonLineBreakString(" a"), _range=Range(0, 0, 0, 4, 0, 4)),
+        LineBreak(_range=Range(1, 1, 0, 0, 8, 8)),
+        WordStart("foo", _range=Range(1, 1, 0, 3, 5, 8)),
+    ]
+    assert errors == []
+
+
+@pytest.mark.parametrize(
+    "text,expected_chunk,expected_error",
+    [
+        (
+            "  x\ny = 1",
+            WordStart("y = 1", _range=Range(1, 1, 0, 5, 4, 9)),
+            UnexpectedCharacterAtIndentationZero(" ", 0),
+        ),
+        (
+            "-- a\n  x\ny = 1",
+            WordStart("y = 1", _range=Range(2, 2, 0, 5, 9, 14)),
+            UnexpectedCharacterAtIndentationZero("x", 1),
+        ),
+    ],
+)
+def test_recover_at_next_control_point(
+    text: str,
+    expected_chunk: WordStart,
+    expected_error: UnexpectedCharacterAtIndentationZero,
+):
+    result, errors = split_by_indentation(text)
+    assert result[-1] == expected_chunk
+    assert errors == [expected_error]
+
+
+@pytest.mark.parametrize("block_size", [1, 2, 3, 7, 64])
+@pytest.mark.parametrize(
+    "text",
+    [
+        "",
+        "module a where\n\n-- comment\nf x =\n  x\n\n{--\n doc\n--}\ng = 1\n",
+        "  x\ny = 1\n  z\n-- c",
+        "{-\n{--\n{-\nfoo\n-}\n  \n(\nbar",
+        "a\n-",
+    ],
+)
+def test_iter_segments_same_as_split(text: str, block_size: int):
+    expected = split_by_indentation(text)
+    items = list(iter_segments(io.StringIO(text), block_size))
+    chunks = [i for i in items if isinstance(i, CodeChunk)]
+    errors = [i for i in items if not isinstance(i, CodeChunk)]
+    assert (chunks, errors) == expected
+
+
 #
 #
 # @pytest.mark.parametrize(
@@ -188,38 +248,52 @@ def test_single_line_comment_at_start(text):
 #    print(result)
 #    assert result[expected_index] == expected
 #    assert errors == []
-#
-#
-# @pytest.mark.parametrize(
-#    "text,expected",
-#    [
-#        ("some worlds", WordStart("some worlds", line_start=0, line_end=0)),
-#        (
-#            "some\n\n worlds",
-#            WordStart("some\n\n worlds", line_start=0, line_end=2),
-#        ),
-#        ("some worlds\n(", WordStart("some worlds", line_start=0, line_end=0)),
-#        (
-#            "some worlds\n{- -}",
-#            WordStart("some worlds", line_start=0, line_end=0),
-#        ),
-#        ("some worlds\nas", WordStart("some worlds", line_start=0, line_end=0)),
-#        ("some worlds\n--", WordStart("some worlds", line_start=0, line_end=0)),
-#        (
-#            "some worlds\n{",
-#            WordStart("some worlds\n{", line_start=0, line_end=1),
-#        ),
-#        (
-#            "some worlds\n-",
-#            WordStart("some worlds\n-", line_start=0, line_end=1),
-#        ),
-#    ],
-# )
-# def test_world_start(text: str, expected: WordStart):
-#    result, errors = split_by_indentation(text)
-#    print(result)
-#    assert result[0] == expected
-#    assert errors == []
+
+
+@pytest.mark.parametrize(
+    "text,expected",
+    [
+        ("some worlds", "some worlds"),
+        ("some\n\n worlds", "some\n\n worlds"),
+        ("some worlds\n(", "some worlds"),
+        ("some worlds\n{- -}", "some worlds"),
+        ("some worlds\nas", "some worlds"),
+        ("some worlds\n--", "some worlds"),
+        ("some worlds\n{", "some worlds\n{"),
+        ("some worlds\n-", "some worlds\n-"),
+        ("some worlds\n", "some worlds"),
+    ],
+)
+def test_world_start(text: str, expected: str):
+    result, errors = split_by_indentation(text)
+    assert isinstance(result[0], WordStart)
+    assert result[0].chunk == expected
+
+
+@pytest.mark.parametrize(
+    "text,expected_comments",
+    [
+        ("{-a\n-}\nfoo\n{-b\n-}", 2),
+        ("{---a\n-}\n---}", 1),
+        ("{-\n{-\n-}", 1),
+    ],
+)
+def test_multi_line_comment_ends_at_first_closer(
+    text: str, expected_comments: int
+):
+    result, errors = split_by_indentation(text)
+    comments = [c for c in result if isinstance(c, MultiLineComment)]
+    assert len(comments) == expected_comments
+    assert errors == []
+
+
+def test_unclosed_multi_line_comments():
+    text = "{-\n" * 1000 + "{--\n--}"
+    result, errors = split_by_indentation(text)
+    assert len(errors) == 1000
+    assert all(isinstance(e, MissedBlockCommentClose) for e in errors)
+
+
 #
 #
 # @pytest.mark.skip
@@ -0,0 +1,231 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+from lark import Lark, Token, Tree
+
+from Degumin.Common.File import FileInfo, Range
+from Degumin.Common.Source import MappedSource
+from Degumin.Parser.Lexer import WordStart, iter_segments
+from Degumin.Parser.Parser import (
+    LarkParseError,
+    LayoutParseError,
+    SegmentationError,
+    SegmentCache,
+    load_grammar,
+    load_standalone_parser,
+    parser_cache_key,
+    parse_file,
+    parse_string,
+)
+from Degumin.Parser.Standalone import generate_standalone_parser
+
+info = FileInfo("test", Path("test"))
+
+
+@pytest.fixture(scope="module")
+def lark():
+    return load_grammar(use_cache=False)
+
+
+def first_token(tree: Tree) -> Token:
+    return next(tree.scan_values(lambda v: isinstance(v, Token)))
+
+
+def test_parse_string_absolute_positions(lark):
+    text = "module A where\n\n-- comment\nf : Type;\n\ng = 1;\n"
+    results = parse_string(lark, info, text)
+    assert len(results) == 3
+    g = first_token(results[2])
+    assert g == "g"
+    assert g.line == 6
+    assert g.start_pos == text.index("g =")
+
+
+def test_parse_string_errors(lark):
+    text = "module A where\n\nf = ;\n(\n"
+    results = parse_string(lark, info, text)
+    assert results[1] == LarkParseError(info, 3, 5, 20, "f = ;\n    ^\n")
+    assert isinstance(results[2], SegmentationError)
+
+
+def test_parse_layout_blocks(lark):
+    text = (
+        "module A where\n\n"
+        "f x =\n  case x of\n    Z -> let y = 1;\n             z = 2;\n"
+        "         in y;\n    S k -> k;\n  ;\n"
+    )
+    results = parse_string(lark, info, text)
+    assert all(isinstance(result, Tree) for result in results)
+    types = [token.type for token in results[1].scan_values(lambda v: True)]
+    assert types.count("LAYOUT_OPEN") == 2
+    assert types.count("LAYOUT_SEPARATOR") == 2
+    assert types.count("LAYOUT_CLOSE") == 2
+
+
+@pytest.mark.parametrize(
+    "definition",
+    [
+        # A nested case closed by the indentation, last or not
+        "f m n =\n  case m of\n    Z -> n;\n    S k ->\n      case n of\n"
+        "        Z -> k;\n        S j -> j;\n  ;\n",
+        "f m n =\n  case m of\n    S k ->\n      case n of\n"
+        "        Z -> k;\n        S j -> j;\n    Z -> n;\n  ;\n",
+        # Or by a semicolon
+        "f m n =\n  case m of\n    Z -> n;\n    S k ->\n      case n of\n"
+        "        Z -> k;\n        S j -> j;;\n  ;\n",
+        # A case in a let
+        "f m =\n  let y =\n        case m of\n          Z -> m;\n"
+        "          S k -> k;\n  in y;\n",
+        # A let in a case
+        "f m =\n  case m of\n    Z -> m;\n    S k ->\n      let y = k;\n"
+        "      in y;\n  ;\n",
+    ],
+)
+def test_parse_nested_blocks(lark, definition: str):
+    results = parse_string(lark, info, "module A where\n\n" + definition)
+    assert all(isinstance(result, Tree) for result in results)
+    blocks = list(results[1].find_pred(lambda t: t.data in ("case", "let")))
+    assert len(blocks) == 2
+
+
+def test_parse_miss_indented(lark):
+    text = (
+        "module A where\n\n"
+        "f x =\n  case x of\n    Z -> case y of\n    A -> 1;\n  ;\n"
+    )
+    results = parse_string(lark, info, text)
+    # The inner block must start to the right of the outer one
+    position = text.index("A ->")
+    assert results[1] == LayoutParseError(info, 6, 5, position, 6)
+
+
+def test_parse_file(lark, tmp_path: Path):
+    text = "module A where\n\n-- λ\nf : Type;\n"
+    path = tmp_path / "A.dgm"
+    path.write_text(text)
+    result = parse_file(path, lark, False)
+    assert isinstance(result, tuple)
+    _, trees = result
+    f = first_token(trees[1])
+    assert f.start_pos == text.index("f :")
+
+
+def test_mapped_source_views(tmp_path: Path):
+    text = "-- λx → y\nf = 1;\n{-\n ∀\n-}\ng = 2;\n"
+    path = tmp_path / "A.dgm"
+    path.write_text(text)
+    with MappedSource(path) as source:
+        chunks = [c for c in iter_segments(source, 3) if hasattr(c, "_range")]
+        for chunk in chunks:
+            r: Range = chunk._range
+            expected = text[r.position_start : r.position_end]
+            assert source.text_of(r) == expected
+            with source.view(r) as view:
+                assert bytes(view) == expected.encode("utf-8")
+        assert [c.chunk for c in chunks if isinstance(c, WordStart)] == [
+            "f = 1;",
+            "g = 2;",
+        ]
+
+
+def test_parser_cache(tmp_path: Path):
+    cold = load_grammar(
+        cache_directory=tmp_path, use_cache=True, use_standalone=False
+    )
+    cached = list(tmp_path.glob("parser-*.pickle"))
+    assert len(cached) == 1
+    warm = load_grammar(
+        cache_directory=tmp_path, use_cache=True, use_standalone=False
+    )
+    text = "module A where\n\nf : Type;\n"
+    assert parse_string(warm, info, text) == parse_string(cold, info, text)
+    # A broken cache entry is rebuilt
+    cached[0].write_bytes(b"garbage")
+    rebuilt = load_grammar(
+        cache_directory=tmp_path, use_cache=True, use_standalone=False
+    )
+    assert parse_string(rebuilt, info, text) == parse_string(cold, info, text)
+
+
+def test_parser_cache_disabled(tmp_path: Path):
+    load_grammar(cache_directory=tmp_path, use_cache=False)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_parser_cache_key():
+    options = {"start": ["module"]}
+    key = parser_cache_key("a : B", options)
+    assert key == parser_cache_key("a : B", {"start": ["module"]})
+    assert key != parser_cache_key("a : C", options)
+    assert key != parser_cache_key("a : B", {"start": ["segment"]})
+
+
+def test_standalone_parser(tmp_path: Path):
+    path = generate_standalone_parser(tmp_path / "GeneratedParser.py")
+    assert isinstance(path, Path)
+    spec = importlib.util.spec_from_file_location("GeneratedParser", path)
+    assert spec is not None and spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    standalone = Lark.load({"data": module.DATA, "memo": module.MEMO})
+    built = load_grammar(use_cache=False, use_standalone=False)
+    text = "module A where\n\nf : Type;\n"
+    assert parse_string(standalone, info, text) == parse_string(
+        built, info, text
+    )
+
+
+def test_standalone_parser_other_grammar():
+    assert load_standalone_parser("not the key of the grammar") is None
+
+
+def tokens_with_positions(results: list) -> list:
+    return [
+        [
+            (str(t), t.line, t.end_line, t.start_pos, t.end_pos)
+            for t in result.scan_values(lambda v: isinstance(v, Token))
+        ]
+        if isinstance(result, Tree)
+        else result
+        for result in results
+    ]
+
+
+def test_segment_cache(lark):
+    cache = SegmentCache("test")
+    text = "module A where\n\nf : Type;\n\ng = ;\n\nf : Type;\n\nh = 1;\n"
+    expected = parse_string(lark, info, text)
+    results = parse_string(lark, info, text, cache)
+    assert tokens_with_positions(results) == tokens_with_positions(expected)
+    assert (cache.hits, cache.misses) == (1, 4)
+    # The boilerplate moved and the error is now in another file
+    text = "module B where\n\n\n\nf : Type;\n\ng = ;\n\nh = 2;\n"
+    other = FileInfo("other", Path("other"))
+    expected = parse_string(lark, other, text)
+    results = parse_string(lark, other, text, cache)
+    assert tokens_with_positions(results) == tokens_with_positions(expected)
+    assert (cache.hits, cache.misses) == (3, 6)
+
+
+def test_segment_cache_capacity(lark):
+    cache = SegmentCache("test", capacity=1)
+    text = "f : Type;\n\ng : Type;\n\nf : Type;\n\nf : Type;\n\nh = 1;"
+    parse_string(lark, info, text, cache)
+    assert (cache.hits, cache.misses) == (1, 4)
+
+
+def test_segment_cache_on_disk(lark, tmp_path: Path):
+    text = "module A where\n\nf : Type;\n"
+    first = SegmentCache("test", directory=tmp_path)
+    parse_string(lark, info, text, first)
+    assert len(list(tmp_path.glob("*/*.pickle"))) == 2
+    second = SegmentCache("test", directory=tmp_path)
+    results = parse_string(lark, info, text, second)
+    assert (second.disk_hits, second.misses) == (2, 0)
+    expected = parse_string(lark, info, text)
+    assert tokens_with_positions(results) == tokens_with_positions(expected)
+    # Another grammar doesn't see them
+    other = SegmentCache("other grammar", directory=tmp_path)
+    parse_string(lark, info, text, other)
+    assert (other.disk_hits, other.misses) == (0, 2)
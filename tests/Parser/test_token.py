@@ -0,0 +1,43 @@
+from pathlib import Path
+
+import pytest
+
+from Degumin.Common.File import FileInfo, token2Range
+from Degumin.Parser.Parser import LarkParseError, lex_string, load_grammar
+from Degumin.Parser.Token import Token, TokenStream
+
+info = FileInfo("test", Path("test"))
+
+
+@pytest.fixture(scope="module")
+def lark():
+    return load_grammar(use_cache=False)
+
+
+def test_token_stream_same_as_lark(lark):
+    text = "module A where\n\n-- λ\nf : Type;\n\ng x =\n  x;\n"
+    stream, errors = lex_string(lark, info, text)
+    assert errors == []
+    expected = [Token(t.type, t.value, token2Range(t)) for t in lark.lex(text)]
+    assert list(stream) == expected
+    assert stream[-1] == expected[-1]
+    assert len(stream.type_names) < len(stream)
+
+
+def test_token_stream_values_come_from_text():
+    stream = TokenStream("a\n bc")
+    stream.append("IDENTIFIER", 0, 1)
+    stream.append("IDENTIFIER", 3, 5)
+    assert stream.type_of(1) == "IDENTIFIER"
+    assert stream.value(1) == "bc"
+    assert stream.range(1) == (2, 2, 2, 4, 3, 5)
+    with pytest.raises(IndexError):
+        stream[2]
+
+
+def test_lex_errors(lark):
+    text = "{- comment\n-}\nf = #;\n\ng = 1;\n"
+    stream, errors = lex_string(lark, info, text)
+    assert [t.value for t in stream] == ["f", "=", "g", "=", "1", ";"]
+    assert stream[2]._range.line_start == 5
+    assert errors == [LarkParseError(info, 3, 5, 18, "f = #;\n    ^\n")]